@@ -0,0 +1,67 @@
+"""
+Compare filling in the ${arg} references of bot texts by re-parsing the text
+on every utterance (the former replace_args_in_string, applied by the bot step
+and again by the processor) and by rendering the ArgTemplate parsed when the
+flow is loaded, once per utterance.
+
+Usage:
+    python benchmarks/bench_arg_templates.py [--args 1 4 16] [--runs 20000]
+"""
+import argparse
+import logging
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from mica.tracker import Tracker  # noqa: E402
+from mica.utils import ArgTemplate, replace_args_in_string, arg_format, logger  # noqa: E402
+
+
+def reparse(input_str, flow_name, tracker):
+    """replace_args_in_string before templates were precompiled."""
+    pattern = re.compile(r'\$\{([^}]+)\}')
+
+    def replace_match(match):
+        arg_info = arg_format(match.group(1), flow_name)
+        value, exist = tracker.get_arg(arg_info["flow_name"], arg_info["arg_name"])
+        if not exist or value is None:
+            return ""
+        return str(value)
+
+    return pattern.sub(replace_match, input_str)
+
+
+def timed(fn, runs):
+    start = time.perf_counter()
+    for _ in range(runs):
+        fn()
+    return (time.perf_counter() - start) / runs
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--args", type=int, nargs="+", default=[1, 4, 16])
+    arg_parser.add_argument("--runs", type=int, default=20000)
+    args = arg_parser.parse_args()
+    logger.setLevel(logging.WARNING)
+
+    print(f"{'args':>5} {'re-parse x2 (us)':>17} {'template (us)':>14} {'cached (us)':>12}")
+    for count in args.args:
+        flow_args = {f"arg_{i}": f"value {i}" for i in range(count)}
+        tracker = Tracker.create("bench", args={"order": flow_args, "profile": {"name": "Alex"}, "__mapping__": {}})
+        text = "Hi ${profile.name}, " + ", ".join(f"${{arg_{i}}} is set" for i in range(count)) + "."
+        template = ArgTemplate(text, "order")
+        assert template.render(tracker) == reparse(reparse(text, "order", tracker), "order", tracker)
+
+        # the bot step and the processor both interpolated every utterance
+        before = timed(lambda: reparse(reparse(text, "order", tracker), "order", tracker), args.runs)
+        after = timed(lambda: template.render(tracker), args.runs)
+        cached = timed(lambda: replace_args_in_string(text, "order", tracker), args.runs)
+        print(f"{count:>5} {before * 1e6:>17.2f} {after * 1e6:>14.2f} {cached * 1e6:>12.2f}")
+
+
+if __name__ == '__main__':
+    main()
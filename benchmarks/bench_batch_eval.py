@@ -0,0 +1,88 @@
+"""
+Replay many recorded conversations against a bot in batch mode.
+
+Every conversation runs concurrently; the bot's LLM calls are collected by
+BatchModel into batch-API JSONL jobs, which the local backend sends to an
+offline fake LLM server. The same conversations are replayed with the
+interactive model, and the replies of both runs are compared.
+
+Usage:
+    python benchmarks/bench_batch_eval.py [--conversations 200] [--max-delay 0.2]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from mica import parser  # noqa: E402
+from mica.bot import Bot  # noqa: E402
+from mica.llm.fake_server import start_in_thread  # noqa: E402
+from mica.utils import read_yaml_file, logger, bot_info_logger, user_info_logger  # noqa: E402
+
+EXAMPLE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'examples', 'transfer_money'))
+
+CONVERSATIONS = [
+    ["I want to transfer money", "Send 50 dollars to Alice", "Yes"],
+    ["Can I send some money?", "100 to Bob please", "No, cancel it"],
+    ["Transfer 20 dollars", "To my friend Carol", "Yes, go ahead"],
+]
+
+
+async def replay(bot: Bot, conversations: int):
+    async def one(idx: int):
+        user_id = f"eval-{idx}"
+        replies = [await bot.handle_message(user_id, "/init")]
+        for message in CONVERSATIONS[idx % len(CONVERSATIONS)]:
+            replies.append(await bot.handle_message(user_id, message))
+        return replies
+
+    return await asyncio.gather(*[one(idx) for idx in range(conversations)])
+
+
+def evaluate(url: str, batch: dict, conversations: int):
+    chat = {"provider": "batch", "server": url, "batch": batch} if batch else {"provider": "custom", "server": url}
+    config = {"llm": {"chat": chat}}
+    data = parser.parse_agents(read_yaml_file(os.path.join(EXAMPLE_DIR, "agents.yml")))
+    bot = Bot.from_json(name="transfer_money", data=data,
+                        tool_code=open(os.path.join(EXAMPLE_DIR, "tools.py")).read(), config=config)
+    start = time.perf_counter()
+    # Bot.handle_message prints response times
+    with contextlib.redirect_stdout(io.StringIO()):
+        replies = asyncio.run(replay(bot, conversations))
+    elapsed = time.perf_counter() - start
+    router = next(agent.llm_model for agent in bot.agents.values() if hasattr(agent, "llm_model"))
+    return replies, elapsed, router.default
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--conversations", type=int, default=200)
+    arg_parser.add_argument("--max-delay", type=float, default=0.2)
+    args = arg_parser.parse_args()
+    for log in (logger, bot_info_logger, user_info_logger, logging.getLogger("httpx")):
+        log.setLevel(logging.WARNING)
+
+    server, url = start_in_thread({"chat": {"rules": [
+        {"match": "Your task is to select an agent", "target": "system", "response": "transfer_money"}]}})
+    try:
+        interactive, interactive_time, _ = evaluate(url, {}, args.conversations)
+        batched, batch_time, model = evaluate(url, {"backend": "local", "max_delay": args.max_delay},
+                                              args.conversations)
+    finally:
+        server.should_exit = True
+
+    print(f"conversations:        {args.conversations}")
+    print(f"interactive:          {interactive_time:.1f}s")
+    print(f"batch:                {batch_time:.1f}s, {model.requests_submitted} requests "
+          f"in {model.batches_submitted} batches")
+    print(f"same replies:         {interactive == batched}")
+
+
+if __name__ == '__main__':
+    main()
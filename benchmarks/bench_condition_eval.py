@@ -0,0 +1,79 @@
+"""
+Compare evaluating if/else if expression conditions by parsing them on every
+run (parse_and_evaluate) and through the closure compiled once at load time
+(compile_expression).
+
+Balanced and/or trees of comparisons and regex matches are generated with the
+given depths; both evaluators must agree on every expression.
+
+Usage:
+    python benchmarks/bench_condition_eval.py [--depths 1 3 5 7] [--runs 2000]
+"""
+import argparse
+import logging
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from mica.tracker import Tracker  # noqa: E402
+from mica.utils import parse_and_evaluate, compile_expression, logger  # noqa: E402
+
+LEAVES = [
+    "amount > 100",
+    "amount <= 5000",
+    "status == 'approved'",
+    "currency != \"EUR\"",
+    "account.balance >= 250.5",
+    "re.match('^[A-Z]{2}[0-9]+$', iban)",
+    "retries < 3",
+    "confirmed == True",
+]
+
+
+def generate(depth: int, rng: random.Random) -> str:
+    if depth == 0:
+        return rng.choice(LEAVES)
+    operator = rng.choice(["and", "or"])
+    return f"({generate(depth - 1, rng)} {operator} {generate(depth - 1, rng)})"
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--depths", type=int, nargs="+", default=[1, 3, 5, 7])
+    arg_parser.add_argument("--runs", type=int, default=2000)
+    args = arg_parser.parse_args()
+    # the parsing evaluator looks literals up as args and logs an error for each
+    logger.setLevel(logging.CRITICAL)
+
+    tracker = Tracker.create("bench", args={
+        "transfer": {"amount": 1200, "status": "approved", "currency": "USD", "iban": "DE4450", "retries": 1,
+                     "confirmed": True},
+        "account": {"balance": 300.0},
+        "__mapping__": {},
+    })
+    rng = random.Random(0)
+
+    print(f"{'depth':>6} {'leaves':>7} {'parse (us)':>11} {'compiled (us)':>14} {'speedup':>8}")
+    for depth in args.depths:
+        expression = generate(depth, rng)
+        evaluator = compile_expression(expression, "transfer")
+        assert evaluator(tracker) == parse_and_evaluate(expression, tracker, "transfer")
+
+        start = time.perf_counter()
+        for _ in range(args.runs):
+            parse_and_evaluate(expression, tracker, "transfer")
+        parsed = (time.perf_counter() - start) / args.runs
+
+        start = time.perf_counter()
+        for _ in range(args.runs):
+            evaluator(tracker)
+        compiled = (time.perf_counter() - start) / args.runs
+
+        print(f"{depth:>6} {2 ** depth:>7} {parsed * 1e6:>11.1f} {compiled * 1e6:>14.2f} {parsed / compiled:>7.0f}x")
+
+
+if __name__ == '__main__':
+    main()
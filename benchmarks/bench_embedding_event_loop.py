@@ -0,0 +1,109 @@
+"""
+Measure how long the event loop is stalled by query-time embedding calls.
+
+A local embedding server answers every request after a fixed delay. Several
+"conversations" embed a query concurrently while a heartbeat coroutine records
+how late each of its ticks fires. With the blocking `embed_query` the loop is
+frozen for the whole round trip; with `aembed_query` it keeps serving other work.
+
+Usage:
+    python benchmarks/bench_embedding_event_loop.py [--delay 0.2] [--queries 20]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from mica.llm.custom_embedding import CustomEmbedding  # noqa: E402
+
+TICK = 0.01
+
+
+def start_slow_server(delay: float):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            time.sleep(delay)
+            data = [{"index": i, "embedding": [0.1, 0.2, 0.3]} for i, _ in enumerate(body["input"])]
+            payload = json.dumps({"data": data}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    class Server(ThreadingHTTPServer):
+        request_queue_size = 128
+
+    server = Server(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def heartbeat(stop: asyncio.Event, lags: list):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + TICK
+        await asyncio.sleep(TICK)
+        lags.append(max(0.0, loop.time() - expected))
+
+
+async def run(embedding: CustomEmbedding, queries: int, use_async: bool):
+    # warm up the clients so one-off setup cost is not counted as a stall
+    embedding.embed_query("warm up")
+    await embedding.aembed_query("warm up")
+
+    stop = asyncio.Event()
+    lags = []
+    beat = asyncio.create_task(heartbeat(stop, lags))
+
+    async def one_query(i):
+        if use_async:
+            await embedding.aembed_query(f"query {i}")
+        else:
+            embedding.embed_query(f"query {i}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one_query(i) for i in range(queries)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await beat
+    await embedding.aclose()
+    return elapsed, lags
+
+
+def report(label, elapsed, lags):
+    total_stall = sum(lags)
+    print(f"{label:<22} wall={elapsed:6.3f}s  max_stall={max(lags, default=0):6.3f}s  "
+          f"total_stall={total_stall:6.3f}s  ticks={len(lags)}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--delay", type=float, default=0.2, help="server latency in seconds")
+    parser.add_argument("--queries", type=int, default=20, help="concurrent queries")
+    args = parser.parse_args()
+
+    server = start_slow_server(args.delay)
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        for label, use_async in (("sync embed_query", False), ("async aembed_query", True)):
+            embedding = CustomEmbedding(server=url, model="bench")
+            elapsed, lags = asyncio.run(run(embedding, args.queries, use_async))
+            embedding.close()
+            report(label, elapsed, lags)
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Measure how long a flow agent takes to find the step at the current position
+as the flow grows.
+
+A flow with a configurable number of blocks is generated; every block holds a
+label, bot steps and a nested if/else if/else chain. For every step position the
+step is resolved both by scanning the nested step lists (the former lookup,
+FlowAgent.get_step_from_path, kept here as scan_step) and through the compiled FlowProgram, and a full
+walk with find_next_step is timed.
+
+Usage:
+    python benchmarks/bench_flow_dispatch.py [--sizes 10 100 1000 5000]
+"""
+import argparse
+import copy
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from mica.agents.flow_agent import FlowAgent  # noqa: E402
+from mica.agents.steps.condition import If, ElseIf, Else  # noqa: E402
+from mica.llm.custom_model import CustomLLMModel  # noqa: E402
+from mica.tracker import FlowInfo  # noqa: E402
+from mica.utils import logger  # noqa: E402
+
+
+def generate_steps(blocks: int):
+    steps = []
+    for i in range(blocks):
+        steps += [
+            {"label": f"block_{i}"},
+            {"bot": f"Block {i}"},
+            {"if": f"choice == {i}",
+             "then": [{"bot": f"Chose {i}"},
+                      {"if": f"amount > {i}", "then": [{"bot": "Large"}], "else": [{"bot": "Small"}]}]},
+            {"else if": f"choice == {-i}", "then": [{"bot": f"Negative {i}"}]},
+            {"else": [{"bot": f"Other {i}"}]},
+        ]
+    return steps
+
+
+def scan_step(steps, previous_path, depth=0):
+    """FlowAgent.get_step_from_path before flows were compiled into a FlowProgram."""
+    all_steps = copy.copy(steps)
+    while depth < len(previous_path):
+        for step in all_steps:
+            if id(step) == previous_path[depth]:
+                depth += 1
+                # the last time
+                if depth == len(previous_path):
+                    return step
+                else:
+                    all_steps = step.then
+                break
+        else:
+            return None
+    return None
+
+
+def step_paths(steps, prefix):
+    for step in steps:
+        path = prefix + [id(step)]
+        yield path
+        if isinstance(step, (If, ElseIf, Else)):
+            yield from step_paths(step.then, path)
+
+
+def walk(agent: FlowAgent) -> int:
+    """Take every branch body, then continue: the number of dispatched steps."""
+    info = FlowInfo()
+    steps = agent.subflows[agent.main_flow_name].steps
+    info.push([agent.main_flow_name, id(steps[0])])
+    dispatched = 0
+    while not info.is_stack_empty():
+        step = agent.program.at(info.peek()).step
+        state = "Do" if isinstance(step, If) else "Finished"
+        agent.find_next_step(info, previous_step_state=state)
+        dispatched += 1
+    return dispatched
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 5000])
+    args = arg_parser.parse_args()
+    logger.setLevel(logging.WARNING)
+    # only stored by the agent, no request is sent
+    llm_model = CustomLLMModel(server="http://127.0.0.1:1")
+
+    print(f"{'blocks':>8} {'steps':>8} {'scan (us/step)':>16} {'program (us/step)':>18} {'walk (us/step)':>15}")
+    for blocks in args.sizes:
+        agent = FlowAgent.create(name="generated", steps=generate_steps(blocks), llm_model=llm_model)
+        steps = agent.subflows[agent.main_flow_name].steps
+        paths = list(step_paths(steps, [agent.main_flow_name]))
+
+        start = time.perf_counter()
+        for path in paths:
+            scan_step(steps, path[1:])
+        scan = (time.perf_counter() - start) / len(paths)
+
+        start = time.perf_counter()
+        for path in paths:
+            agent.program.at(path)
+        program = (time.perf_counter() - start) / len(paths)
+
+        start = time.perf_counter()
+        dispatched = walk(agent)
+        walked = (time.perf_counter() - start) / dispatched
+
+        print(f"{blocks:>8} {len(paths):>8} {scan * 1e6:>16.2f} {program * 1e6:>18.2f} {walked * 1e6:>15.2f}")
+
+
+if __name__ == '__main__':
+    main()
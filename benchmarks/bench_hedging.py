@@ -0,0 +1,88 @@
+"""
+Compare tail latency with and without hedged requests.
+
+Two fake LLM servers answer with the same lognormal latency; a share of the
+primary's answers is made very slow. Calls go either to the primary alone or
+through HedgedModel, which re-sends slow calls to the secondary.
+
+Usage:
+    python benchmarks/bench_hedging.py [--calls 300] [--concurrency 20]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from mica.llm.custom_model import CustomLLMModel  # noqa: E402
+from mica.llm.fake_server import start_in_thread  # noqa: E402
+from mica.llm.hedging import HedgedModel  # noqa: E402
+from mica.utils import logger  # noqa: E402
+
+PROMPT = [{"role": "user", "content": "hello"}]
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def run(model, calls: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            await model.generate_message(PROMPT)
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one() for _ in range(calls)))
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--slow-rate", type=float, default=0.05, help="share of very slow primary answers")
+    args = parser.parse_args()
+    logger.setLevel(logging.WARNING)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    latency = {"distribution": "lognormal", "mean": 0.1, "sigma": 0.3}
+    primary_server, primary_url = start_in_thread({"seed": 1, "chat": {"latency": latency}})
+    secondary_server, secondary_url = start_in_thread({"seed": 2, "chat": {"latency": latency}})
+    # a separate slow endpoint stands in for the primary's stragglers
+    slow_server, slow_url = start_in_thread({"chat": {"latency": {"distribution": "fixed", "value": 2.0}}})
+
+    class FlakyPrimary(CustomLLMModel):
+        """The primary endpoint, with a share of its calls answered by the slow endpoint."""
+
+        def __init__(self):
+            super().__init__(server=primary_url, model="primary")
+            self.slow = CustomLLMModel(server=slow_url, model="primary")
+            self.count = 0
+
+        async def generate_message(self, prompts, tracker=None, **kwargs):
+            self.count += 1
+            if self.count % int(1 / args.slow_rate) == 0:
+                return await self.slow.generate_message(prompts, tracker=tracker, **kwargs)
+            return await super().generate_message(prompts, tracker=tracker, **kwargs)
+
+    hedged = HedgedModel(FlakyPrimary(), CustomLLMModel(server=secondary_url, model="secondary"),
+                         percentile=0.9, initial_delay=0.3)
+    for label, model in (("primary only", FlakyPrimary()), ("hedged", hedged)):
+        latencies = asyncio.run(run(model, args.calls, args.concurrency))
+        print(f"{label:<14} p50={percentile(latencies, 0.5):.3f}s  p95={percentile(latencies, 0.95):.3f}s  "
+              f"p99={percentile(latencies, 0.99):.3f}s  max={max(latencies):.3f}s")
+    print(f"hedge stats: {hedged.stats}")
+    for server in (primary_server, secondary_server, slow_server):
+        server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Compare the prompt tokens of LLM agent calls with deduplicated and full history.
+
+Each example bot talks to an offline fake LLM server. Agent selection is pinned
+to one LLM agent, which then gets a scripted conversation. Generation calls are
+routed to a separate fake server, so its token count covers the LLM agent
+prompts only.
+
+Usage:
+    python benchmarks/bench_history_dedup.py [--turns 12]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import logging
+import os
+import sys
+
+import httpx
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from mica import parser  # noqa: E402
+from mica.bot import Bot  # noqa: E402
+from mica.llm.constants import HISTORY_MODES  # noqa: E402
+from mica.llm.fake_server import start_in_thread  # noqa: E402
+from mica.utils import read_yaml_file, logger, bot_info_logger, user_info_logger  # noqa: E402
+
+EXAMPLES_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'examples'))
+
+# example bot, agent file, tool file, LLM agent the conversation is pinned to
+EXAMPLES = [
+    ("customer_service", "agents.yml", "tool.py", "return"),
+    ("transfer_money", "agents.yml", "tools.py", "transfer_money"),
+    ("retail_banking", "agents.yml", "tools.py", "add_payee"),
+]
+
+USER_MESSAGES = [
+    "Hi there",
+    "I need some help with my account",
+    "The order number is 12345",
+    "It is for the blue jacket I bought last week",
+    "The amount is 120 dollars",
+    "Yes, that is correct",
+    "Can you also tell me how long it takes?",
+    "Okay, and what happens after that?",
+    "My name is Alex Smith",
+    "The email is alex@example.com",
+    "No, nothing else about that",
+    "Thanks, that is all",
+]
+
+
+async def converse(bot: Bot, turns: int):
+    await bot.handle_message("bench", "/init")
+    for i in range(turns):
+        await bot.handle_message("bench", USER_MESSAGES[i % len(USER_MESSAGES)])
+
+
+def generation_tokens(example: str, agent_file: str, tool_file: str, agent: str, mode: str, turns: int) -> int:
+    select_server, select_url = start_in_thread({"chat": {"rules": [
+        {"match": "select an agent", "target": "system", "response": agent}]}})
+    generation_server, generation_url = start_in_thread({"chat": {}})
+    config = {"llm": {"chat": {"provider": "custom", "server": select_url},
+                      "embedding": {"provider": "custom", "server": select_url},
+                      "profiles": {"generation": {"server": generation_url}},
+                      "routing": {"generation": "generation"},
+                      "history_mode": mode}}
+    data = parser.parse_agents(read_yaml_file(os.path.join(EXAMPLES_DIR, example, agent_file)))
+    tool_path = os.path.join(EXAMPLES_DIR, example, tool_file)
+    tool_code = open(tool_path).read() if os.path.exists(tool_path) else None
+    bot = Bot.from_json(name=example, data=data, tool_code=tool_code, config=config)
+    try:
+        # Bot.handle_message prints response times
+        with contextlib.redirect_stdout(io.StringIO()):
+            asyncio.run(converse(bot, turns))
+        return httpx.get(f"{generation_url}/stats").json()["prompt_tokens"]
+    finally:
+        select_server.should_exit = True
+        generation_server.should_exit = True
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--turns", type=int, default=12)
+    args = arg_parser.parse_args()
+    for log in (logger, bot_info_logger, user_info_logger, logging.getLogger("httpx")):
+        log.setLevel(logging.WARNING)
+
+    print(f"{'example':<22}{'agent':<18}" + "".join(f"{mode:>15}" for mode in HISTORY_MODES) + f"{'saved':>10}")
+    for example, agent_file, tool_file, agent in EXAMPLES:
+        tokens = {mode: generation_tokens(example, agent_file, tool_file, agent, mode, args.turns)
+                  for mode in HISTORY_MODES}
+        deduplicated, full = tokens[HISTORY_MODES[0]], tokens[HISTORY_MODES[1]]
+        saved = 1 - deduplicated / full if full else 0.0
+        print(f"{example:<22}{agent:<18}" + "".join(f"{tokens[mode]:>15}" for mode in HISTORY_MODES)
+              + f"{saved:>10.1%}")
+
+
+if __name__ == '__main__':
+    main()
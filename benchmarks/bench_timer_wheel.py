@@ -0,0 +1,103 @@
+"""
+Compare the DefaultExitAgent inactivity timeouts of many idle conversations
+driven by one polling task per conversation (the former monitor_user, waking
+up every second to check the latest event) and by the shared timer wheel,
+where every conversation holds one timer that its events re-arm.
+
+Reports the setup cost and memory of the idle conversations, the event loop
+CPU time they use per second while nobody talks, and the cost of re-arming and
+cancelling a timer. Setup runs under tracemalloc, so only compare its
+times with each other.
+
+Usage:
+    python benchmarks/bench_timer_wheel.py [--conversations 100000] [--idle 3]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from mica.timers import TimerWheel, InactivityTimer  # noqa: E402
+
+# far enough that nothing times out while measuring
+TIMEOUT = 3600
+
+
+async def polling(conversations, idle):
+    latest = [time.time()] * conversations
+
+    async def monitor_user(index):
+        while True:
+            await asyncio.sleep(1)
+            if time.time() - latest[index] > TIMEOUT:
+                break
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    tasks = [asyncio.create_task(monitor_user(i)) for i in range(conversations)]
+    # let every task reach its first sleep
+    await asyncio.sleep(0)
+    setup = time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    cpu = time.process_time()
+    await asyncio.sleep(idle)
+    cpu = (time.process_time() - cpu) / idle
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return setup, memory, cpu
+
+
+async def wheel(conversations, idle):
+    timer_wheel = TimerWheel()
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    timers = [InactivityTimer(TIMEOUT, lambda: None, wheel=timer_wheel) for _ in range(conversations)]
+    for timer in timers:
+        timer.rearm()
+    setup = time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    cpu = time.process_time()
+    await asyncio.sleep(idle)
+    cpu = (time.process_time() - cpu) / idle
+
+    # every event of a conversation re-arms its timer
+    start = time.perf_counter()
+    for timer in timers:
+        timer.rearm()
+    rearm = (time.perf_counter() - start) / conversations
+    start = time.perf_counter()
+    for timer in timers:
+        timer.cancel()
+    cancel = (time.perf_counter() - start) / conversations
+    assert len(timer_wheel) == 0
+    return setup, memory, cpu, rearm, cancel
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--conversations", type=int, default=100000)
+    arg_parser.add_argument("--idle", type=float, default=3, help="seconds to measure the idle CPU time")
+    args = arg_parser.parse_args()
+
+    poll_setup, poll_memory, poll_cpu = asyncio.run(polling(args.conversations, args.idle))
+    wheel_setup, wheel_memory, wheel_cpu, rearm, cancel = asyncio.run(wheel(args.conversations, args.idle))
+
+    print(f"{args.conversations} idle conversations")
+    print(f"{'':>10} {'setup (s)':>10} {'memory (MB)':>12} {'idle CPU (s/s)':>15}")
+    print(f"{'polling':>10} {poll_setup:>10.3f} {poll_memory / 2 ** 20:>12.1f} {poll_cpu:>15.3f}")
+    print(f"{'wheel':>10} {wheel_setup:>10.3f} {wheel_memory / 2 ** 20:>12.1f} {wheel_cpu:>15.3f}")
+    print(f"re-arm {rearm * 1e6:.2f} us, cancel {cancel * 1e6:.2f} us per timer")
+
+
+if __name__ == '__main__':
+    main()
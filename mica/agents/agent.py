@@ -25,6 +25,13 @@ class Agent(object):
     def contains_args(self):
         return None
 
+    def compile_prompts(self, agents: Dict[Text, "Agent"], tools: Optional[Any] = None):
+        """
+        Precompute the static parts of this agent's prompts once all agents and
+        tools of the bot are known. Called when the bot is loaded.
+        """
+        pass
+
 
 class Main(Agent):
     def __init__(self,
@@ -1,11 +1,11 @@
-import asyncio
 import json
 import threading
-import time
 from typing import Optional, Text, Dict, Any, List
 
 from mica.agents.llm_agent import LLMAgent
 from mica.event import BotUtter, Event
+from mica.llm.constants import CALL_FALLBACK
+from mica.llm.history import history_budget
 from mica.llm.openai_model import OpenAIModel
 from mica.tracker import Tracker
 from mica.utils import logger
@@ -54,7 +54,7 @@ class DefaultFallbackAgent(LLMAgent):
                               "\"I'm sorry, I didn't understand that. Can you please rephrase?\""},
                   {'role': 'user',
                    'content': f"Conversation: \n"
-                              f"{tracker.get_history_str()}\n"
+                              f"{tracker.get_history_str(history_budget(self.llm_model, CALL_FALLBACK))}\n"
                               f"Bot: "}]
         return prompt
 
@@ -65,7 +65,8 @@ class DefaultFallbackAgent(LLMAgent):
         prompt = self._generate_agent_prompt(tracker)
         logger.debug("Default fallback agent prompt: \n%s", json.dumps(prompt, indent=2, ensure_ascii=False))
         llm_result = await self.llm_model.generate_message(prompt, tracker=tracker,
-                                                           provider=self.name)
+                                                           provider=self.name,
+                                                           call_class=CALL_FALLBACK)
         is_end = True
         final_result = []
         for event in llm_result:
@@ -118,39 +119,30 @@ class DefaultExitAgent(LLMAgent):
         description = "This agent can generate a default exit response."
         return cls(name, description, config, prompt, args, uses, llm_model)
 
-    async def check_user_timeout(self, tracker: Tracker) -> bool:
-        current_time = time.time()
-        latest_event = tracker.events[-1]
+    async def on_user_timeout(self, tracker: Tracker):
+        """Called by the tracker's inactivity timer, `timeout` seconds after the latest event."""
         retry_count, _ = tracker.get_arg(self.name, RETRY_COUNT)
         if retry_count > self.retry:
-            return True
-        if current_time - latest_event.timestamp > self.timeout:
-            tracker.set_arg(self.name, RETRY_COUNT, retry_count+1)
-            if retry_count + 1 < self.retry:
-                try:
-                    tracker.update(BotUtter(self.retry_response))
-                    print(BotUtter(self.retry_response))
-                    output_channel = tracker.latest_message.metadata
-                    await output_channel.send_message(self.retry_response)
-                    # await state.client.send_message("您是否还有其他问题")
-                    return False
-                except ValueError as e:
-                    logger.error("Exit agent cannot output timeout message")
-            else:
-                tracker.update(BotUtter(self.exit_response))
-                print(BotUtter(self.exit_response))
-                return True
-        return False
-
-    async def monitor_user(self, tracker: Tracker):
-        while True:
-            await asyncio.sleep(1)
-            is_exit = await self.check_user_timeout(tracker)
-            if is_exit:
-                break
+            tracker.cancel_inactivity_timer(self.name)
+            return
+        tracker.set_arg(self.name, RETRY_COUNT, retry_count + 1)
+        if retry_count + 1 < self.retry:
+            try:
+                # the prompt is an event, so the timer is re-armed for the next retry
+                tracker.update(BotUtter(self.retry_response))
+                print(BotUtter(self.retry_response))
+                output_channel = tracker.latest_message.metadata
+                await output_channel.send_message(self.retry_response)
+            except ValueError as e:
+                logger.error("Exit agent cannot output timeout message")
+        else:
+            tracker.update(BotUtter(self.exit_response))
+            print(BotUtter(self.exit_response))
+            tracker.cancel_inactivity_timer(self.name)
 
     async def run(self, tracker: Tracker, is_tool=False, **kwargs):
         tracker.set_arg(self.name, '_retry_count', 0)
-        asyncio.create_task(self.monitor_user(tracker))
+        # one timer per conversation on the shared timer wheel, replaced on every run
+        tracker.set_inactivity_timer(self.name, self.timeout, lambda: self.on_user_timeout(tracker))
 
-        return True, []
\ No newline at end of file
+        return True, []
@@ -9,11 +9,24 @@ from mica.agents.llm_agent import LLMAgent
 from mica.agents.steps.bot import Bot
 from mica.agents.steps.step_loader import StepLoader
 from mica.agents.steps.user import User
+from mica.constants import TRACKER_META_ARGS
 from mica.event import FollowUpAgent, BotUtter, AgentFail, AgentComplete
+from mica.llm.constants import CALL_ROUTING, ROUTING_MAX_TOKENS
+from mica.llm.history import history_budget
 from mica.llm.openai_model import OpenAIModel
 from mica.model_config import ModelConfig
 from mica.tracker import Tracker
-from mica.utils import number_to_uppercase_letter, logger
+from mica.utils import number_to_uppercase_letter, logger, safe_json_loads
+
+# Candidate subsets whose agent list is cached per ensemble agent
+MAX_CACHED_AGENT_LISTS = 64
+
+# reply of the fused routing and KB answering call (structured output mode)
+ROUTING_SCHEMA = {"name": "select_agent",
+                  "schema": {"type": "object",
+                             "properties": {"agent": {"type": "string"}, "answer": {"type": "string"}},
+                             "required": ["agent"],
+                             "additionalProperties": False}}
 
 
 class EnsembleAgent(Agent):
@@ -36,6 +49,12 @@ class EnsembleAgent(Agent):
         self.fallback = fallback
         self.exit_agent = exit_agent
         self.mapping = mapping
+        # select the agent and answer from the knowledge base in one call
+        self.fuse_kb_answer = bool(((config or {}).get("llm") or {}).get("fuse_kb_answer"))
+        # static prompt parts, see compile_prompts
+        self._system_prefix: Optional[Text] = None
+        self._prompt_agents: Optional[Dict[Text, Any]] = None
+        self._agent_lists: Dict[Tuple[Text, ...], Text] = {}
         super().__init__(name, description)
 
     @classmethod
@@ -104,9 +123,13 @@ class EnsembleAgent(Agent):
         if tracker.events[-1] == tracker.latest_message:
             for agent in agents.values():
                 if isinstance(agent, KBAgent):
-                    _, [rag_result] = await agent.run(tracker)
+                    if self.fuse_kb_answer:
+                        # the answer is written by the agent selection call
+                        rag_result = await agent.retrieve(tracker)
+                    else:
+                        _, [rag_result] = await agent.run(tracker)
+                        rag_result = rag_result.metadata
                     logger.debug(f"This is the result of Rag agent: {rag_result}")
-                    rag_result = rag_result.metadata
                     break
 
         is_end = False
@@ -150,15 +173,59 @@ class EnsembleAgent(Agent):
                 return agent
         return None
 
+    def compile_prompts(self, agents: Dict[Text, Agent], tools: Optional[Any] = None):
+        system = "Your task is to select an agent to handle user requests. " \
+                 "You will be provided agent information and a conversation. " \
+                 "Choose an agent from the provided agents list and output its name. \n"
+
+        if self.fallback is not None:
+            fallback_info = "- If the user’s input exceeds the scope that all agents can respond to, " \
+                            "output: [Fallback].\n"
+            system += fallback_info
+
+        if self.exit_agent is not None:
+            exit_info = "- If the current conversation does not require the chatbot to continue responding, " \
+                        "output: [Exit].\n"
+            system += exit_info
+
+        system += "- If no more response is needed, output: None.\n"
+        self._system_prefix = system
+        self._prompt_agents = agents
+        self._agent_lists = {}
+        self._agent_list(agents, tuple(self.contains or []))
+
+    def _agent_list(self, agents: Dict[Text, Any], candidates: Tuple[Text, ...]) -> Text:
+        agent_info = self._agent_lists.get(candidates)
+        if agent_info is not None:
+            return agent_info
+        agent_info = ""
+        for name in candidates:
+            agent = agents.get(name)
+            if agent is None:
+                logger.error(f"There exists an agent {name} claimed in ensemble agent,"
+                             f" but not included in other places.")
+                continue
+            if isinstance(agent, KBAgent):
+                continue
+            agent_info += f"- {name}: {agent.description}\n"
+        if len(self._agent_lists) < MAX_CACHED_AGENT_LISTS:
+            self._agent_lists[candidates] = agent_info
+        return agent_info
+
     def _generate_agent_prompt(self,
                                tracker: Tracker,
                                agents: Dict[Text, Any],
                                candidates: Set[Text],
                                rag_result: Optional[Any] = None):
+        if self._system_prefix is None or agents is not self._prompt_agents:
+            self.compile_prompts(agents)
+        # candidates in declaration order, so the same set always gives the same prompt
+        ordered = tuple(name for name in self.contains if name in candidates)
+
         valid_states_info = ""
         for agent_name, args in tracker.args.items():
             if agent_name not in candidates \
-                    or agent_name in ["sender", "bot_name", "__mapping__", "main"]:
+                    or agent_name in TRACKER_META_ARGS or agent_name == "main":
                 continue
             if args is not None and len(args) > 0:
                 valid_states_info += f"{agent_name}: ("
@@ -166,36 +233,12 @@ class EnsembleAgent(Agent):
                     valid_states_info += f"{arg_name}: {arg_value}, "
                 valid_states_info += ")\n"
 
-        agent_info = ""
-        for idx, name in enumerate(candidates):
-            if isinstance(agents[name], KBAgent):
-                continue
-            agent = agents.get(name)
-            if agent is None:
-                logger.error(f"There exists an agent {name} claimed in ensemble agent,"
-                             f" but not included in other places.")
-                continue
-            agent_info += f"- {name}: {agent.description}\n"
-
-        system = "Your task is to select an agent to handle user requests. " \
-                 "You will be provided agent information and a conversation. " \
-                 "Choose an agent from the provided agents list and output its name. \n"
-
-        if self.fallback is not None:
-            fallback_info = "- If the user’s input exceeds the scope that all agents can respond to, " \
-                            "output: [Fallback].\n"
-            system += fallback_info
-
-        if self.exit_agent is not None:
-            exit_info = "- If the current conversation does not require the chatbot to continue responding, " \
-                        "output: [Exit].\n"
-            system += exit_info
-
-        system += "- If no more response is needed, output: None.\n" \
-                  "### INFORMATION:\n" \
-                  f"{valid_states_info}\n" \
-                  f"### AGENTS:\n" \
-                  f"{agent_info}"
+        # static instructions and agent list first, volatile content last
+        system = self._system_prefix + \
+                 f"### AGENTS:\n" \
+                 f"{self._agent_list(agents, ordered)}\n" \
+                 "### INFORMATION:\n" \
+                 f"{valid_states_info}"
 
         rag_info = "\nHere is some potentially relevant knowledge base content. " \
                    "If you think the user’s input is related to these items, " \
@@ -205,11 +248,18 @@ class EnsembleAgent(Agent):
         if rag_result is not None:
             for idx, item in enumerate(rag_result.get('matches')):
                 rag_info += f"{idx+1}. {item.get('content')}\n"
-            rag_info += f"### SUGGEST ANSWER: {rag_result.get('answer')}\n"
+            if self._fused(rag_result):
+                rag_info += "\n### OUTPUT:\n" \
+                            "Only output JSON: {\"agent\": \"<what you would output>\", \"answer\": \"<answer>\"}. " \
+                            "When you output [FAQ], answer the user’s question in \"answer\" using the knowledge " \
+                            "base content, in three sentences maximum. If it does not contain the answer, " \
+                            "set \"answer\" to: No answer.\n"
+            else:
+                rag_info += f"### SUGGEST ANSWER: {rag_result.get('answer')}\n"
             system += rag_info
 
         # conversation history
-        history = tracker.get_history_str()
+        history = tracker.get_history_str(history_budget(self.llm_model, CALL_ROUTING))
         user_content = f"### CONVERSATION:\n{history}\n"
 
         prompt = [{"role": "system", "content": system}, {"role": "user", "content": user_content}]
@@ -256,12 +306,25 @@ class EnsembleAgent(Agent):
 
         prompt = self._generate_agent_prompt(tracker, agents, agents_remain, rag_result)
         logger.debug("Ensemble agent prompt: \n%s", json.dumps(prompt, indent=2, ensure_ascii=False))
-        llm_result = await self.llm_model.generate_message(prompt, tracker)
+        if self._fused(rag_result):
+            # the reply carries the answer, so it is not limited to a name
+            llm_result = await self.llm_model.generate_message(prompt, tracker, call_class=CALL_ROUTING,
+                                                               response_schema=ROUTING_SCHEMA)
+        else:
+            llm_result = await self.llm_model.generate_message(prompt, tracker, call_class=CALL_ROUTING,
+                                                               max_tokens=ROUTING_MAX_TOKENS)
         # analyze llm result, generate agent result
         agent_result = []
         for event in llm_result:
             if isinstance(event, BotUtter):
+                fused_reply = self._fused(rag_result) and self._read_fused_reply(event, rag_result)
+                if not self._fused(rag_result):
+                    # the agent name is on the first non-blank line, anything after it is ignored
+                    event.text = next((line for line in event.text.splitlines() if line.strip()), "")
                 if "[FAQ]" in event.text:
+                    if self._fused(rag_result) and not fused_reply:
+                        # the reply is not the fused JSON, answer with the separate KB call
+                        await self._generate_kb_answer(tracker, agents, rag_result)
                     return rag_result.get('answer')
                 if "[Fallback]" in event.text:
                     return self.fallback
@@ -271,6 +334,34 @@ class EnsembleAgent(Agent):
                 return next_agent
         return None
 
+    def _fused(self, rag_result: Optional[Any]) -> bool:
+        return self.fuse_kb_answer and rag_result is not None
+
+    @staticmethod
+    def _read_fused_reply(event: BotUtter, rag_result: Dict[Text, Any]) -> bool:
+        """
+        Take the answer out of a fused reply and leave the selected agent in
+        `event.text`, which is then handled like a plain agent selection.
+        Returns False if the reply is not the fused JSON.
+        """
+        response = safe_json_loads(event.text)
+        if not isinstance(response, Dict) or not isinstance(response.get("agent"), Text):
+            return False
+        answer = response.get("answer")
+        if isinstance(answer, Text) and answer.strip() and answer.strip() != "No answer":
+            rag_result["answer"] = answer.strip()
+        event.text = response["agent"]
+        return True
+
+    @staticmethod
+    async def _generate_kb_answer(tracker: Tracker, agents: Dict[Text, Agent], rag_result: Dict[Text, Any]):
+        for agent in agents.values():
+            if isinstance(agent, KBAgent):
+                answer = await agent.generate(tracker, rag_result, rag_result["query"])
+                if answer:
+                    rag_result["answer"] = answer.text
+                return
+
     @staticmethod
     def unwrap_contains_args(contains: List[Any]) -> Union[Any, List[Text]]:
         contains_agents = []
@@ -4,6 +4,8 @@ from mica.agents.agent import Agent
 from mica.agents.steps.bot import Bot
 from mica.agents.steps.step_loader import StepLoader
 from mica.event import FollowUpAgent, BotUtter, AgentFail, AgentComplete
+from mica.llm.constants import CALL_FALLBACK
+from mica.llm.history import history_budget
 from mica.llm.openai_model import OpenAIModel
 from mica.model_config import ModelConfig
 from mica.tracker import Tracker
@@ -50,7 +52,7 @@ class ExceptionAgent(Agent):
                  f"\n\n## Previous task information:\n" \
                  f"{previous_agent.name}: {previous_agent.description}"
         user = f"## Conversation history:\n" \
-               f"{tracker.get_history_str()}\n" \
+               f"{tracker.get_history_str(history_budget(self.llm_model, CALL_FALLBACK))}\n" \
                f"Bot: "
         prompt = [
             {
@@ -61,7 +63,7 @@ class ExceptionAgent(Agent):
                 "content": user
             }]
         print(prompt)
-        llm_result = await self.llm_model.generate_message(prompt, tracker)
+        llm_result = await self.llm_model.generate_message(prompt, tracker, call_class=CALL_FALLBACK)
 
         for event in llm_result:
             if isinstance(event, BotUtter):
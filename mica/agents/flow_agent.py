@@ -1,4 +1,3 @@
-import copy
 import json
 import traceback
 from typing import Optional, Dict, Text, Any, List, Union, Tuple
@@ -6,6 +5,7 @@ from typing import Optional, Dict, Text, Any, List, Union, Tuple
 from mica import event
 from mica.agents.agent import Agent
 from mica.agents.default import DefaultFallbackAgent
+from mica.agents.flow_program import FlowProgram
 from mica.agents.steps.call import Call
 from mica.agents.steps.condition import If, ElseIf, Else
 from mica.agents.steps.label import Label
@@ -15,12 +15,17 @@ from mica.agents.steps.subflow import Subflow
 from mica.agents.steps.termination import Return
 from mica.agents.steps.user import User
 from mica.agents.llm_agent import LLMAgent
-from mica.constants import MAIN_FLOW
+from mica.constants import MAIN_FLOW, TRACKER_META_ARGS
 from mica.event import CurrentAgent, BotUtter, AgentFail, AgentComplete, SetSlot, UserInput, Event
+from mica.llm.constants import CALL_EXTRACTION
+from mica.llm.history import history_budget
+from mica.llm.openai_compat import envelope_schema
 from mica.llm.openai_model import OpenAIModel
 from mica.tracker import Tracker, FlowInfo
 from mica.utils import logger, safe_json_loads
 
+EXTRACTION_SCHEMA_NAME = "extract"
+
 
 class NameRepeatError(Exception):
     pass
@@ -41,8 +46,19 @@ class FlowAgent(Agent):
         self.subflows = subflows
         self.args = args
         self.labels = self._find_all_labels(subflows)
+        self._link_claim_branches(subflows)
+        # flat instruction array with precomputed jump targets, see FlowProgram
+        self.program = FlowProgram(subflows)
         self.main_flow_name = main_flow_name
         self.fallback = fallback
+        # used when the model enforces the extraction envelope (structured output mode)
+        self.response_schema = envelope_schema(EXTRACTION_SCHEMA_NAME, args, with_bot=False)
+        # decide the pending `the user claims` conditions in the extraction call
+        self.fuse_conditions = bool(((config or {}).get("llm") or {}).get("fuse_conditions"))
+        # static system prompt of the extraction call, see compile_prompts
+        self._system_prompt: Optional[Text] = None
+        self._system_prompt_agents: Optional[Dict[Text, Agent]] = None
+        self._extracts_args = False
         super().__init__(name, description)
 
     @classmethod
@@ -72,11 +88,14 @@ class FlowAgent(Agent):
                server: Optional[Any] = None,
                headers: Optional[Any] = None,
                fallback: Optional[Any] = None,
+               claim_matcher: Optional[Any] = None,
                **kwargs):
 
-        # Delete the type key to avoid creating an incorrect subflow
+        # Delete the type key and the bot's shared embedding model to avoid creating incorrect subflows
         kwargs.pop("type", None)
-        steps, main_flow_name = cls.from_dict(steps, config=config, root_agent_name=name, llm_model=llm_model, subflows=kwargs)
+        kwargs.pop("embeddings", None)
+        steps, main_flow_name = cls.from_dict(steps, config=config, root_agent_name=name, llm_model=llm_model,
+                                              claim_matcher=claim_matcher, subflows=kwargs)
         return cls(name=name,
                    config=config,
                    description=description,
@@ -116,6 +135,34 @@ class FlowAgent(Agent):
 
         return labels
 
+    @staticmethod
+    def _link_claim_branches(subflows: Dict):
+        """
+        find the if/else if chains with several `the user claims` branches, which
+        are then classified in one call (see condition.classify_claim_branches)
+        """
+
+        def link(chain):
+            branches = [step for step in chain if "the user claims" in step.statement]
+            if len(branches) > 1:
+                for step in branches:
+                    step.claim_branches = branches
+
+        def recur_search(steps):
+            chain = []
+            for s in steps:
+                if isinstance(s, If) or not isinstance(s, ElseIf):
+                    link(chain)
+                    chain = []
+                if isinstance(s, (If, ElseIf)):
+                    chain.append(s)
+                if isinstance(s, (If, ElseIf, Else)):
+                    recur_search(s.then)
+            link(chain)
+
+        for subflow in subflows.values():
+            recur_search(subflow.steps)
+
     def __repr__(self):
         description = self.description.replace('\n', ' ')
         return f"Flow_agent(name={self.name}, description={description}, fallback={self.fallback})"
@@ -153,8 +200,8 @@ class FlowAgent(Agent):
             exec_path = info.peek()
 
         # find the step that this time will execute by path and then run()
-        curr_subflow = exec_path[0]
-        curr_step = self.get_step_from_path(self.subflows[curr_subflow].steps, exec_path[1:])
+        instruction = self.program.at(exec_path)
+        curr_step = instruction.step if instruction is not None else None
         logger.debug("Current step in flow agent %s: %s", self.name, curr_step)
         state, result = await curr_step.run(tracker, info, agents=agents, **kwargs)
 
@@ -170,24 +217,6 @@ class FlowAgent(Agent):
         logger.debug(f"Flow agent: [{self.name}] running results: {result}")
         return is_end, result
 
-    @staticmethod
-    def get_step_from_path(steps, previous_path, depth=0):
-        all_steps = copy.copy(steps)
-        while depth < len(previous_path):
-            for step in all_steps:
-                if id(step) == previous_path[depth]:
-                    depth += 1
-                    # the last time
-                    if depth == len(previous_path):
-                        return step
-                    else:
-                        all_steps = step.then
-                    break
-            else:
-                logger.error("Didn't find this step in given path")
-                return None
-        return None
-
     def find_next_step(self,
                        flow_info: FlowInfo,
                        previous_step_state=None) -> Union[None, Event, bool]:
@@ -198,47 +227,42 @@ class FlowAgent(Agent):
         next_step_path = None
         while next_step is None and not flow_info.is_stack_empty():
             previous_path = flow_info.pop()
-            depth = 1
-            all_steps = self.subflows[previous_path[0]].steps
-            while depth < len(previous_path):
-                for idx, step in enumerate(all_steps):
-                    if id(step) == previous_path[depth]:
-                        depth += 1
-                        # the last time
-                        if depth == len(previous_path):
-                            # decide by previous type
-                            if isinstance(step, (If, ElseIf, Else)):
-                                if previous_step_state == "Do":
-                                    next_step = step.then[0]
-                                    next_step_path = previous_path + [id(next_step)]
-                                    flow_info.push(previous_path)
-                                    break
-                            if isinstance(step, Next) and previous_step_state == "Do":
-                                next_step = step.name
-                                next_step_path = self.labels[step.name]
-                                flow_info.clear()
-                                break
-                            if isinstance(step, Call) and previous_step_state == "Await":
-                                next_step = step
-                                next_step_path = previous_path
-                                break
-                            if isinstance(step, Call) and previous_step_state == "Failed":
-                                break
-                            if isinstance(step, Return):
-                                return True
-
-                            for next_id in range(idx + 1, len(all_steps)):
-                                if isinstance(step, (If, ElseIf)) and previous_step_state == "Finished":
-                                    if isinstance(all_steps[next_id], (ElseIf, Else)):
-                                        continue
-                                next_step = all_steps[next_id]
-                                next_step_path = previous_path[:-1] + [id(next_step)]
-                                break
-                            if idx == len(all_steps) - 1:
-                                previous_step_state = "Finished"
-                        else:
-                            all_steps = step.then
-                        break
+            instruction = self.program.at(previous_path)
+            if instruction is None:
+                logger.error("Didn't find this step in given path")
+                continue
+            step = instruction.step
+            # decide by previous type
+            if isinstance(step, (If, ElseIf, Else)) and previous_step_state == "Do":
+                next_step = step.then[0]
+                next_step_path = previous_path + [id(next_step)]
+                flow_info.push(previous_path)
+                break
+            if isinstance(step, Next) and previous_step_state == "Do":
+                next_step = step.name
+                next_step_path = self.labels[step.name]
+                flow_info.clear()
+                break
+            if isinstance(step, Call) and previous_step_state == "Await":
+                next_step = step
+                next_step_path = previous_path
+                break
+            if isinstance(step, Call) and previous_step_state == "Failed":
+                continue
+            if isinstance(step, Return):
+                return True
+
+            # after a branch body, the else if/else of the same chain are skipped
+            if isinstance(step, (If, ElseIf)) and previous_step_state == "Finished":
+                following = instruction.next_after_branch
+            else:
+                following = instruction.next
+            if following is None:
+                # the enclosing branch body is finished
+                previous_step_state = "Finished"
+                continue
+            next_step = self.program.instructions[following].step
+            next_step_path = previous_path[:-1] + [id(next_step)]
 
         if next_step is not None:
             flow_info.push(next_step_path)
@@ -251,11 +275,21 @@ class FlowAgent(Agent):
                                tracker: Tracker,
                                agents: Optional[Dict[Text, Agent]] = None
                                ) -> Union[None, List[Event]]:
-        prompt = self._generate_prompt(tracker, agents)
+        conditions = []
+        if self.fuse_conditions:
+            info = tracker.get_or_create_flow_agent(self.name)
+            conditions = [(f"c{idx + 1}", step) for idx, step in enumerate(self._pending_conditions(info))]
+        prompt = self._generate_prompt(tracker, agents, conditions)
         logger.debug("Flow agent prompt: %s", json.dumps(prompt, indent=2, ensure_ascii=False))
 
+        response_schema = self.response_schema
+        if conditions:
+            response_schema = envelope_schema(EXTRACTION_SCHEMA_NAME, self.args, with_bot=False,
+                                              conditions=[key for key, _ in conditions])
         llm_result = await self.llm_model.generate_message(prompts=prompt,
-                                                           tracker=tracker)
+                                                           tracker=tracker,
+                                                           response_schema=response_schema,
+                                                           call_class=CALL_EXTRACTION)
         for event in llm_result:
             if isinstance(event, AgentFail):
                 logger.info(f"Flow agent: [{self.name}] recognize user's intent as quit.")
@@ -268,14 +302,55 @@ class FlowAgent(Agent):
                 if data is not None:
                     for name, value in data.items():
                         tracker.set_arg(self.name, name, value)
+                if conditions:
+                    self._store_condition_decisions(tracker, conditions, response.get("conditions"))
                 if status is not None and status == "quit":
                     return [AgentFail(provider=self.name)]
         return
 
-    def _generate_prompt(self,
-                         tracker: Tracker,
-                         agents: Optional[Dict[Text, Agent]] = None
-                         ) -> List[Dict[Any, Any]]:
+    def _pending_conditions(self, info: FlowInfo) -> List[Union[If, ElseIf]]:
+        """
+        The `the user claims` conditions of the if/else if chain at the current
+        step, which are checked next against the latest user message.
+        """
+        if info.is_stack_empty():
+            steps = self.subflows[self.main_flow_name].steps
+            position = self.program.index.get(id(steps[1] if isinstance(steps[0], User) else steps[0]))
+        else:
+            position = self.program.index.get(info.peek()[-1])
+
+        pending = []
+        first = position
+        while position is not None:
+            instruction = self.program.instructions[position]
+            if not isinstance(instruction.step, (If, ElseIf)) or (isinstance(instruction.step, If) and
+                                                                  position != first):
+                break
+            if "the user claims" in instruction.step.statement:
+                pending.append(instruction.step)
+            position = instruction.next
+        return pending
+
+    def _store_condition_decisions(self, tracker: Tracker, conditions: List[Tuple[Text, Any]], results: Any):
+        if not isinstance(results, Dict):
+            return
+        decisions = {}
+        for key, step in conditions:
+            value = results.get(key)
+            if isinstance(value, bool):
+                decisions[id(step)] = value
+            elif isinstance(value, Text) and value.lower() in ("true", "false"):
+                decisions[id(step)] = value.lower() == "true"
+        logger.debug(f"Flow agent: [{self.name}] decided {len(decisions)} of {len(conditions)} conditions "
+                     f"in the extraction call")
+        tracker.get_or_create_flow_agent(self.name).set_condition_decisions(tracker.latest_message, decisions)
+
+    def compile_prompts(self, agents: Dict[Text, Agent], tools: Optional[Any] = None):
+        self._system_prompt = self._build_system_prompt(agents)
+        self._system_prompt_agents = agents
+        self._extracts_args = self._contains_user_node() and self.args is not None and len(self.args) > 0
+
+    def _build_system_prompt(self, agents: Dict[Text, Agent]) -> Text:
         related_agents = [self.name]
         related_agents += self._all_related_agent()
 
@@ -301,23 +376,43 @@ class FlowAgent(Agent):
             args = ", ".join(self.args)
             sys_content += f"- If the user mentions the following data in the conversation: {args}, " \
                            f"extract them. Example: {{\"data\": {{\"{self.args[0]}\": xxx, ...}}}}\n"
+        sys_content += "- Otherwise, output: {}"
+        return sys_content
 
+    def _generate_prompt(self,
+                         tracker: Tracker,
+                         agents: Optional[Dict[Text, Agent]] = None,
+                         conditions: Optional[List[Tuple[Text, Any]]] = None
+                         ) -> List[Dict[Any, Any]]:
+        # the system prompt is static; the current information and history follow it
+        if self._system_prompt is None or agents is not self._system_prompt_agents:
+            self.compile_prompts(agents)
+
+        user_content = ""
+        if self._extracts_args:
             valid_states_info = ""
             for agent_name, args in tracker.args.items():
-                if agent_name in ["sender", "bot_name", "__mapping__"]:
+                if agent_name in TRACKER_META_ARGS:
                     continue
                 if args is not None and len(args) > 0:
                     valid_states_info += f"{agent_name}: ("
                     for arg_name, arg_value in args.items():
                         valid_states_info += f"{arg_name}: {arg_value}, "
                     valid_states_info += ")\n"
-            sys_content += f"Current information: {valid_states_info}\n"
-        sys_content += "- Otherwise, output: {}"
-
-        user_content = f"{tracker.get_history_str()}\n"
+            user_content += f"Current information: {valid_states_info}\n"
+
+        user_content += f"{tracker.get_history_str(history_budget(self.llm_model, CALL_EXTRACTION))}\n"
+        if conditions:
+            user_content += f"## CONDITIONS\n" \
+                            f"Also decide for each condition below whether the latest user message " \
+                            f"\"{tracker.latest_message.text}\" has the same meaning as any of its target sentences, " \
+                            f"and add the results to the output. " \
+                            f"Example: {{\"conditions\": {{\"c1\": true, \"c2\": false}}}}\n"
+            for key, step in conditions:
+                user_content += f"- {key}: {json.dumps(step._extract_input_examples(), ensure_ascii=False)}\n"
         prompt = [{
             "role": "system",
-            "content": sys_content}, {
+            "content": self._system_prompt}, {
             "role": "user",
             "content": user_content
         }]
@@ -0,0 +1,65 @@
+from dataclasses import dataclass
+from typing import Optional, Dict, Text, Any, List
+
+from mica.agents.steps.condition import If, ElseIf, Else
+
+
+@dataclass
+class Instruction:
+    """One step of a flow with its precomputed jump targets."""
+    step: Any
+    # position as kept in FlowInfo.runtime_stack: [subflow name, id(step), id(nested step), ...]
+    path: List
+    # first step of the branch body (if/else if/else)
+    then: Optional[int] = None
+    # next step of the same list
+    next: Optional[int] = None
+    # next step of the same list that is not an else if/else, taken after a branch body ran
+    next_after_branch: Optional[int] = None
+
+
+class FlowProgram:
+    """
+    The subflows of a flow agent compiled into one flat instruction array.
+
+    Steps are laid out in depth-first order and every instruction carries the
+    indices of the instructions it can continue with, so resolving the current
+    position and the next step takes constant time instead of scanning the nested
+    step lists. FlowInfo keeps its path frames; the last id of a frame acts as
+    the program counter and is resolved through `index`.
+    """
+
+    def __init__(self, subflows: Dict[Text, Any]):
+        self.instructions: List[Instruction] = []
+        # id(step) -> position in instructions
+        self.index: Dict[int, int] = {}
+        for name, subflow in subflows.items():
+            self._compile(subflow.steps, [name])
+
+    def _compile(self, steps: List[Any], prefix: List) -> Optional[int]:
+        positions = []
+        for step in steps:
+            position = len(self.instructions)
+            positions.append(position)
+            path = prefix + [id(step)]
+            self.instructions.append(Instruction(step, path))
+            self.index[id(step)] = position
+            if isinstance(step, (If, ElseIf, Else)):
+                self.instructions[position].then = self._compile(step.then, path)
+
+        following = None
+        for idx in range(len(positions) - 1, -1, -1):
+            instruction = self.instructions[positions[idx]]
+            instruction.next = positions[idx + 1] if idx + 1 < len(positions) else None
+            instruction.next_after_branch = following
+            if not isinstance(instruction.step, (ElseIf, Else)):
+                following = positions[idx]
+        return positions[0] if positions else None
+
+    def at(self, path: List) -> Optional[Instruction]:
+        """The instruction of a FlowInfo path frame."""
+        position = self.index.get(path[-1]) if len(path) > 1 else None
+        return self.instructions[position] if position is not None else None
+
+    def __len__(self):
+        return len(self.instructions)
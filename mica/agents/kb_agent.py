@@ -12,6 +12,9 @@ from langchain_text_splitters import RecursiveCharacterTextSplitter
 
 from mica.agents.agent import Agent
 from mica.event import AgentComplete
+from mica.llm.constants import CALL_KB_ANSWER
+from mica.llm.embedding_memo import embed_user_message
+from mica.llm.embedding_pipeline import EmbeddingPipeline
 from mica.llm.openai_model import OpenAIModel
 from mica.llm.model_factory import ModelFactory
 from mica.tracker import Tracker
@@ -29,6 +32,7 @@ class KBAgent(Agent):
                  top_k: int = 3,
                  chunk_size: int = 1000,
                  chunk_overlap: int = 200,
+                 embeddings: Optional[Any] = None,
                  **kwargs
                  ):
         self.llm_model = llm_model or OpenAIModel.create(config)
@@ -53,7 +57,9 @@ class KBAgent(Agent):
             # Default to None, will use default OpenAI embeddings
             embedding_config = None
         
-        self.embeddings = ModelFactory.create_embedding(embedding_config)
+        # the bot's embedding model when `llm.embedding` is configured, shared with the claim fast path
+        self.embeddings = embeddings or ModelFactory.create_embedding(embedding_config)
+        self.indexer = EmbeddingPipeline.create(self.embeddings, embedding_config, cache_name=name)
         self.text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=chunk_size,
             chunk_overlap=chunk_overlap
@@ -71,6 +77,7 @@ class KBAgent(Agent):
                web: Optional[List] = None,
                sources: Optional[List] = None,
                llm_model: Optional[Any] = None,
+               embeddings: Optional[Any] = None,
                **kwargs
                ):
         if kwargs.get("server") and kwargs.get("headers"):
@@ -88,7 +95,8 @@ class KBAgent(Agent):
                    description=description,
                    config=config,
                    knowledge_base=knowledge_base,
-                   llm_model=llm_model)
+                   llm_model=llm_model,
+                   embeddings=embeddings)
 
     def prepare(
             self,
@@ -145,8 +153,12 @@ class KBAgent(Agent):
         # Split documents into chunks
         if documents:
             texts = self.text_splitter.split_documents(documents)
-            # Create vector store
-            self.vector_store = FAISS.from_documents(texts, self.embeddings)
+            # Embed the chunks in bulk, then build the vector store from the vectors
+            contents = [text.page_content for text in texts]
+            vectors = self.indexer.embed(contents)
+            self.vector_store = FAISS.from_embeddings(list(zip(contents, vectors)),
+                                                      self.embeddings,
+                                                      metadatas=[text.metadata for text in texts])
             logger.debug(f"Indexed {len(texts)} text chunks from {len(documents)} documents")
 
     # async def run_v2(self, tracker: Tracker, **kwargs) -> AgentResult:
@@ -203,13 +215,35 @@ class KBAgent(Agent):
             None otherwise
         """
         logger.debug(f"KB agent: [{self.name}] is running")
+        metadata = await self.retrieve(tracker)
+        if metadata is None:
+            return True, [AgentComplete(provider=self.name, metadata=None)]
+        answer = await self.generate(tracker, metadata, metadata["query"])
+        if answer:
+            metadata['answer'] = answer.text
+            logger.info(f"[{self.name}]: bot: {answer.text}")
+        return True, [AgentComplete(provider=self.name, metadata=metadata)]
+
+    async def retrieve(self, tracker: Tracker) -> Optional[Dict[Text, Any]]:
+        """
+        Search the knowledge base for the latest user message, without generating an answer.
+
+        Returns:
+            Dict with the matches above the similarity threshold, None if there are none
+        """
         if not self.vector_store:
             raise ValueError("Knowledge base not prepared. Call prepare() first.")
 
         user_input = tracker.latest_message.text
-        # Search for similar documents
-        docs_and_scores = self.vector_store.similarity_search_with_score(
-            user_input,
+        # Embed the query asynchronously, then search by vector. Searching by text would
+        # call the blocking embed_query() inside the event loop. The embedding is shared
+        # with the other components of the turn.
+        query_embedding = await embed_user_message(tracker, self.embeddings, user_input)
+        if not query_embedding:
+            logger.error(f"[{self.name}]: failed to embed the user query")
+            return None
+        docs_and_scores = self.vector_store.similarity_search_with_score_by_vector(
+            query_embedding,
             k=self.top_k
         )
 
@@ -224,24 +258,20 @@ class KBAgent(Agent):
                 })
 
         if matches:
-            metadata = {
+            return {
                 "matches": matches,
                 "query": user_input,
                 "total_matches": len(matches)
             }
-            answer = await self.generate(tracker, metadata, user_input)
-            if answer:
-                metadata['answer'] = answer.text
-                logger.info(f"[{self.name}]: bot: {answer.text}")
-            return True, [AgentComplete(provider=self.name, metadata=metadata)]
         logger.info(f"[{self.name}]: didn't find any answer")
-        return True, [AgentComplete(provider=self.name, metadata=None)]
+        return None
 
     async def generate(self, tracker, context, query):
         prompt = self._generate_prompt(context, query)
         answer = await self.llm_model.generate_message(prompt,
                                                        tracker=tracker,
-                                                       provider=self.name)
+                                                       provider=self.name,
+                                                       call_class=CALL_KB_ANSWER)
         if len(answer) == 1 and answer[0].text != 'No answer':
             return answer[0]
         return None
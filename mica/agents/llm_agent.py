@@ -6,11 +6,18 @@ import requests
 
 from mica.agents.agent import Agent
 from mica.agents.steps.step_loader import StepLoader
+from mica.constants import TRACKER_META_ARGS
 from mica.event import BotUtter, SetSlot, AgentFail, AgentComplete, FunctionCall
 from mica.exec_tool import SafePythonExecutor
+from mica.llm.constants import CALL_GENERATION, HISTORY_DEDUPLICATED, HISTORY_MODES
+from mica.llm.history import history_budget, shared_history_budget
+from mica.llm.openai_compat import envelope_schema
 from mica.llm.openai_model import OpenAIModel
 from mica.tracker import Tracker
-from mica.utils import arg_format, logger, safe_json_loads
+from mica.turn_budget import spend_turn_budget, TURN_TOOL_CALLS
+from mica.utils import arg_format, logger, safe_json_loads, extract_json_object
+
+RESPONSE_SCHEMA_NAME = "reply"
 
 
 class LLMAgent(Agent):
@@ -30,6 +37,14 @@ class LLMAgent(Agent):
         self.args = args
         self.uses = uses
         self.steps = steps or []
+        # used when the model enforces the reply envelope (structured output mode)
+        self.response_schema = envelope_schema(RESPONSE_SCHEMA_NAME, args)
+        self.history_mode = self._history_mode(config)
+        # static prompt parts, see compile_prompts
+        self._other_agents: Optional[List[Text]] = None
+        self._system_prefixes: Dict[Optional[Text], Text] = {}
+        self._functions: Optional[List] = None
+        self._functions_tools: Optional[Any] = None
         super().__init__(name, description)
 
     @classmethod
@@ -48,6 +63,15 @@ class LLMAgent(Agent):
             steps = [StepLoader.create(step, root_agent_name=name) for step in steps]
         return cls(name, description, config, prompt, args, uses, llm_model, steps)
 
+    @staticmethod
+    def _history_mode(config: Optional[Dict[Text, Any]] = None) -> Text:
+        llm_config = (config or {}).get("llm") or {}
+        mode = llm_config.get("history_mode") or HISTORY_DEDUPLICATED
+        if mode not in HISTORY_MODES:
+            logger.warning(f"Unknown llm.history_mode '{mode}', expected one of {', '.join(HISTORY_MODES)}")
+            return HISTORY_DEDUPLICATED
+        return mode
+
     def __repr__(self):
         description = self.description.replace('\n', ' ')
         return f"LLM_agent(name={self.name}, description={description})"
@@ -77,7 +101,9 @@ class LLMAgent(Agent):
         llm_result.extend(await self.llm_model.generate_message(prompt,
                                                                 functions=functions,
                                                                 tracker=tracker,
-                                                                provider=self.name))
+                                                                provider=self.name,
+                                                                response_schema=self.response_schema,
+                                                                call_class=CALL_GENERATION))
         is_end = True
         final_result = []
 
@@ -90,6 +116,7 @@ class LLMAgent(Agent):
                     logger.error(msg)
                     raise ValueError(msg)
 
+                spend_turn_budget(tracker, TURN_TOOL_CALLS)
                 tool_rst = tools.execute_function(event.function_name, **event.args)
                 logger.info(f"[{self.name}]: call: {event.function_name}, get result: {tool_rst}")
                 if tool_rst['status'] == 'error':
@@ -122,41 +149,16 @@ class LLMAgent(Agent):
                 is_end = False
             if isinstance(event, BotUtter):
                 try:
-                    try:
-                        response = json.loads(event.text)
-                    except json.JSONDecodeError:
-                        # Only look for JSON objects starting with '{'
-                        json_starts = [m.start() for m in re.finditer(r'\{', event.text)]
-                        
-                        for start in json_starts:
-                            stack = []
-                            found_end = False
-                            
-                            for i, char in enumerate(event.text[start:], start):
-                                if char == '{':
-                                    stack.append(char)
-                                elif char == '}':
-                                    stack.pop()
-                                    if not stack:  # Found matching closing bracket
-                                        json_candidate = event.text[start:i+1]
-                                        try:
-                                            response = json.loads(json_candidate)
-                                            found_end = True
-                                            break
-                                        except json.JSONDecodeError:
-                                            continue  # Try next possible ending position
-                            
-                            if found_end:
-                                break
-                        else:  # No valid JSON found
-                            raise json.JSONDecodeError("No valid JSON object found", event.text, 0)
-                            
-                except json.JSONDecodeError as e:
-                    logger.debug(f"JSON extraction failed: {e}. Get response from llm: {event.text}")
+                    response = json.loads(event.text)
+                except json.JSONDecodeError:
+                    response = extract_json_object(event.text)
+                if not isinstance(response, Dict):
+                    logger.debug(f"JSON extraction failed. Get response from llm: {event.text}")
                     response = {
                         "bot": event.text
                     }
-                if len(llm_result) == 1:
+                in_conv_history = len(llm_result) == 1
+                if in_conv_history:
                     tracker.set_conv_history(self.name, {"role": "assistant", "content": event.text})
                 data = response.get("data")
                 bot_reply = response.get("bot")
@@ -173,7 +175,10 @@ class LLMAgent(Agent):
                     event = AgentFail(provider=self.name)
                     if bot_reply is not None:
                         logger.info(f"[{self.name}]: bot: {bot_reply}")
-                        final_result.append(BotUtter(bot_reply, metadata=self.name))
+                        reply = BotUtter(bot_reply, metadata=self.name)
+                        if in_conv_history:
+                            tracker.mark_conv_event(self.name, reply)
+                        final_result.append(reply)
                 elif status == "complete":
                     is_end = False
                     logger.info(f"[{self.name}]: complete")
@@ -185,6 +190,8 @@ class LLMAgent(Agent):
                         final_result.append(BotUtter(bot_reply, metadata=self.name))
                 else:
                     event = BotUtter(bot_reply, metadata=self.name)
+                    if in_conv_history:
+                        tracker.mark_conv_event(self.name, event)
                     logger.info(f"[{self.name}]: bot: {bot_reply}")
             final_result.append(event)
 
@@ -328,32 +335,30 @@ class LLMAgent(Agent):
     def contains_args(self):
         return self.args
 
-    def _generate_agent_prompt(self, tracker: Tracker, is_tool=False):
-        all_agents = list(tracker.args.keys())
-        all_agents.remove(self.name)
-        current_event = tracker.peek_agent()
-        if current_event.metadata is not None and isinstance(current_event.metadata, Dict):
-            flow_name = current_event.metadata["flow"]
-            if flow_name in all_agents:
-                all_agents.remove(flow_name)
-        agent_names = ", ".join(all_agents)
+    def compile_prompts(self, agents: Dict[Text, Agent], tools: Optional[Any] = None):
+        self._other_agents = [name for name in agents if name != self.name]
+        self._system_prefixes = {}
+        if tools is not None:
+            self._generate_function_prompt(tools=tools)
 
-        valid_states_info = ""
-        for agent_name, args in tracker.args.items():
-            if agent_name in ["sender", "bot_name", "__mapping__"]:
-                continue
-            if args is not None and len(args) > 0:
-                valid_states_info += f"{agent_name}: ("
-                for arg_name, arg_value in args.items():
-                    valid_states_info += f"{arg_name}: {arg_value}, "
-                valid_states_info += ")\n"
+    def _system_prefix(self, tracker: Tracker, flow_name: Optional[Text] = None) -> Text:
+        """
+        The static part of the system prompt, built once per calling flow. It comes
+        first so that providers can cache it; turn-dependent content follows it.
+        """
+        prefix = self._system_prefixes.get(flow_name)
+        if prefix is not None:
+            return prefix
+        other_agents = self._other_agents
+        if other_agents is None:
+            other_agents = [name for name in tracker.args if name not in TRACKER_META_ARGS and name != self.name]
+        agent_names = ", ".join(name for name in other_agents if name != flow_name)
 
-        system = f"You can talk to the user and act according to the instruction below: \n{self.prompt}\n" \
+        prefix = f"You can talk to the user and act according to the instruction below: \n{self.prompt}\n" \
                  f"## RULES\n1. Respond STRICTLY according to the instruction above.\n" \
                  f"2. Try to clarify user's intent instead of quit directly.\n" \
                  f"3. Unless specified in the task, do not make assumptions about any information the user has not provided.\n" \
                  f"4. If User: /init, which means conversation start. \n" \
-                 f"## INFORMATION\n{valid_states_info}.\n" \
                  f"## OUTPUT\n" \
                  f"1. If a user's intent is unrelated to the current conversation and instruction, for example: " \
                  f"{agent_names} or user want to quit, output: " \
@@ -363,17 +368,48 @@ class LLMAgent(Agent):
 
         if self.args is not None and len(self.args) > 0:
             args = ", ".join(self.args)
-            system += f"3. If the user mentions: {args}, " \
+            prefix += f"3. If the user mentions: {args}, " \
                  f"extract them in the output. Example: {{\"data\": {{\"{self.args[0]}\": xxx if exists, ...}}, " \
                  f"\"bot\": \"your reply\", \"status\": \"running\"}}\n"
         else:
-            system += f"3. Generally output: {{\"bot\": \"Your reply\", \"status\": \"running\"}}\n"
-        system += "Only output JSON structure. Do not output any other content. Do not use Markdown format."
+            prefix += f"3. Generally output: {{\"bot\": \"Your reply\", \"status\": \"running\"}}\n"
+        prefix += "Only output JSON structure. Do not output any other content. Do not use Markdown format.\n"
+        self._system_prefixes[flow_name] = prefix
+        return prefix
+
+    def _generate_agent_prompt(self, tracker: Tracker, is_tool=False):
+        flow_name = None
+        current_event = tracker.peek_agent()
+        if current_event.metadata is not None and isinstance(current_event.metadata, Dict):
+            flow_name = current_event.metadata["flow"]
 
-        system += f"## CONVERSATION HISTORY\n {tracker.get_history_str()}"
+        valid_states_info = ""
+        for agent_name, args in tracker.args.items():
+            if agent_name in TRACKER_META_ARGS:
+                continue
+            if args is not None and len(args) > 0:
+                valid_states_info += f"{agent_name}: ("
+                for arg_name, arg_value in args.items():
+                    valid_states_info += f"{arg_name}: {arg_value}, "
+                valid_states_info += ")\n"
+
+        # volatile content goes after the static prefix
+        system = self._system_prefix(tracker, flow_name) + f"## INFORMATION\n{valid_states_info}.\n"
 
-        prompt = [{"role": "system", "content": system}]
         history = tracker.get_or_create_agent_conv_history(self.name)
+        # the agent's own exchanges are always kept, the shared history gets the rest of the budget
+        budget = shared_history_budget(history_budget(self.llm_model, CALL_GENERATION), history)
+        if not is_tool:
+            # the user message of this turn is sent as a chat message below
+            tracker.mark_conv_event(self.name, tracker.latest_message)
+        if self.history_mode == HISTORY_DEDUPLICATED:
+            # the agent's own turns follow as chat messages, the shared history gives the context around them
+            shared_history = tracker.get_history_str(budget, exclude_agent=self.name)
+        else:
+            shared_history = tracker.get_history_str(budget)
+        system += f"## CONVERSATION HISTORY\n {shared_history}"
+
+        prompt = [{"role": "system", "content": system}]
         prompt.extend(history)
         # this turn
         if not is_tool:
@@ -400,6 +436,9 @@ class LLMAgent(Agent):
                                   **kwargs) -> Union[List, None]:
         if self.uses is None:
             return []
+        # the schemas only depend on the loaded tools, build them once
+        if self._functions is not None and tools is self._functions_tools:
+            return self._functions
         functions = []
         for function_name in self.uses:
             func = tools.get(function_name)
@@ -409,4 +448,6 @@ class LLMAgent(Agent):
                     f"Please check your Python code snippet.")
                 return functions
             functions.append(func.function_prompt())
+        self._functions = functions
+        self._functions_tools = tools
         return functions
@@ -3,7 +3,7 @@ from typing import Optional, Text
 from mica.agents.steps.base import Base
 from mica.event import BotUtter
 from mica.tracker import Tracker, FlowInfo
-from mica.utils import replace_args_in_string, logger
+from mica.utils import ArgTemplate, logger
 
 
 class Bot(Base):
@@ -12,6 +12,9 @@ class Bot(Base):
                  flow_name: Optional[Text] = None):
         self.text = text
         self.flow_name = flow_name
+        # parsed once, rendered once per utterance
+        self.template = ArgTemplate(text if isinstance(text, Text) else "", flow_name) \
+            if flow_name is not None else None
         super(Bot, self).__init__()
 
     @classmethod
@@ -30,7 +33,7 @@ class Bot(Base):
         if info is not None:
             info.is_listen = False
         text = self.text
-        if self.flow_name is not None:
-            text = replace_args_in_string(text, self.flow_name, tracker)
+        if self.template is not None:
+            text = self.template.render(tracker)
         logger.info(f"[{self.flow_name}]: bot: {text}")
-        return "Finished", [BotUtter(text=text)]
+        return "Finished", [BotUtter(text=text, rendered=self.template is not None)]
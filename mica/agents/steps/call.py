@@ -10,6 +10,7 @@ from mica.agents.functions import Function
 from mica.event import BotUtter, CurrentAgent, SetSlot, AgentFail
 from mica.exec_tool import SafePythonExecutor
 from mica.tracker import Tracker, FlowInfo
+from mica.turn_budget import spend_turn_budget, TURN_TOOL_CALLS
 from mica.utils import arg_format, replace_args_in_string, logger
 
 
@@ -57,6 +58,8 @@ class Call(Base):
                 msg = f"Cannot find any functions."
                 logger.error(msg)
                 raise ValueError(msg)
+            # tools run synchronously: the budget is checked before, a running tool is not interrupted
+            spend_turn_budget(tracker, TURN_TOOL_CALLS)
             tool_rst = tools.execute_function(self.name, **self._get_args_value(tracker))
             logger.info(f"[{self.flow_name}]: call: {self.name}, get result: {tool_rst}")
             if tool_rst['status'] == 'error':
@@ -71,6 +74,7 @@ class Call(Base):
                         text = evt.text
                         text = replace_args_in_string(text, self.name, tracker)
                         evt.text = text
+                        evt.rendered = True
                         evt.provider = self.name
                         result.append(evt)
                     else:
@@ -6,9 +6,64 @@ from typing import Optional, Text, List, Any, Dict
 from mica.agents.steps.base import Base
 
 from mica.constants import MAIN_FLOW
+from mica.llm.constants import CALL_CONDITION, CONDITION_MAX_TOKENS
+from mica.llm.history import history_budget
 from mica.llm.openai_model import OpenAIModel
 from mica.tracker import Tracker, FlowInfo
-from mica.utils import parse_and_evaluate, logger
+from mica.utils import parse_and_evaluate, compile_expression, logger
+
+BRANCHES_SYSTEM_PROMPT = "Your task is to identify the user’s intent. " \
+                         "I will give you numbered options, each with some target sentences. " \
+                         "Respond with the number of the first option that has a sentence with the same meaning " \
+                         "as the user’s message, or 0 if there is none. DO NOT EXPLAIN."
+
+
+async def classify_claim_branches(step: Base, tracker: Tracker, info: FlowInfo) -> Optional[bool]:
+    """
+    Classify the latest user message against the remaining `the user claims`
+    branches of the chain `step` belongs to in one multi-choice call, instead of
+    one call per branch. The decisions of all these branches are stored on
+    `info`; returns the decision of `step`, or None if the reply is unusable.
+    """
+    message = tracker.latest_message
+    chain = step.claim_branches
+    branches = [branch for branch in chain[chain.index(step):]
+                if branch is step or (info.get_counter(id(branch)) < branch.tries
+                                      and info.get_condition_decision(id(branch), message) is None)]
+    if len(branches) < 2:
+        return None
+    options = "\n".join(f"{idx}. " + " | ".join(f'"{example}"' for example in branch._extract_input_examples())
+                        for idx, branch in enumerate(branches, 1))
+    history = tracker.get_history_str(history_budget(step.llm_model, CALL_CONDITION))
+    prompt = [{"role": "system", "content": BRANCHES_SYSTEM_PROMPT},
+              {"role": "user",
+               "content": f"- Options:\n{options}\n- Previous Conversation: \n {history}\n"
+                          f"Which option does sentence \"{message.text}\" match?"}]
+    logger.debug("Branches prompt: \n%s", json.dumps(prompt, indent=2, ensure_ascii=False))
+    llm_result = await step.llm_model.generate_message(prompt, tracker, call_class=CALL_CONDITION,
+                                                       max_tokens=CONDITION_MAX_TOKENS)
+    answer = re.search(r"\d+", getattr(llm_result[0], "text", None) or "") if llm_result else None
+    if answer is None or int(answer.group()) > len(branches):
+        logger.warning(f"[{step.flow_name}]: unusable branch classification, checking the branches one by one")
+        return None
+    winner = int(answer.group())
+    info.set_condition_decisions(message, {id(branch): idx == winner for idx, branch in enumerate(branches, 1)})
+    return winner == 1
+
+
+def compile_condition(statement: Optional[Text], flow_name: Optional[Text]):
+    """
+    Compile an expression condition once at load time. Returns None for
+    `the user claims`/`the user clicks` conditions, and for statements that do
+    not parse, which keep being evaluated (and reported) at run time.
+    """
+    if not statement or "the user claims" in statement or "the user clicks" in statement:
+        return None
+    try:
+        return compile_expression(statement, flow_name)
+    except ValueError as e:
+        logger.warning(f"[{flow_name}]: cannot compile condition '{statement}': {e}")
+        return None
 
 
 class If(Base):
@@ -19,12 +74,20 @@ class If(Base):
                  config: Optional[Any] = None,
                  flow_name: Optional[Any] = None,
                  llm_model: Optional[Any] = None,
+                 claim_matcher: Optional[Any] = None,
                  ):
         self.statement = statement
         self.then = then
         self.tries = tries or float('inf')
         self.llm_model = llm_model or OpenAIModel.create(config)
         self.flow_name = flow_name
+        self.claim_matcher = claim_matcher
+        if claim_matcher is not None and "the user claims" in statement:
+            claim_matcher.register(self._extract_input_examples())
+        # `the user claims` branches of the if/else if chain, set by FlowAgent at load time
+        self.claim_branches: Optional[List[Base]] = None
+        # expression conditions compiled once, only the arg lookups are left to run()
+        self.evaluator = compile_condition(statement, flow_name)
         super(If, self).__init__()
 
     @classmethod
@@ -32,6 +95,7 @@ class If(Base):
         config = kwargs.get("config")
         flow_name = kwargs.get("root_agent_name")
         llm_model = kwargs.get("llm_model")
+        claim_matcher = kwargs.get("claim_matcher")
 
         from mica.agents.steps.step_loader import StepLoader
 
@@ -42,7 +106,7 @@ class If(Base):
             data["then"] = [data["then"]]
         for next_step in data["then"]:
             then.append(StepLoader.create(next_step, **kwargs))
-        return cls(statement, then, tries, config, flow_name, llm_model)
+        return cls(statement, then, tries, config, flow_name, llm_model, claim_matcher)
 
     def __repr__(self):
         details = "\n".join([repr(step) for step in self.then])
@@ -59,11 +123,21 @@ class If(Base):
         if "the user claims" in self.statement:
             all_examples = self._extract_input_examples()
             user_input = tracker.latest_message.text
-            prompt = self._generate_prompt(all_examples, user_input, tracker)
-            logger.debug("If prompt: \n%s", json.dumps(prompt, indent=2, ensure_ascii=False))
-            llm_result = await self.llm_model.generate_message(prompt)
-            response = llm_result[0].text
-            response_flag = "True" in response
+            # decided by the flow agent's extraction call in fused mode
+            response_flag = info.get_condition_decision(id(self), tracker.latest_message)
+            if response_flag is None and self.claim_matcher is not None:
+                response_flag = await self.claim_matcher.decide(all_examples, user_input, tracker)
+            if response_flag is None and self.claim_branches:
+                response_flag = await classify_claim_branches(self, tracker, info)
+            if response_flag is None:
+                prompt = self._generate_prompt(all_examples, user_input, tracker,
+                                               history_budget(self.llm_model, CALL_CONDITION))
+                logger.debug("If prompt: \n%s", json.dumps(prompt, indent=2, ensure_ascii=False))
+                llm_result = await self.llm_model.generate_message(prompt, tracker, call_class=CALL_CONDITION,
+                                                                   max_tokens=CONDITION_MAX_TOKENS)
+                # no reply, e.g. after a limiter or budget error, counts as False
+                response = (getattr(llm_result[0], "text", None) or "") if llm_result else ""
+                response_flag = "True" in response
             if response_flag:
                 logger.info(f"[{self.flow_name}]: (True) if: {self.statement}")
                 return "Do", []
@@ -82,7 +156,10 @@ class If(Base):
             logger.info(f"[{self.flow_name}]: (False) if: {self.statement}")
             return "Skip", []
         else:
-            flag = parse_and_evaluate(self.statement, tracker, self.flow_name)
+            if self.evaluator is not None:
+                flag = self.evaluator(tracker)
+            else:
+                flag = parse_and_evaluate(self.statement, tracker, self.flow_name)
             if flag:
                 logger.info(f"[{self.flow_name}]: (True) if: {self.statement}")
                 return "Do", []
@@ -98,9 +175,9 @@ class If(Base):
             #     return "Skip", []
 
     @staticmethod
-    def _generate_prompt(examples, user_input, tracker: Tracker):
+    def _generate_prompt(examples, user_input, tracker: Tracker, max_history_tokens: Optional[int] = None):
         user_content = "- Targets:\n" + "\n".join(examples) + \
-                       f"\n- Previous Conversation: \n {tracker.get_history_str()}\n"
+                       f"\n- Previous Conversation: \n {tracker.get_history_str(max_history_tokens)}\n"
 
         user_content += f"Does sentence \"{user_input}\" have the same meaning as any sentences in the targets?"
         prompt = [{"role": "system",
@@ -139,12 +216,20 @@ class ElseIf(Base):
                  config: Optional[Any] = None,
                  flow_name: Optional[Any] = None,
                  llm_model: Optional[Any] = None,
+                 claim_matcher: Optional[Any] = None,
                  ):
         self.statement = statement
         self.then = then
         self.tries = tries or float('inf')
         self.llm_model = llm_model or OpenAIModel.create(config)
         self.flow_name = flow_name
+        self.claim_matcher = claim_matcher
+        if claim_matcher is not None and "the user claims" in statement:
+            claim_matcher.register(self._extract_input_examples())
+        # `the user claims` branches of the if/else if chain, set by FlowAgent at load time
+        self.claim_branches: Optional[List[Base]] = None
+        # expression conditions compiled once, only the arg lookups are left to run()
+        self.evaluator = compile_condition(statement, flow_name)
         super(ElseIf, self).__init__()
 
     @classmethod
@@ -152,6 +237,7 @@ class ElseIf(Base):
         config = kwargs.get("config")
         flow_name = kwargs.get("root_agent_name")
         llm_model = kwargs.get("llm_model")
+        claim_matcher = kwargs.get("claim_matcher")
 
         from mica.agents.steps.step_loader import StepLoader
 
@@ -162,7 +248,7 @@ class ElseIf(Base):
             data["then"] = [data["then"]]
         for next_step in data["then"]:
             then.append(StepLoader.create(next_step, **kwargs))
-        return cls(statement, then, tries, config, flow_name, llm_model)
+        return cls(statement, then, tries, config, flow_name, llm_model, claim_matcher)
 
     def __repr__(self):
         details = "\n".join([repr(step) for step in self.then])
@@ -179,11 +265,21 @@ class ElseIf(Base):
         if "the user claims" in self.statement:
             all_examples = self._extract_input_examples()
             user_input = tracker.latest_message.text
-            prompt = self._generate_prompt(all_examples, user_input, tracker)
-            logger.debug("Else If prompt: \n%s", json.dumps(prompt, indent=2, ensure_ascii=False))
-            llm_result = await self.llm_model.generate_message(prompt)
-            response = llm_result[0].text
-            response_flag = "True" in response
+            # decided by the flow agent's extraction call in fused mode
+            response_flag = info.get_condition_decision(id(self), tracker.latest_message)
+            if response_flag is None and self.claim_matcher is not None:
+                response_flag = await self.claim_matcher.decide(all_examples, user_input, tracker)
+            if response_flag is None and self.claim_branches:
+                response_flag = await classify_claim_branches(self, tracker, info)
+            if response_flag is None:
+                prompt = self._generate_prompt(all_examples, user_input, tracker,
+                                               history_budget(self.llm_model, CALL_CONDITION))
+                logger.debug("Else If prompt: \n%s", json.dumps(prompt, indent=2, ensure_ascii=False))
+                llm_result = await self.llm_model.generate_message(prompt, tracker, call_class=CALL_CONDITION,
+                                                                   max_tokens=CONDITION_MAX_TOKENS)
+                # no reply, e.g. after a limiter or budget error, counts as False
+                response = (getattr(llm_result[0], "text", None) or "") if llm_result else ""
+                response_flag = "True" in response
             if response_flag:
                 logger.info(f"[{self.flow_name}]: (True) else if: {self.statement}")
                 return "Do", []
@@ -203,7 +299,10 @@ class ElseIf(Base):
             logger.info(f"[{self.flow_name}]: (False) else if: {self.statement}")
             return "Skip", []
         else:
-            flag = parse_and_evaluate(self.statement, tracker, self.flow_name)
+            if self.evaluator is not None:
+                flag = self.evaluator(tracker)
+            else:
+                flag = parse_and_evaluate(self.statement, tracker, self.flow_name)
             if flag:
                 logger.info(f"[{self.flow_name}]: (True) else if: {self.statement}")
                 return "Do", []
@@ -219,9 +318,9 @@ class ElseIf(Base):
             #     return "Skip", []
 
     @staticmethod
-    def _generate_prompt(examples, user_input, tracker: Tracker):
+    def _generate_prompt(examples, user_input, tracker: Tracker, max_history_tokens: Optional[int] = None):
         user_content = "- Targets:\n" + "\n".join(examples) + \
-                       f"\n- Previous Conversation: \n {tracker.get_history_str()}\n"
+                       f"\n- Previous Conversation: \n {tracker.get_history_str(max_history_tokens)}\n"
         user_content += f"Does sentence \"{user_input}\" have the same meaning as any sentences in the targets?"
         prompt = [{"role": "system",
                    "content": "Your task is to identify the user’s intent. "
@@ -252,10 +351,12 @@ class ElseIf(Base):
 class Else(Base):
     def __init__(self,
                  then: Optional[List[Any]] = None,
-                 tries: Optional[Any] = None
+                 tries: Optional[Any] = None,
+                 flow_name: Optional[Any] = None
                  ):
         self.then = then
         self.tries = tries or float('inf')
+        self.flow_name = flow_name
         super(Else, self).__init__()
 
     @classmethod
@@ -267,7 +368,7 @@ class Else(Base):
             data["else"] = [data["else"]]
         for next_step in data["else"]:
             then.append(StepLoader.create(next_step, **kwargs))
-        return cls(then, tries)
+        return cls(then, tries, kwargs.get("root_agent_name"))
 
     def __repr__(self):
         details = "\n".join([repr(step) for step in self.then])
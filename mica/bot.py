@@ -1,3 +1,4 @@
+import asyncio
 import copy
 import json
 import os.path
@@ -19,10 +20,15 @@ from mica.agents.kb_agent import KBAgent
 from mica.channel import ChatChannel
 from mica.event import UserInput, BotUtter, FollowUpAgent, AgentComplete, AgentFail, CurrentAgent
 from mica.exec_tool import SafePythonExecutor
+from mica.llm.claim_matcher import ClaimMatcher
+from mica.llm.embedding_memo import embedding_key, prefetch
 from mica.llm.openai_model import OpenAIModel
 from mica.llm.model_factory import ModelFactory
+from mica.llm.summarizer import HistorySummarizer
 from mica.model_config import ModelConfig
 from mica.tracker_store import TrackerStore, InMemoryTrackerStore
+from mica.running_turn import RunningTurn
+from mica.turn_budget import TurnBudget, TURN_LLM_CALLS
 from mica.utils import find_config_files, save_file, replace_args_in_string, logger, short_uuid, bot_info_logger, user_info_logger
 
 
@@ -42,7 +48,11 @@ class Bot(object):
                  scheduler: Optional[Any] = None,
                  entrypoint: Optional[Agent] = None,
                  tools: Optional[Any] = None,
-                 connector: Optional[Any] = None
+                 connector: Optional[Any] = None,
+                 summarizer: Optional[HistorySummarizer] = None,
+                 prefetch_embeddings: Optional[List[Any]] = None,
+                 turn_budget: Optional[TurnBudget] = None,
+                 supersede_turns: bool = False
                  ):
         self.name = name
         self.config = config
@@ -55,7 +65,19 @@ class Bot(object):
         self.sum_rsp_time = 0
         self.tools = tools
         self.connector = connector or {}
+        self.summarizer = summarizer
+        # embedding models the user message is embedded with as soon as it arrives
+        self.prefetch_embeddings = prefetch_embeddings or []
+        # per-turn limits, a fresh copy is started for every message
+        self.turn_budget = turn_budget or TurnBudget.create()
+        # a newer message of the same user cancels the unfinished turn, see RunningTurn
+        self.supersede_turns = supersede_turns
+        self._running_turns: Dict[Text, RunningTurn] = {}
+        self.turn_stats = {"superseded": 0, "wasted_llm_calls": 0}
         self._func_args_config = {name: {} for name in self.tools.functions.keys()} if tools is not None else {}
+        # build the static prompt prefixes once instead of on every turn
+        for agent in (agents or {}).values():
+            agent.compile_prompts(agents, tools)
 
     @classmethod
     def from_json(cls,
@@ -80,8 +102,15 @@ class Bot(object):
         scheduler = PriorityProcessor.create()
 
         # Create LLM model using factory - supports both OpenAI and custom providers
-        llm_config = config.get('llm', {}).get('chat') if 'llm' in config else config
-        llm_model = ModelFactory.create_llm(llm_config)
+        # Calls are routed to model profiles by call class, see ModelFactory.create_router
+        llm_config = config.get('llm') if 'llm' in config else {'chat': config}
+        llm_model = ModelFactory.create_router(llm_config)
+        # One embedding model for the KB agents and the claim fast path
+        embeddings = ModelFactory.create_embedding(llm_config['embedding']) if llm_config.get('embedding') else None
+        # Optional embedding fast path for `the user claims` conditions
+        claim_matcher = ClaimMatcher.create(config, embeddings)
+        # Optional background summarization of long conversations
+        summarizer = HistorySummarizer.create(config, llm_model)
 
         # create agent objs
         create_agents = {
@@ -90,15 +119,19 @@ class Bot(object):
             "flow agent": FlowAgent.create,
             "kb agent": KBAgent.create
         }
-        agents = {n: create_agents[value.get('type')](name=n, **value, config=config, llm_model=llm_model)
+        agents = {n: create_agents[value.get('type')](name=n, **value, config=config, llm_model=llm_model,
+                                                      claim_matcher=claim_matcher, embeddings=embeddings)
                   for n, value in data.items()
                   if value.get('type') is not None}
+        if claim_matcher is not None:
+            claim_matcher.prepare()
 
         for _, agent in list(agents.items()):
             if isinstance(agent, EnsembleAgent):
                 if agent.exit_agent is not None:
                     if agent.exit_agent == "default":
-                        exit_agent = DefaultExitAgent.create(name=f"DefaultExitAgent_{agent.name}")
+                        exit_agent = DefaultExitAgent.create(name=f"DefaultExitAgent_{agent.name}",
+                                                             llm_model=llm_model)
                         agents[exit_agent.name] = exit_agent
                     else:
                         exit_agent = agents.get(agent.exit_agent) or \
@@ -111,7 +144,8 @@ class Bot(object):
             if isinstance(agent, (FlowAgent, EnsembleAgent)):
                 if agent.fallback is not None:
                     if agent.fallback == 'default':
-                        fallback_agent = DefaultFallbackAgent.create(name=f"DefaultFallbackAgent_{agent.name}")
+                        fallback_agent = DefaultFallbackAgent.create(name=f"DefaultFallbackAgent_{agent.name}",
+                                                                     llm_model=llm_model)
                         agents[fallback_agent.name] = fallback_agent
                     else:
                         fallback_agent = agents.get(agent.fallback) or \
@@ -133,6 +167,13 @@ class Bot(object):
                 logger.error(f"Traceback: {load_rst['traceback']}")
                 raise InvalidBot('Not a valid chatbot')
 
+        prefetch_embeddings = []
+        if llm_config.get('prefetch_embedding'):
+            models = [agent.embeddings for agent in agents.values() if isinstance(agent, KBAgent)]
+            if claim_matcher is not None:
+                models.append(claim_matcher.embeddings)
+            prefetch_embeddings = list({embedding_key(model): model for model in models}.values())
+
         tracker_store = InMemoryTrackerStore.create()
         logger.debug(f"here are all the registered agents: {agents}")
 
@@ -149,24 +190,79 @@ class Bot(object):
                    scheduler=scheduler,
                    entrypoint=entrypoint,
                    tools=tools,
-                   connector=connector)
+                   connector=connector,
+                   summarizer=summarizer,
+                   prefetch_embeddings=prefetch_embeddings,
+                   turn_budget=TurnBudget.create(config),
+                   supersede_turns=bool(config.get('supersede_turns')))
 
     async def handle_message(self,
                              user_id: Text,
                              message: Any,
                              channel: ChatChannel = None):
+        if not self.supersede_turns:
+            return await self._handle_turn(user_id, message, channel)
+
+        previous = self._running_turns.get(user_id)
+        if previous is not None and previous.supersede():
+            wasted = previous.budget.used[TURN_LLM_CALLS] if previous.budget is not None else 0
+            self.turn_stats["superseded"] += 1
+            self.turn_stats["wasted_llm_calls"] += wasted
+            logger.info(f"Superseded the unfinished turn of {user_id} after {wasted} LLM call(s)")
+            message = f"{previous.message}\n{message}"
+        turn = self._running_turns[user_id] = RunningTurn(message)
+        try:
+            if previous is not None:
+                # wait until the previous turn has finished or rolled the tracker back
+                await previous.done.wait()
+            if turn.superseded:
+                return []
+            turn.task = asyncio.ensure_future(self._handle_turn(user_id, message, channel, turn))
+            try:
+                return await turn.task
+            except asyncio.CancelledError:
+                if turn.superseded:
+                    # the newer message answers for this one
+                    return []
+                raise
+        finally:
+            turn.done.set()
+            if self._running_turns.get(user_id) is turn:
+                del self._running_turns[user_id]
+
+    async def _handle_turn(self,
+                           user_id: Text,
+                           message: Any,
+                           channel: ChatChannel = None,
+                           turn: Optional[RunningTurn] = None):
         tracker = self.tracker_store.get_or_create_tracker(user_id,
                                                            args=copy.deepcopy(self._args_config),
                                                            functions=copy.deepcopy(self._func_args_config))
+        # a turn that may be superseded is rolled back to here
+        snapshot = tracker.snapshot() if turn is not None else None
         user_event = UserInput(text=message, metadata=channel)
         tracker.update(user_event)
         tracker.latest_message = user_event
+        if self.prefetch_embeddings and not message.startswith('/'):
+            # overlaps the embedding round trip with agent selection and flow steps
+            prefetch(tracker, self.prefetch_embeddings)
         user_info_logger.info("=" * (len("User:" + message)))
         user_info_logger.info("User: %s", tracker.latest_message.text)
         user_info_logger.info("-" * (len("User:" + message)))
         
         start = time.time()
-        response = await self.scheduler.predict_next_action(user_id, tracker, self)
+        tracker.turn_budget = self.turn_budget.start()
+        if turn is not None:
+            turn.budget = tracker.turn_budget
+        try:
+            response = await self.scheduler.predict_next_action(user_id, tracker, self)
+        except asyncio.CancelledError:
+            if snapshot is not None:
+                tracker.restore(snapshot)
+            raise
+        finally:
+            # background work after the turn (summaries, ...) is not charged to it
+            tracker.turn_budget = None
         bot_info_logger.info("-" * (len("Bot: " + " ".join(response))))
         bot_info_logger.info("Bot: " + " ".join(response))
         bot_info_logger.info("=" * (len("Bot: " + " ".join(response))))
@@ -175,6 +271,9 @@ class Bot(object):
         self.count += 1
         self.sum_rsp_time += end-start
         print("####avg time:", self.sum_rsp_time / self.count)
+        if self.summarizer is not None:
+            # runs in the background once the response is returned
+            self.summarizer.schedule(tracker)
         return response
 
     def _find_all_args(self, agents: Dict[Text, Agent]):
@@ -1,4 +1,6 @@
 DEFAULT_MODEL_ENGINE = "openai"
 OPENAI_API_KEY = "OPENAI_API_KEY"
 
-MAIN_FLOW = "main_flow"
\ No newline at end of file
+MAIN_FLOW = "main_flow"
+# tracker.args entries that hold bot metadata rather than the args of an agent
+TRACKER_META_ARGS = ("sender", "bot_name", "__mapping__")
@@ -39,10 +39,13 @@ class BotUtter(Event):
                  metadata: Optional[Any] = None,
                  additional: Optional[Dict[Any, Any]] = None,
                  provider: Optional[Text] = None,
+                 rendered: bool = False,
                  ):
         self.text = text
         self.additional = additional
         self.provider = provider
+        # the ${arg} references of the text are already filled in
+        self.rendered = rendered
 
         super().__init__(timestamp, metadata)
 
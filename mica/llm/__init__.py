@@ -1,14 +1,36 @@
 from mica.llm.base import BaseModel
 from mica.llm.openai_model import OpenAIModel
 from mica.llm.custom_model import CustomLLMModel
+from mica.llm.batch_model import BatchModel, LocalBatchBackend, OpenAIBatchBackend
 from mica.llm.custom_embedding import CustomEmbedding
+from mica.llm.embedding_pipeline import EmbeddingPipeline
+from mica.llm.claim_matcher import ClaimMatcher
+from mica.llm.summarizer import HistorySummarizer
+from mica.llm.hedging import HedgedModel
+from mica.llm.router import ModelRouter
+from mica.llm.rate_limiter import RateLimiter, RateLimitTimeout
+from mica.llm.concurrency import ConcurrencyLimiter, ConcurrencyTimeout
+from mica.llm.metrics import llm_metrics
 from mica.llm.model_factory import ModelFactory, create_llm_model, create_embedding_model
 
 __all__ = [
     'BaseModel',
     'OpenAIModel',
     'CustomLLMModel',
+    'BatchModel',
+    'LocalBatchBackend',
+    'OpenAIBatchBackend',
     'CustomEmbedding',
+    'EmbeddingPipeline',
+    'ClaimMatcher',
+    'HistorySummarizer',
+    'HedgedModel',
+    'ModelRouter',
+    'RateLimiter',
+    'RateLimitTimeout',
+    'ConcurrencyLimiter',
+    'ConcurrencyTimeout',
+    'llm_metrics',
     'ModelFactory',
     'create_llm_model',
     'create_embedding_model',
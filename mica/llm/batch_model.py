@@ -0,0 +1,265 @@
+import asyncio
+import json
+import os
+import tempfile
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Optional, Dict, Text, List
+
+import httpx
+
+from mica.constants import OPENAI_API_KEY
+from mica.llm.base import BaseModel
+from mica.llm.openai_compat import build_chat_payload, parse_chat_response, generation_overrides, STRUCTURED_NONE
+from mica.tracker import Tracker
+from mica.utils import logger, short_uuid
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+OPENAI_BASE_URL = "https://api.openai.com"
+# batch job states after which the job makes no more progress
+BATCH_FINAL_STATES = ("completed", "failed", "expired", "cancelled")
+
+
+class BatchBackend(ABC):
+    """Runs a batch-API JSONL input file and writes the results as JSONL."""
+
+    @abstractmethod
+    async def run(self, input_path: Text, output_path: Text):
+        """
+        :param input_path: One {"custom_id", "method", "url", "body"} request per line
+        :param output_path: Where to write one {"custom_id", "response": {"status_code", "body"}} result per line
+        """
+
+
+class LocalBatchBackend(BatchBackend):
+    """
+    Stand-in for a provider batch API: sends the requests of the file to an
+    OpenAI-compatible server (e.g. mica.llm.fake_server) with bounded concurrency.
+    """
+
+    def __init__(self, server: Text, headers: Optional[Dict] = None, max_concurrency: int = 8,
+                 timeout: Optional[float] = 60):
+        self.url = server.rstrip('/') + BATCH_ENDPOINT
+        self.headers = headers or {}
+        self.max_concurrency = max(1, max_concurrency)
+        self.timeout = timeout
+
+    async def run(self, input_path: Text, output_path: Text):
+        with open(input_path, encoding="utf-8") as f:
+            requests = [json.loads(line) for line in f if line.strip()]
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async with httpx.AsyncClient(timeout=self.timeout) as client:
+            async def send(request: Dict) -> Dict:
+                async with semaphore:
+                    try:
+                        response = await client.post(self.url, headers=self.headers, json=request["body"])
+                        body = response.json() if response.status_code == 200 else {"error": response.text}
+                        return {"custom_id": request["custom_id"],
+                                "response": {"status_code": response.status_code, "body": body}}
+                    except Exception as e:
+                        return {"custom_id": request["custom_id"], "response": None, "error": {"message": str(e)}}
+
+            results = await asyncio.gather(*[send(request) for request in requests])
+        with open(output_path, "w", encoding="utf-8") as f:
+            for result in results:
+                f.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+
+class OpenAIBatchBackend(BatchBackend):
+    """Runs the file as an OpenAI Batch API job: upload, create the batch, poll, download."""
+
+    def __init__(self, server: Optional[Text] = None, headers: Optional[Dict] = None,
+                 poll_interval: float = 30, completion_window: Text = "24h"):
+        self.base_url = (server or OPENAI_BASE_URL).rstrip('/')
+        # multipart uploads set their own content type
+        self.headers = {k: v for k, v in (headers or {}).items() if k.lower() != "content-type"}
+        self.poll_interval = poll_interval
+        self.completion_window = completion_window
+
+    async def run(self, input_path: Text, output_path: Text):
+        async with httpx.AsyncClient(base_url=self.base_url, headers=self.headers, timeout=120) as client:
+            with open(input_path, "rb") as f:
+                upload = await client.post("/v1/files", data={"purpose": "batch"},
+                                           files={"file": (os.path.basename(input_path), f, "application/jsonl")})
+            upload.raise_for_status()
+            created = await client.post("/v1/batches", json={"input_file_id": upload.json()["id"],
+                                                             "endpoint": BATCH_ENDPOINT,
+                                                             "completion_window": self.completion_window})
+            created.raise_for_status()
+            batch = created.json()
+            logger.info(f"Submitted batch {batch['id']} ({os.path.basename(input_path)})")
+            while batch.get("status") not in BATCH_FINAL_STATES:
+                await asyncio.sleep(self.poll_interval)
+                polled = await client.get(f"/v1/batches/{batch['id']}")
+                polled.raise_for_status()
+                batch = polled.json()
+            logger.info(f"Batch {batch['id']} finished with status {batch['status']}: {batch.get('request_counts')}")
+            with open(output_path, "w", encoding="utf-8") as f:
+                # failed requests are reported in the error file, in the same format
+                for file_id in (batch.get("output_file_id"), batch.get("error_file_id")):
+                    if file_id:
+                        content = await client.get(f"/v1/files/{file_id}/content")
+                        content.raise_for_status()
+                        f.write(content.text.rstrip("\n") + "\n")
+
+
+class BatchModel(BaseModel):
+    """
+    Chat model for offline evaluation runs. Calls are not sent one by one but
+    collected into batch-API JSONL jobs; each caller (a suspended conversation
+    turn) resumes once the job holding its request is done. Run many independent
+    conversations concurrently to fill the batches:
+
+        llm:
+          chat:
+            provider: batch
+            model: gpt-4o-mini
+            batch:
+              backend: openai        # or local, which sends the file to `server`
+              max_requests: 1000     # submit once this many calls are waiting
+              max_delay: 2.0         # or once no new call came for this many seconds
+              work_dir: ./batches    # keeps the input and output files
+
+    A batch is submitted when `max_requests` calls are waiting, or when the
+    collection has been idle for `max_delay` seconds, i.e. every running
+    conversation is waiting for a result.
+    """
+
+    def __init__(self,
+                 server: Optional[Text] = None,
+                 api_key: Optional[Text] = None,
+                 model: Optional[Text] = "gpt-4",
+                 temperature: Optional[float] = 0.0,
+                 top_p: Optional[float] = 0.8,
+                 presence_penalty: Optional[float] = 0.1,
+                 frequency_penalty: Optional[float] = 0.1,
+                 max_tokens: Optional[int] = 512,
+                 headers: Optional[Dict] = None,
+                 structured_output: Optional[Text] = STRUCTURED_NONE,
+                 batch: Optional[Dict] = None,
+                 backend: Optional[BatchBackend] = None,
+                 **kwargs):
+        """
+        Args:
+            server: Base URL of the provider (openai backend) or of the server the local backend calls
+            api_key: Optional API key, defaults to OPENAI_API_KEY for the openai backend
+            model: Model name used in every request
+            temperature, top_p, presence_penalty, frequency_penalty, max_tokens: Sampling settings
+            headers: Optional custom headers
+            structured_output: How the reply envelope is enforced, as for the other chat models
+            batch: {backend, max_requests, max_delay, work_dir, max_concurrency, poll_interval}
+            backend: Explicit BatchBackend, overrides batch.backend
+        """
+        batch = batch or {}
+        self.model = model
+        self.temperature = temperature
+        self.top_p = top_p
+        self.presence_penalty = presence_penalty
+        self.frequency_penalty = frequency_penalty
+        self.max_tokens = max_tokens
+        self.structured_output = structured_output or STRUCTURED_NONE
+        self.max_requests = batch.get("max_requests", 1000)
+        self.max_delay = batch.get("max_delay", 2.0)
+        self.work_dir = batch.get("work_dir") or tempfile.mkdtemp(prefix="mica-batch-")
+        os.makedirs(self.work_dir, exist_ok=True)
+
+        self.headers = dict(headers or {})
+        if api_key is None and batch.get("backend", "openai") == "openai":
+            api_key = os.getenv(OPENAI_API_KEY)
+        if api_key and "Authorization" not in self.headers:
+            self.headers["Authorization"] = f"Bearer {api_key}"
+        if backend is None:
+            if batch.get("backend", "openai") == "local":
+                if server is None:
+                    raise ValueError("'server' must be specified for the local batch backend")
+                backend = LocalBatchBackend(server, self.headers, batch.get("max_concurrency", 8))
+            else:
+                backend = OpenAIBatchBackend(server, self.headers, batch.get("poll_interval", 30))
+        self.backend = backend
+
+        # [(custom_id, payload, provider, response_schema, future)] not submitted yet
+        self._pending: List[tuple] = []
+        self._last_arrival = 0.0
+        self._collector: Optional[asyncio.Task] = None
+        self._jobs = set()
+        self.batches_submitted = 0
+        self.requests_submitted = 0
+
+    @classmethod
+    def create(cls, llm_config: Optional[Dict] = None):
+        return cls(**(llm_config or {}))
+
+    async def generate_message(self,
+                               prompts: Any,
+                               tracker: Optional[Tracker] = None,
+                               functions: Optional[Any] = None,
+                               provider: Optional[Text] = None,
+                               response_schema: Optional[Dict] = None,
+                               **kwargs: Any) -> List:
+        payload = build_chat_payload(self, prompts, functions, response_schema, generation_overrides(kwargs))
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((short_uuid(), payload, provider, response_schema, future))
+        self._last_arrival = time.monotonic()
+        if len(self._pending) >= self.max_requests:
+            self._submit()
+        elif self._collector is None or self._collector.done():
+            self._collector = asyncio.ensure_future(self._collect())
+        return await future
+
+    async def _collect(self):
+        while self._pending:
+            wait = self._last_arrival + self.max_delay - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            self._submit()
+
+    def _submit(self):
+        requests, self._pending = self._pending, []
+        if not requests:
+            return
+        job = asyncio.ensure_future(self._run_batch(requests))
+        self._jobs.add(job)
+        job.add_done_callback(self._jobs.discard)
+
+    async def _run_batch(self, requests: List[tuple]):
+        name = f"batch-{short_uuid()}"
+        input_path = os.path.join(self.work_dir, f"{name}-input.jsonl")
+        output_path = os.path.join(self.work_dir, f"{name}-output.jsonl")
+        with open(input_path, "w", encoding="utf-8") as f:
+            for custom_id, payload, _, _, _ in requests:
+                f.write(json.dumps({"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": payload},
+                                   ensure_ascii=False) + "\n")
+        self.batches_submitted += 1
+        self.requests_submitted += len(requests)
+        logger.info(f"Running {name} with {len(requests)} requests")
+
+        results = {}
+        try:
+            await self.backend.run(input_path, output_path)
+            with open(output_path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        result = json.loads(line)
+                        results[result.get("custom_id")] = result
+        except Exception as e:
+            logger.error(f"{name} failed: {e}")
+
+        for custom_id, _, provider, response_schema, future in requests:
+            if future.done():
+                continue
+            response = (results.get(custom_id) or {}).get("response") or {}
+            if response.get("status_code") != 200:
+                logger.error(f"Batch request {custom_id} failed: {results.get(custom_id)}")
+                future.set_result([])
+                continue
+            future.set_result(parse_chat_response(response.get("body"), provider, response_schema))
+
+    async def wait_idle(self):
+        """Wait until every collected call has been answered."""
+        while self._pending or self._jobs:
+            if self._collector is not None:
+                await self._collector
+            if self._jobs:
+                await asyncio.gather(*list(self._jobs), return_exceptions=True)
@@ -0,0 +1,145 @@
+import re
+import time
+from typing import Optional, Dict, Text, Any, List, Tuple
+
+import numpy as np
+
+from mica.llm.constants import CALL_CONDITION
+from mica.llm.embedding_memo import embed_user_message
+from mica.llm.embedding_pipeline import EmbeddingPipeline
+from mica.llm.metrics import llm_metrics
+from mica.utils import logger
+
+FAST_PATH_MODEL = "embedding-fast-path"
+
+
+def _normalize(text: Text) -> Text:
+    return re.sub(r"[^\w]+", " ", (text or "").lower()).strip()
+
+
+class ClaimMatcher:
+    """
+    Embedding fast path for `the user claims "..."` conditions.
+
+    The quoted examples of every condition are embedded once when the bot is
+    loaded. At runtime the user input is embedded and compared with all examples
+    of the condition in one matrix product. A best cosine similarity at or above
+    `accept_threshold` decides the condition as true, one below `reject_threshold`
+    as false; only scores in between are sent to the LLM. Both thresholds depend
+    on the embedding model and should be calibrated for it.
+    """
+
+    def __init__(self,
+                 embeddings: Any,
+                 accept_threshold: float = 0.92,
+                 reject_threshold: float = 0.7,
+                 indexer: Optional[EmbeddingPipeline] = None):
+        self.embeddings = embeddings
+        self.accept_threshold = accept_threshold
+        self.reject_threshold = reject_threshold
+        self.indexer = indexer or EmbeddingPipeline(embeddings)
+        self._pending: List[Text] = []
+        self._vectors: Dict[Text, np.ndarray] = {}
+        self._matrices: Dict[Tuple[Text, ...], np.ndarray] = {}
+        self.ready = False
+
+    @classmethod
+    def create(cls,
+               config: Optional[Dict[Text, Any]] = None,
+               embeddings: Optional[Any] = None) -> Optional["ClaimMatcher"]:
+        """
+        Create a matcher when the fast path is enabled in config.yml, embedding with
+        the bot's `embeddings` model if given, else with one created from `llm.embedding`:
+
+            llm:
+              embedding:
+                provider: custom
+                server: http://localhost:8001
+              claim_fast_path:
+                accept_threshold: 0.92
+                reject_threshold: 0.7
+
+        Returns None otherwise, in which case all conditions are judged by the LLM.
+        """
+        llm_config = (config or {}).get("llm") or {}
+        fast_path = llm_config.get("claim_fast_path")
+        if not fast_path:
+            return None
+        fast_path = fast_path if isinstance(fast_path, Dict) else {}
+
+        from mica.llm.model_factory import ModelFactory
+        embedding_config = llm_config.get("embedding")
+        embeddings = embeddings or ModelFactory.create_embedding(embedding_config)
+        return cls(embeddings,
+                   accept_threshold=fast_path.get("accept_threshold", 0.92),
+                   reject_threshold=fast_path.get("reject_threshold", 0.7),
+                   indexer=EmbeddingPipeline.create(embeddings, embedding_config))
+
+    def register(self, examples: List[Text]):
+        """Collect the examples of a condition; they are embedded in bulk by prepare()."""
+        self._pending.extend(example for example in examples if example not in self._vectors)
+
+    def prepare(self):
+        """Embed all registered examples. On failure every condition falls back to the LLM."""
+        texts = list(dict.fromkeys(self._pending))
+        self._pending = []
+        if not texts:
+            self.ready = True
+            return
+        try:
+            vectors = self.indexer.embed(texts)
+        except Exception as e:
+            logger.error(f"Failed to embed condition examples, the claim fast path is disabled: {e}")
+            return
+        for text, vector in zip(texts, vectors):
+            vector = np.asarray(vector, dtype=np.float32)
+            self._vectors[text] = vector / (np.linalg.norm(vector) or 1.0)
+        self.ready = True
+        logger.debug(f"Embedded {len(texts)} condition examples for the claim fast path")
+
+    def _matrix(self, examples: List[Text]) -> Optional[np.ndarray]:
+        key = tuple(examples)
+        matrix = self._matrices.get(key)
+        if matrix is None:
+            if any(example not in self._vectors for example in examples):
+                return None
+            matrix = self._matrices[key] = np.stack([self._vectors[example] for example in examples])
+        return matrix
+
+    async def decide(self, examples: List[Text], user_input: Text, tracker: Optional[Any] = None) -> Optional[bool]:
+        """
+        Args:
+            examples: Quoted examples of the condition
+            user_input: The user message
+            tracker: Conversation tracker, whose turn embedding is reused by every condition
+
+        Returns:
+            True/False when the similarity is confident, None when the LLM should decide.
+        """
+        if not examples or not self.ready:
+            return None
+        start = time.perf_counter()
+        normalized = _normalize(user_input)
+        if any(normalized == _normalize(example) for example in examples):
+            llm_metrics.observe(CALL_CONDITION, FAST_PATH_MODEL, time.perf_counter() - start)
+            return True
+
+        matrix = self._matrix(examples)
+        if matrix is None:
+            return None
+        query = await embed_user_message(tracker, self.embeddings, user_input)
+        if not query:
+            return None
+        query = np.asarray(query, dtype=np.float32)
+        best = float(np.max(matrix @ (query / (np.linalg.norm(query) or 1.0))))
+
+        if best >= self.accept_threshold:
+            decision = True
+        elif best < self.reject_threshold:
+            decision = False
+        else:
+            logger.debug(f"Claim similarity {best:.3f} is ambiguous, asking the LLM")
+            return None
+        llm_metrics.observe(CALL_CONDITION, FAST_PATH_MODEL, time.perf_counter() - start)
+        logger.debug(f"Claim decided locally: {decision} (similarity {best:.3f})")
+        return decision
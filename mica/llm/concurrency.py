@@ -0,0 +1,212 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Optional, Dict, Text, Any, Tuple
+
+from mica.llm.rate_limiter import RateLimitTimeout
+from mica.utils import logger
+
+# Recent latencies kept to estimate the no-queueing latency of an endpoint
+LATENCY_WINDOW = 100
+
+
+class ConcurrencyTimeout(RateLimitTimeout):
+    """Exception that can be raised when no request slot frees up before the caller's deadline."""
+
+
+class Permit:
+    def __init__(self, limiter: "ConcurrencyLimiter"):
+        self.limiter = limiter
+        self.start = time.monotonic()
+        self.released = False
+
+    def release(self, overloaded: bool = False):
+        """Give the slot back; `overloaded` marks a 429, 5xx or timeout answer."""
+        if self.released:
+            return
+        self.released = True
+        self.limiter.release(time.monotonic() - self.start, overloaded)
+
+
+class ConcurrencyLimiter:
+    """
+    Adaptive limit on the requests in flight to one provider endpoint and model,
+    shared by every bot in the process.
+
+    The limit follows AIMD: it grows by one request per limit's worth of successful
+    calls while the limit is actually used, and is cut by `backoff` when the
+    provider signals overload (429, 5xx, timeouts). With `latency_tolerance`, a call
+    slower than that multiple of the best recent latency also counts as overload,
+    since it indicates queueing at the provider. Calls above the limit wait in
+    FIFO order, up to an optional deadline.
+    """
+
+    def __init__(self,
+                 initial: int = 8,
+                 min_limit: int = 1,
+                 max_limit: int = 64,
+                 backoff: float = 0.5,
+                 latency_tolerance: Optional[float] = None,
+                 max_wait: Optional[float] = None,
+                 name: Optional[Text] = None):
+        """
+        Args:
+            initial: Starting number of requests in flight
+            min_limit: Lowest limit
+            max_limit: Highest limit
+            backoff: Factor applied to the limit on overload
+            latency_tolerance: Latency relative to the best recent one above which
+                a call counts as overload, None to adapt on errors only
+            max_wait: Default longest wait in seconds, None to wait as long as needed
+            name: Label used in logs and metrics
+        """
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.max_wait = max_wait
+        self.name = name
+        self.inflight = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.last_decrease = 0.0
+        self._lock = threading.Lock()
+        self._waiters = deque()
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self, deadline: Optional[float] = None) -> Permit:
+        """
+        Wait for a request slot.
+
+        Args:
+            deadline: Absolute `time.monotonic()` deadline; defaults to now + max_wait
+
+        Raises:
+            ConcurrencyTimeout: when no slot frees up before the deadline
+        """
+        with self._lock:
+            if not self._waiters and self.inflight < int(self.limit):
+                self.inflight += 1
+                return Permit(self)
+            future = asyncio.get_running_loop().create_future()
+            self._waiters.append(future)
+        if deadline is None and self.max_wait is not None:
+            deadline = time.monotonic() + self.max_wait
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        try:
+            # shielded, so a timeout cannot cancel a slot that was granted meanwhile
+            await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            if self._withdraw(future):
+                raise ConcurrencyTimeout(f"No request slot of {self.name} free within the deadline "
+                                         f"({int(self.limit)} in flight)")
+        except BaseException:
+            if not self._withdraw(future):
+                self.release(None, False)
+            raise
+        return Permit(self)
+
+    def _withdraw(self, future: asyncio.Future) -> bool:
+        """Remove a waiter; False when it was already granted a slot."""
+        with self._lock:
+            if future in self._waiters:
+                self._waiters.remove(future)
+                return True
+            return False
+
+    def _grant(self):
+        """Hand free slots to the waiters in line. Called with the lock held."""
+        while self._waiters and self.inflight < int(self.limit):
+            future = self._waiters.popleft()
+            self.inflight += 1
+            future.get_loop().call_soon_threadsafe(_set_granted, future)
+
+    def release(self, latency: Optional[float], overloaded: bool):
+        """Free a slot and adapt the limit to the outcome of the call."""
+        with self._lock:
+            self.inflight -= 1
+            if latency is not None:
+                if not overloaded and self.latency_tolerance and self.latencies \
+                        and latency > self.latency_tolerance * min(self.latencies):
+                    overloaded = True
+                self.latencies.append(latency)
+                self._adapt(overloaded)
+            self._grant()
+
+    def _adapt(self, overloaded: bool):
+        now = time.monotonic()
+        if overloaded:
+            # the calls in flight during one latency period see the same overload, cut once for them
+            if now - self.last_decrease < min(self.latencies):
+                return
+            previous = int(self.limit)
+            self.limit = max(self.min_limit, self.limit * self.backoff)
+            self.last_decrease = now
+            if int(self.limit) != previous:
+                logger.warning(f"Concurrency limiter [{self.name}] lowered the limit to {int(self.limit)}")
+        elif self.inflight + 1 >= self.limit / 2:
+            # only grow a limit that is being used
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def as_dict(self) -> Dict[Text, Any]:
+        return {"limit": int(self.limit), "inflight": self.inflight, "queued": self.queued}
+
+    @classmethod
+    def for_model(cls, endpoint: Text, model: Optional[Text],
+                  concurrency: Optional[Dict[Text, Any]] = None) -> Optional["ConcurrencyLimiter"]:
+        """
+        Return the process-wide limiter of an endpoint and model, configured by the
+        `concurrency` section of a chat model, profile or embedding model in config.yml:
+
+            llm:
+              chat:
+                model: gpt-4o
+                concurrency:
+                  initial: 8
+                  min: 1
+                  max: 64
+                  latency_tolerance: 3.0
+                  max_wait: 30
+
+        Returns None when no limiter is configured.
+        """
+        if not concurrency:
+            return None
+        return registry.get((endpoint, model), concurrency if isinstance(concurrency, Dict) else {})
+
+
+def _set_granted(future: asyncio.Future):
+    if not future.done():
+        future.set_result(True)
+
+
+class ConcurrencyLimiterRegistry:
+    def __init__(self):
+        self._limiters: Dict[Tuple[Text, Optional[Text]], ConcurrencyLimiter] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple[Text, Optional[Text]], concurrency: Dict[Text, Any]) -> ConcurrencyLimiter:
+        with self._lock:
+            limiter = self._limiters.get(key)
+            if limiter is None:
+                limiter = self._limiters[key] = ConcurrencyLimiter(
+                    initial=concurrency.get("initial", 8),
+                    min_limit=concurrency.get("min", 1),
+                    max_limit=concurrency.get("max", 64),
+                    backoff=concurrency.get("backoff", 0.5),
+                    latency_tolerance=concurrency.get("latency_tolerance"),
+                    max_wait=concurrency.get("max_wait"),
+                    name=f"{key[0]} {key[1]}")
+            return limiter
+
+    def snapshot(self) -> Dict[Text, Dict[Text, Any]]:
+        """Return {"<endpoint> <model>": {limit, inflight, queued}}."""
+        with self._lock:
+            return {limiter.name: limiter.as_dict() for limiter in self._limiters.values()}
+
+
+registry = ConcurrencyLimiterRegistry()
@@ -1 +1,39 @@
 OPENAI_CHAT_URL = "https://api.openai.com/v1/chat/completions"
+
+# Call classes used to route LLM calls to model profiles and to report latency
+CALL_CONDITION = "condition"
+CALL_ROUTING = "routing"
+CALL_EXTRACTION = "extraction"
+CALL_GENERATION = "generation"
+CALL_KB_ANSWER = "kb_answer"
+CALL_FALLBACK = "fallback"
+CALL_SUMMARY = "summary"
+CALL_CLASSES = (CALL_CONDITION, CALL_ROUTING, CALL_EXTRACTION, CALL_GENERATION, CALL_KB_ANSWER, CALL_FALLBACK,
+                CALL_SUMMARY)
+UNCLASSIFIED_CALL = "unclassified"
+
+# Generation limits of the built-in classification calls: a condition answers
+# "True"/"False", agent selection answers one agent name, read from the first
+# non-blank line of the reply (no newline stop: replies may start with one)
+CONDITION_MAX_TOKENS = 5
+ROUTING_MAX_TOKENS = 32
+# Generation limit of a rolling conversation summary
+SUMMARY_MAX_TOKENS = 256
+
+# How LLMAgent prompts combine the shared history with the agent's own chat messages
+# (`llm.history_mode`): deduplicated sends each turn once, full repeats the agent's
+# own turns in the shared history as well
+HISTORY_DEDUPLICATED = "deduplicated"
+HISTORY_FULL = "full"
+HISTORY_MODES = (HISTORY_DEDUPLICATED, HISTORY_FULL)
+
+# Token budgets of the conversation history included in each call class's prompt once
+# an `llm.history_budget` section is configured, overridable per class (null means unlimited)
+DEFAULT_HISTORY_BUDGETS = {
+    CALL_CONDITION: 1000,
+    CALL_ROUTING: 2000,
+    CALL_EXTRACTION: 2000,
+    CALL_GENERATION: 3000,
+    CALL_KB_ANSWER: 1000,
+    CALL_FALLBACK: 2000,
+}
@@ -1,9 +1,12 @@
+import asyncio
 import json
+import weakref
 from typing import List, Optional, Dict, Text
 
 import httpx
 from langchain_core.embeddings import Embeddings
 
+from mica.llm.concurrency import ConcurrencyLimiter
 from mica.utils import logger
 
 
@@ -19,6 +22,8 @@ class CustomEmbedding(Embeddings):
                  model: Optional[Text] = "text-embedding-ada-002",
                  headers: Optional[Dict] = None,
                  timeout: Optional[int] = 60,
+                 max_connections: Optional[int] = 20,
+                 concurrency: Optional[Dict] = None,
                  **kwargs):
         """
         Initialize a custom embedding model.
@@ -29,6 +34,9 @@ class CustomEmbedding(Embeddings):
             model: Model name to use for embeddings
             headers: Optional custom headers
             timeout: Request timeout in seconds
+            max_connections: Size of the connection pool used by the async client
+            concurrency: Optional adaptive limit on async requests in flight, shared by
+                every bot in the process (see ConcurrencyLimiter.for_model)
         """
         self.server = server.rstrip('/')
         self.model = model
@@ -49,7 +57,13 @@ class CustomEmbedding(Embeddings):
             if 'Authorization' not in self.headers:
                 self.headers['Authorization'] = f"Bearer {api_key}"
         
+        self.max_connections = max_connections
         self.client = httpx.Client(timeout=timeout)
+        # Pooled clients for the async path, so query-time embedding never blocks the event loop.
+        # Pooled connections are bound to the loop that opened them, so keep one client per loop
+        # (bulk indexing at load time runs on its own loop).
+        self._async_clients = weakref.WeakKeyDictionary()
+        self.concurrency_limiter = ConcurrencyLimiter.for_model(self.url, self.model, concurrency)
         logger.info(f"Initialized CustomEmbedding with server: {self.url}, model: {self.model}")
 
     @classmethod
@@ -96,6 +110,31 @@ class CustomEmbedding(Embeddings):
         embeddings = self._get_embeddings([text])
         return embeddings[0] if embeddings else []
 
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Asynchronously embed a list of documents.
+
+        Args:
+            texts: List of text strings to embed
+
+        Returns:
+            List of embedding vectors
+        """
+        return await self._aget_embeddings(texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """
+        Asynchronously embed a single query text.
+
+        Args:
+            text: Text string to embed
+
+        Returns:
+            Embedding vector
+        """
+        embeddings = await self._aget_embeddings([text])
+        return embeddings[0] if embeddings else []
+
     def _get_embeddings(self, texts: List[str]) -> List[List[float]]:
         """
         Get embeddings from the API.
@@ -120,38 +159,109 @@ class CustomEmbedding(Embeddings):
                 headers=self.headers,
                 json=payload
             )
-            
-            if response.status_code == 200:
-                response_json = response.json()
+            return self._parse_response(response)
                 
-                # Parse embeddings from response
-                if "data" in response_json:
-                    # Sort by index to maintain order
-                    embeddings_data = sorted(
-                        response_json["data"],
-                        key=lambda x: x.get("index", 0)
-                    )
-                    embeddings = [item["embedding"] for item in embeddings_data]
-                    logger.debug(f"Successfully got {len(embeddings)} embeddings")
-                    return embeddings
-                else:
-                    logger.error(f"Unexpected response format: {response_json}")
-                    return []
-            else:
-                logger.error(
-                    f"Embedding request failed with status {response.status_code}: "
-                    f"{response.text}"
+        except Exception as e:
+            logger.error(f"Error calling custom embedding API: {str(e)}")
+            return []
+
+    async def _aget_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """
+        Get embeddings from the API without blocking the event loop.
+
+        Args:
+            texts: List of text strings to embed
+
+        Returns:
+            List of embedding vectors
+        """
+        payload = {
+            "model": self.model,
+            "input": texts
+        }
+
+        try:
+            logger.debug(f"Sending async embedding request to: {self.url}")
+            logger.debug(f"Embedding {len(texts)} texts")
+
+            permit = None
+            if self.concurrency_limiter is not None:
+                permit = await self.concurrency_limiter.acquire()
+            try:
+                response = await self.async_client().post(
+                    self.url,
+                    headers=self.headers,
+                    json=payload
                 )
-                return []
-                
+            except BaseException as e:
+                if permit is not None:
+                    permit.release(overloaded=isinstance(e, httpx.TimeoutException))
+                raise
+            if permit is not None:
+                permit.release(overloaded=response.status_code == 429 or response.status_code >= 500)
+            return self._parse_response(response)
+
         except Exception as e:
             logger.error(f"Error calling custom embedding API: {str(e)}")
             return []
 
+    def async_client(self) -> httpx.AsyncClient:
+        """Return the pooled async client of the running event loop."""
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections)
+            )
+            self._async_clients[loop] = client
+        return client
+
+    @staticmethod
+    def _parse_response(response: httpx.Response) -> List[List[float]]:
+        """
+        Parse an OpenAI-compatible embedding response.
+
+        Args:
+            response: The HTTP response returned by the embedding server
+
+        Returns:
+            List of embedding vectors, empty if the request failed
+        """
+        if response.status_code != 200:
+            logger.error(
+                f"Embedding request failed with status {response.status_code}: "
+                f"{response.text}"
+            )
+            return []
+
+        response_json = response.json()
+
+        # Parse embeddings from response
+        if "data" not in response_json:
+            logger.error(f"Unexpected response format: {response_json}")
+            return []
+
+        # Sort by index to maintain order
+        embeddings_data = sorted(
+            response_json["data"],
+            key=lambda x: x.get("index", 0)
+        )
+        embeddings = [item["embedding"] for item in embeddings_data]
+        logger.debug(f"Successfully got {len(embeddings)} embeddings")
+        return embeddings
+
     def close(self):
         """Close the HTTP client."""
         self.client.close()
 
+    async def aclose(self):
+        """Close the async HTTP client of the running event loop."""
+        client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
     def __del__(self):
         """Cleanup when object is destroyed."""
         try:
@@ -3,8 +3,11 @@ from typing import Any, Optional, Dict, Text, List
 
 import httpx
 
-from mica.event import BotUtter, FunctionCall
 from mica.llm.base import BaseModel
+from mica.llm.concurrency import ConcurrencyLimiter
+from mica.llm.openai_compat import build_chat_payload, parse_chat_response, post_chat_completion, \
+    generation_overrides, STRUCTURED_NONE
+from mica.llm.rate_limiter import RateLimiter
 from mica.tracker import Tracker
 from mica.utils import logger
 
@@ -26,6 +29,9 @@ class CustomLLMModel(BaseModel):
                  max_tokens: Optional[int] = 512,
                  headers: Optional[Dict] = None,
                  timeout: Optional[int] = 60,
+                 structured_output: Optional[Text] = STRUCTURED_NONE,
+                 rate_limit: Optional[Dict] = None,
+                 concurrency: Optional[Dict] = None,
                  **kwargs):
         """
         Initialize a custom LLM model.
@@ -41,6 +47,11 @@ class CustomLLMModel(BaseModel):
             max_tokens: Maximum tokens to generate
             headers: Optional custom headers
             timeout: Request timeout in seconds
+            structured_output: How the reply envelope is enforced: 'none', 'json_schema'
+                (response_format) or 'tool' (forced function call)
+            rate_limit: Optional {rpm, tpm, max_wait} limits shared by every bot in the process
+            concurrency: Optional adaptive limit on requests in flight, shared by every bot
+                in the process (see ConcurrencyLimiter.for_model)
         """
         self.server = server.rstrip('/')
         self.model = model
@@ -50,6 +61,7 @@ class CustomLLMModel(BaseModel):
         self.frequency_penalty = frequency_penalty
         self.max_tokens = max_tokens
         self.timeout = timeout
+        self.structured_output = structured_output or STRUCTURED_NONE
         
         # Construct the full URL
         if '/v1/chat/completions' not in self.server:
@@ -67,6 +79,9 @@ class CustomLLMModel(BaseModel):
                 self.headers['Authorization'] = f"Bearer {api_key}"
         
         self.client = httpx.AsyncClient(timeout=timeout)
+        # shared by every bot using the same endpoint and model
+        self.rate_limiter = RateLimiter.for_model(self.url, self.model, rate_limit)
+        self.concurrency_limiter = ConcurrencyLimiter.for_model(self.url, self.model, concurrency)
         logger.info(f"Initialized CustomLLMModel with server: {self.url}, model: {self.model}")
 
     @classmethod
@@ -93,6 +108,8 @@ class CustomLLMModel(BaseModel):
                                tracker: Optional[Tracker] = None,
                                functions: Optional[Any] = None,
                                provider: Optional[Text] = None,
+                               response_schema: Optional[Dict] = None,
+                               deadline: Optional[float] = None,
                                **kwargs: Any) -> List:
         """
         Generate a message using the custom LLM API.
@@ -102,58 +119,28 @@ class CustomLLMModel(BaseModel):
             tracker: Optional conversation tracker
             functions: Optional list of function definitions
             provider: Optional provider name
+            response_schema: Optional envelope schema, used in structured output mode
+            deadline: Optional time.monotonic() deadline for waiting on the rate and concurrency limiters
+            **kwargs: Per-call overrides of max_tokens, temperature, stop, logit_bias,
+                response_format, ...
             
         Returns:
             List of events (BotUtter or FunctionCall)
         """
-        formatted_prompts = self._generate_prompts(prompts, functions)
+        formatted_prompts = self._generate_prompts(prompts, functions, response_schema,
+                                                  generation_overrides(kwargs))
         llm_result = []
 
         logger.debug(f"Sending request to: {self.url}")
         logger.debug(f"Request payload: {json.dumps(formatted_prompts, indent=2, ensure_ascii=False)}")
         
         try:
-            response = await self.client.post(
-                self.url,
-                headers=self.headers,
-                json=formatted_prompts
-            )
+            response = await post_chat_completion(self, formatted_prompts, deadline)
             
             logger.debug(f"Response status: {response.status_code}")
             
             if response.status_code == 200:
-                response_json = response.json()
-                
-                if (response_json is not None 
-                        and response_json.get("choices") is not None 
-                        and len(response_json.get("choices")) > 0):
-                    
-                    message: Dict = response_json.get("choices")[0].get("message")
-                    logger.debug(f"LLM message: \n{json.dumps(message, indent=2, ensure_ascii=False)}")
-                    
-                    # Handle text content
-                    if message.get("content") is not None:
-                        next_response_text = message.get("content")
-                        llm_result.append(BotUtter(
-                            text=next_response_text,
-                            metadata=provider,
-                            additional=message
-                        ))
-
-                    # Handle function/tool calls
-                    if message.get("tool_calls") is not None:
-                        for func in message["tool_calls"]:
-                            func_details = func["function"]
-                            name = func_details.get("name")
-                            args = json.loads(func_details.get("arguments"))
-                            call_id = func.get("id")
-
-                            llm_result.append(FunctionCall(
-                                function_name=name,
-                                args=args,
-                                call_id=call_id,
-                                metadata=message
-                            ))
+                llm_result = parse_chat_response(response.json(), provider, response_schema)
             else:
                 logger.error(f"LLM request failed with status {response.status_code}: {response.text}")
                 
@@ -162,38 +149,24 @@ class CustomLLMModel(BaseModel):
             
         return llm_result
 
-    def _generate_prompts(self, prompts: Any, functions: Optional[List] = None) -> Dict:
+    def _generate_prompts(self,
+                          prompts: Any,
+                          functions: Optional[List] = None,
+                          response_schema: Optional[Dict] = None,
+                          overrides: Optional[Dict] = None) -> Dict:
         """
         Format prompts into the API request format.
         
         Args:
             prompts: List of message dictionaries
             functions: Optional list of function definitions
+            response_schema: Optional envelope schema, used in structured output mode
+            overrides: Optional per-call generation settings (max_tokens, stop, ...)
             
         Returns:
             Dictionary ready to be sent as JSON
         """
-        data = {
-            "model": self.model,
-            "messages": prompts,
-            "temperature": self.temperature,
-            "top_p": self.top_p,
-            "presence_penalty": self.presence_penalty,
-            "frequency_penalty": self.frequency_penalty,
-            "max_tokens": self.max_tokens,
-        }
-        
-        if functions is not None and len(functions) > 0:
-            tools = []
-            for function in functions:
-                tools.append({
-                    "type": "function",
-                    "function": function
-                })
-            data["tools"] = tools
-            data["tool_choice"] = "auto"
-
-        return data
+        return build_chat_payload(self, prompts, functions, response_schema, overrides)
 
     async def close(self):
         """Close the HTTP client."""
@@ -0,0 +1,65 @@
+import asyncio
+from typing import Optional, Dict, Text, Any, List, Tuple
+
+from mica.event import Event
+from mica.utils import logger
+
+
+def embedding_key(embeddings: Any) -> Tuple:
+    """Models with the same class, endpoint and model name give the same vectors."""
+    url = getattr(embeddings, "url", None) or getattr(embeddings, "openai_api_base", None)
+    model = getattr(embeddings, "model", None)
+    if url is None and model is None:
+        return type(embeddings).__name__, id(embeddings)
+    return type(embeddings).__name__, url, model
+
+
+class TurnEmbeddings:
+    """
+    Embeddings of one user message. Each embedding model computes it at most
+    once, and every component of the turn (KB retrieval, the claim fast path,
+    ...) awaits the same future, including one started ahead by prefetch().
+    """
+
+    def __init__(self, message: Event):
+        self.message = message
+        self._tasks: Dict[Tuple, asyncio.Future] = {}
+
+    def start(self, embeddings: Any) -> asyncio.Future:
+        key = embedding_key(embeddings)
+        task = self._tasks.get(key)
+        if task is None:
+            task = self._tasks[key] = asyncio.ensure_future(embeddings.aembed_query(self.message.text))
+            # a prefetched embedding nobody awaits must not log an unretrieved exception
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return task
+
+    async def get(self, embeddings: Any) -> List[float]:
+        # shielded, so a cancelled consumer does not cancel the others
+        return await asyncio.shield(self.start(embeddings))
+
+
+def _turn_embeddings(tracker: Any) -> TurnEmbeddings:
+    memo = tracker.turn_embeddings
+    if memo is None or memo.message is not tracker.latest_message:
+        memo = tracker.turn_embeddings = TurnEmbeddings(tracker.latest_message)
+    return memo
+
+
+async def embed_user_message(tracker: Optional[Any], embeddings: Any, text: Optional[Text] = None) -> List[float]:
+    """
+    Embed the latest user message of `tracker`, once per turn and embedding model.
+    Other texts, or calls without a tracker, are embedded directly.
+    """
+    message = tracker.latest_message if tracker is not None else None
+    if message is None or (text is not None and text != message.text):
+        return await embeddings.aembed_query(text)
+    return await _turn_embeddings(tracker).get(embeddings)
+
+
+def prefetch(tracker: Any, models: List[Any]):
+    """Start embedding the latest user message with `models` while the turn begins."""
+    memo = _turn_embeddings(tracker)
+    for embeddings in models:
+        memo.start(embeddings)
+    logger.debug(f"Prefetching the embedding of the user message with {len(models)} model(s)")
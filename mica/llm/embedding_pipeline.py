@@ -0,0 +1,243 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Dict, Text, Any, Callable, Tuple
+
+from mica.llm.tokens import count_tokens
+from mica.utils import logger
+
+
+class EmbeddingPipelineError(Exception):
+    """Exception that can be raised when some batches still fail after all retries."""
+
+
+class EmbeddingPipeline:
+    """
+    Bulk embedding pipeline used to index knowledge bases.
+
+    Texts are grouped into batches bounded by both item count and token count, and
+    the batches are embedded by a fixed number of concurrent workers. Failed batches
+    are retried with exponential backoff. When a cache file is configured, every
+    finished batch is appended to it, so an interrupted indexing run resumes where
+    it stopped instead of starting over. After a complete run the file is rewritten
+    with the current texts only, so it does not grow with every edit of the
+    knowledge base.
+
+    Batches that still fail after the retries raise EmbeddingPipelineError, so a
+    knowledge base that cannot be indexed fails bot loading instead of leaving
+    the KB agent without its documents.
+    """
+
+    def __init__(self,
+                 embeddings: Any,
+                 batch_size: int = 64,
+                 max_batch_tokens: int = 8000,
+                 max_concurrency: int = 4,
+                 max_retries: int = 3,
+                 retry_backoff: float = 1.0,
+                 cache_path: Optional[Text] = None,
+                 progress_callback: Optional[Callable[[int, int], None]] = None):
+        """
+        Args:
+            embeddings: Any langchain `Embeddings` implementation
+            batch_size: Maximum number of texts in one request
+            max_batch_tokens: Maximum number of tokens in one request
+            max_concurrency: Maximum number of requests in flight
+            max_retries: Number of retries of a failed batch
+            retry_backoff: Initial delay between retries in seconds, doubled on every retry
+            cache_path: Optional JSONL file used to resume interrupted runs
+            progress_callback: Optional callable receiving (embedded, total) after every batch
+        """
+        self.embeddings = embeddings
+        self.batch_size = max(1, batch_size)
+        self.max_batch_tokens = max_batch_tokens
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.cache_path = cache_path
+        self.progress_callback = progress_callback
+        self.model = getattr(embeddings, "model", None)
+
+    @classmethod
+    def create(cls,
+               embeddings: Any,
+               embedding_config: Optional[Dict[Text, Any]] = None,
+               cache_name: Optional[Text] = None):
+        """
+        Create a pipeline from the `llm.embedding` section of config.yml, e.g.
+
+            llm:
+              embedding:
+                provider: custom
+                server: http://localhost:8001
+                batch_size: 128
+                max_batch_tokens: 8000
+                max_concurrency: 8
+                max_retries: 3
+                index_cache_dir: ./.index_cache
+        """
+        embedding_config = embedding_config or {}
+        cache_path = None
+        if embedding_config.get("index_cache_dir") and cache_name:
+            cache_path = os.path.join(embedding_config["index_cache_dir"], f"{cache_name}.jsonl")
+        return cls(embeddings,
+                   batch_size=embedding_config.get("batch_size", 64),
+                   max_batch_tokens=embedding_config.get("max_batch_tokens", 8000),
+                   max_concurrency=embedding_config.get("max_concurrency", 4),
+                   max_retries=embedding_config.get("max_retries", 3),
+                   retry_backoff=embedding_config.get("retry_backoff", 1.0),
+                   cache_path=cache_path)
+
+    def make_batches(self, texts: List[Text]) -> List[List[int]]:
+        """Group text indices into batches bounded by item count and token count."""
+        batches = []
+        current = []
+        current_tokens = 0
+        for idx, text in enumerate(texts):
+            tokens = count_tokens(text, self.model)
+            if current and (len(current) >= self.batch_size
+                            or current_tokens + tokens > self.max_batch_tokens):
+                batches.append(current)
+                current = []
+                current_tokens = 0
+            current.append(idx)
+            current_tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    def embed(self, texts: List[Text]) -> List[List[float]]:
+        """
+        Synchronous entrypoint. Bots are loaded synchronously, sometimes from inside a
+        running event loop (e.g. the deploy endpoint), so the pipeline then runs on its
+        own loop in a worker thread.
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self.aembed(texts))
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            return executor.submit(asyncio.run, self.aembed(texts)).result()
+
+    async def aembed(self, texts: List[Text]) -> List[List[float]]:
+        """Embed all texts, returning the vectors in input order."""
+        keys = [self._cache_key(text) for text in texts]
+        cached, cache_lines = self._load_cache()
+        vectors: List[Optional[List[float]]] = [cached.get(key) for key in keys]
+        pending = [idx for idx, vector in enumerate(vectors) if vector is None]
+        if len(pending) < len(texts):
+            logger.info(f"Resuming embedding: {len(texts) - len(pending)}/{len(texts)} chunks found in cache")
+
+        batches = [[pending[i] for i in batch]
+                   for batch in self.make_batches([texts[idx] for idx in pending])]
+        queue: asyncio.Queue = asyncio.Queue()
+        for batch in batches:
+            queue.put_nowait(batch)
+
+        total = len(texts)
+        progress = {"done": total - len(pending), "embedded": 0, "start": time.time()}
+        failed: List[Tuple[List[int], Exception]] = []
+
+        async def worker():
+            while True:
+                try:
+                    batch = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                try:
+                    result = await self._embed_batch([texts[idx] for idx in batch])
+                except Exception as e:
+                    logger.error(f"Embedding batch of {len(batch)} chunks failed after "
+                                 f"{self.max_retries} retries: {e}")
+                    failed.append((batch, e))
+                    continue
+                for idx, vector in zip(batch, result):
+                    vectors[idx] = vector
+                self._append_cache([(keys[idx], vectors[idx]) for idx in batch])
+                self._report_progress(progress, len(batch), total)
+
+        workers = [asyncio.create_task(worker())
+                   for _ in range(min(self.max_concurrency, len(batches)))]
+        await asyncio.gather(*workers)
+        await self._close_client()
+
+        if failed:
+            failed_chunks = sum(len(batch) for batch, _ in failed)
+            raise EmbeddingPipelineError(f"{failed_chunks}/{total} chunks could not be embedded "
+                                         f"({len(failed)} failed batches). Last error: {failed[-1][1]}")
+        if cache_lines > len(set(keys)):
+            # entries of texts that are gone, or duplicates
+            self._write_cache(keys, vectors)
+        return vectors
+
+    async def _embed_batch(self, batch: List[Text]) -> List[List[float]]:
+        delay = self.retry_backoff
+        attempt = 0
+        while True:
+            try:
+                result = await self.embeddings.aembed_documents(batch)
+                # CustomEmbedding reports failures as an empty result instead of raising
+                if len(result) != len(batch) or any(not vector for vector in result):
+                    raise EmbeddingPipelineError(f"expected {len(batch)} embeddings, got {len(result)}")
+                return result
+            except Exception as e:
+                if attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                logger.warning(f"Embedding batch failed ({e}), retry {attempt}/{self.max_retries} in {delay}s")
+                await asyncio.sleep(delay)
+                delay *= 2
+
+    def _report_progress(self, progress: Dict, batch_len: int, total: int):
+        progress["done"] += batch_len
+        progress["embedded"] += batch_len
+        elapsed = max(time.time() - progress["start"], 1e-6)
+        logger.info(f"Embedded {progress['done']}/{total} chunks "
+                    f"({progress['done'] * 100 // max(total, 1)}%, {progress['embedded'] / elapsed:.0f} chunks/s)")
+        if self.progress_callback is not None:
+            self.progress_callback(progress["done"], total)
+
+    def _cache_key(self, text: Text) -> Text:
+        return hashlib.sha256(f"{self.model}\0{text}".encode("utf-8")).hexdigest()
+
+    def _load_cache(self) -> Tuple[Dict[Text, List[float]], int]:
+        """Return the cached vectors by key, and the number of lines of the cache file."""
+        if self.cache_path is None or not os.path.exists(self.cache_path):
+            return {}, 0
+        cached = {}
+        lines = 0
+        with open(self.cache_path, "r", encoding="utf-8") as f:
+            for line in f:
+                lines += 1
+                try:
+                    item = json.loads(line)
+                except json.JSONDecodeError:
+                    # a partially written last line from an interrupted run
+                    continue
+                cached[item["key"]] = item["embedding"]
+        return cached, lines
+
+    def _append_cache(self, items: List[Tuple[Text, List[float]]]):
+        if self.cache_path is None:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.cache_path)), exist_ok=True)
+        with open(self.cache_path, "a", encoding="utf-8") as f:
+            for key, vector in items:
+                f.write(json.dumps({"key": key, "embedding": vector}) + "\n")
+
+    def _write_cache(self, keys: List[Text], vectors: List[List[float]]):
+        """Replace the cache file with the entries of the current texts."""
+        path = f"{self.cache_path}.tmp"
+        with open(path, "w", encoding="utf-8") as f:
+            for key, vector in dict(zip(keys, vectors)).items():
+                f.write(json.dumps({"key": key, "embedding": vector}) + "\n")
+        os.replace(path, self.cache_path)
+
+    async def _close_client(self):
+        # the pipeline may run on a short-lived loop; release the connections opened on it
+        aclose = getattr(self.embeddings, "aclose", None)
+        if aclose is not None:
+            await aclose()
@@ -0,0 +1,511 @@
+"""
+An offline, OpenAI-compatible fake LLM and embedding server for load and latency testing.
+
+It serves `/v1/chat/completions` and `/v1/embeddings`, so `CustomLLMModel`,
+`CustomEmbedding` and `OpenAIModel(server=...)` can point at it unchanged:
+
+    python -m mica.llm.fake_server --port 8000 --config fake_server.yml
+
+and in the bot's config.yml:
+
+    llm:
+      chat:
+        provider: custom
+        server: http://localhost:8000
+      embedding:
+        provider: custom
+        server: http://localhost:8000
+
+Replies are produced by, in order: a script (replies consumed in sequence), user
+rules (regex -> reply), and built-in responders that recognise MICA's own prompts
+(LLM agent JSON envelopes, "True"/"False" condition checks, multi-branch classification,
+ensemble agent selection, flow agent extraction, KB answers and conversation summaries). Embeddings are deterministic hashed
+bag-of-words vectors, so similar texts get similar vectors.
+
+Example configuration:
+
+    seed: 42
+    chat:
+      latency: {distribution: lognormal, mean: 0.8, sigma: 0.3}
+      per_output_token: 0.02    # extra seconds per generated token
+      ramble: 0                 # filler words appended to replies, to simulate verbose models
+      error_rate: 0.01          # share of requests answered with HTTP 500
+      rate_limit_rate: 0.05     # share of requests answered with HTTP 429
+      script:
+        - '{"bot": "Hi, how can I help?", "status": "running"}'
+      rules:
+        - match: "refund"       # regex searched in the latest user message
+          response: '{"bot": "Refunds take 5 days.", "status": "running"}'
+        - match: "select an agent"
+          target: system        # search the system message instead
+          response: "customer_complain"
+        - match: "weather"
+          tool_call: {name: get_weather, arguments: {city: Paris}}
+    embeddings:
+      dimensions: 256
+      latency: {distribution: uniform, min: 0.02, max: 0.05}
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import random
+import re
+import socket
+import threading
+import time
+from typing import Any, Dict, List, Optional, Text, Callable, Tuple
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+from starlette.requests import ClientDisconnect
+
+from mica.llm.tokens import count_message_tokens, count_tokens, CHARS_PER_TOKEN
+from mica.utils import logger, read_yaml_file, extract_json_object
+
+DEFAULT_DIMENSIONS = 256
+WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def fake_embedding(text: Text, dimensions: int = DEFAULT_DIMENSIONS) -> List[float]:
+    """
+    Deterministic embedding: words and character trigrams are hashed into a fixed
+    number of buckets and the vector is L2-normalised.
+    """
+    vector = [0.0] * dimensions
+    words = WORD_PATTERN.findall((text or "").lower())
+    features = list(words)
+    for word in words:
+        padded = f"#{word}#"
+        features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+    for feature in features:
+        digest = hashlib.md5(feature.encode("utf-8")).digest()
+        bucket = int.from_bytes(digest[:4], "little") % dimensions
+        sign = 1.0 if digest[4] & 1 else -1.0
+        vector[bucket] += sign
+    norm = math.sqrt(sum(v * v for v in vector))
+    if norm == 0:
+        vector[0] = 1.0
+        return vector
+    return [v / norm for v in vector]
+
+
+def cosine(a: List[float], b: List[float]) -> float:
+    return sum(x * y for x, y in zip(a, b))
+
+
+def similarity(a: Text, b: Text) -> float:
+    return cosine(fake_embedding(a), fake_embedding(b))
+
+
+class LatencyModel:
+    """Samples a response delay (seconds) from a configured distribution."""
+
+    def __init__(self, config: Optional[Dict[Text, Any]] = None, rng: Optional[random.Random] = None):
+        self.config = config or {}
+        self.rng = rng or random.Random()
+
+    def sample(self) -> float:
+        distribution = self.config.get("distribution", "fixed")
+        if distribution == "fixed":
+            delay = self.config.get("value", 0.0)
+        elif distribution == "uniform":
+            delay = self.rng.uniform(self.config.get("min", 0.0), self.config.get("max", 0.0))
+        elif distribution == "normal":
+            delay = self.rng.gauss(self.config.get("mean", 0.0), self.config.get("stddev", 0.0))
+        elif distribution == "lognormal":
+            # `mean` is the median delay in seconds, `sigma` the spread of the log
+            mean = max(self.config.get("mean", 0.0), 1e-9)
+            delay = self.rng.lognormvariate(math.log(mean), self.config.get("sigma", 0.0))
+        elif distribution == "exponential":
+            mean = self.config.get("mean", 0.0)
+            delay = self.rng.expovariate(1.0 / mean) if mean > 0 else 0.0
+        else:
+            raise ValueError(f"Unknown latency distribution: {distribution}")
+        if self.config.get("max_delay") is not None:
+            delay = min(delay, self.config["max_delay"])
+        return max(0.0, delay)
+
+
+def _latest_user_text(messages: List[Dict]) -> Text:
+    for message in reversed(messages):
+        if message.get("role") == "user" and isinstance(message.get("content"), Text):
+            return message["content"]
+    return ""
+
+
+def _system_text(messages: List[Dict]) -> Text:
+    return "\n".join(m.get("content") or "" for m in messages if m.get("role") == "system")
+
+
+def _last_history_user_line(history: Text) -> Text:
+    lines = [line[len("User:"):].strip() for line in history.splitlines() if line.startswith("User:")]
+    return lines[-1] if lines else ""
+
+
+# Built-in responders. Each one receives the messages and the system text and
+# returns a reply, or None when the prompt is not the kind it understands.
+Responder = Callable[[List[Dict], Text], Optional[Text]]
+
+
+def respond_condition(messages: List[Dict], system: Text) -> Optional[Text]:
+    if "respond with ‘True’" not in system:
+        return None
+    user = _latest_user_text(messages)
+    targets_match = re.search(r"- Targets:\n(.*?)\n- Previous Conversation", user, re.S)
+    sentence_match = re.search(r'Does sentence "(.*)" have the same meaning', user, re.S)
+    if not targets_match or not sentence_match:
+        return "False"
+    sentence = sentence_match.group(1)
+    targets = [t for t in targets_match.group(1).splitlines() if t.strip()]
+    best = max((similarity(sentence, target) for target in targets), default=0.0)
+    return "True" if best >= 0.6 else "False"
+
+
+def respond_branches(messages: List[Dict], system: Text) -> Optional[Text]:
+    if "numbered options, each with some target sentences" not in system:
+        return None
+    user = _latest_user_text(messages)
+    options_match = re.search(r"- Options:\n(.*?)\n- Previous Conversation", user, re.S)
+    sentence_match = re.search(r'Which option does sentence "(.*)" match\?', user, re.S)
+    if not options_match or not sentence_match:
+        return "0"
+    sentence = sentence_match.group(1)
+    for line in options_match.group(1).splitlines():
+        option = re.match(r"(\d+)\. (.*)", line)
+        if option is None:
+            continue
+        targets = re.findall(r'"(.*?)"', option.group(2))
+        if max((similarity(sentence, target) for target in targets), default=0.0) >= 0.6:
+            return option.group(1)
+    return "0"
+
+
+def respond_agent_selection(messages: List[Dict], system: Text) -> Optional[Text]:
+    if "Your task is to select an agent" not in system:
+        return None
+    user_text = _last_history_user_line(_latest_user_text(messages))
+    agents_section = system.split("### AGENTS:\n", 1)[-1].split("\n\n", 1)[0]
+    kb_items = system.split("## KNOWLEDGE BASE:\n", 1)[-1].split("### ")[0] \
+        if "## KNOWLEDGE BASE:" in system else None
+    choice = _select_agent(user_text, agents_section, kb_items, "[Fallback]" in system)
+    if '{"agent":' not in system:
+        return choice
+    # fused routing and KB answering
+    answer = _best_kb_answer(user_text, kb_items) if choice == "[FAQ]" else ""
+    return json.dumps({"agent": choice, "answer": answer}, ensure_ascii=False)
+
+
+def _select_agent(user_text: Text, agents_section: Text, kb_items: Optional[Text], has_fallback: bool) -> Text:
+    best_name, best_score = None, 0.0
+    for line in agents_section.splitlines():
+        match = re.match(r"- ([^:]+): (.*)", line)
+        if match is None:
+            continue
+        score = similarity(user_text, f"{match.group(1)} {match.group(2)}")
+        if score > best_score:
+            best_name, best_score = match.group(1).strip(), score
+    if kb_items is not None:
+        kb_score = max((similarity(user_text, item) for item in kb_items.splitlines() if item.strip()),
+                       default=0.0)
+        if kb_score > best_score:
+            return "[FAQ]"
+    if best_name is not None and best_score >= 0.1:
+        return best_name
+    if has_fallback:
+        return "[Fallback]"
+    return "None"
+
+
+def _best_kb_answer(question: Text, context: Text) -> Text:
+    best_answer, best_score = None, 0.0
+    for match in re.finditer(r"(?:Question|Q): (.*)\n(?:Answer|A): (.*)", context):
+        score = similarity(question, match.group(1))
+        if score > best_score:
+            best_answer, best_score = match.group(2).strip(), score
+    if best_answer is None or best_score < 0.3:
+        return "No answer"
+    return best_answer
+
+
+def respond_flow_extraction(messages: List[Dict], system: Text) -> Optional[Text]:
+    if "Please reply in JSON format" not in system:
+        return None
+    user = _latest_user_text(messages)
+    if "## CONDITIONS" not in user:
+        return "{}"
+    # fused mode: decide each condition like respond_condition does
+    sentence_match = re.search(r'whether the latest user message "(.*)" has the same meaning', user)
+    sentence = sentence_match.group(1) if sentence_match else ""
+    decisions = {}
+    for match in re.finditer(r"^- (c\d+): (\[.*\])$", user, re.M):
+        targets = json.loads(match.group(2))
+        best = max((similarity(sentence, target) for target in targets), default=0.0)
+        decisions[match.group(1)] = best >= 0.6
+    return json.dumps({"conditions": decisions})
+
+
+def respond_kb_answer(messages: List[Dict], system: Text) -> Optional[Text]:
+    user = _latest_user_text(messages)
+    if "retrieved context to answer the question" not in user:
+        return None
+    question = re.search(r"Question: (.*)", user)
+    return _best_kb_answer(question.group(1) if question else "", user.split("Context:", 1)[-1])
+
+
+def respond_llm_agent(messages: List[Dict], system: Text) -> Optional[Text]:
+    if "Only output JSON structure" not in system:
+        return None
+    user = _latest_user_text(messages)
+    return json.dumps({"bot": f"I see. You said: {user}", "status": "running"}, ensure_ascii=False)
+
+
+def respond_fallback(messages: List[Dict], system: Text) -> Optional[Text]:
+    if "generate a bot response according to the conversation" not in system:
+        return None
+    return "I'm sorry, I didn't understand that. Can you please rephrase?"
+
+
+def respond_summary(messages: List[Dict], system: Text) -> Optional[Text]:
+    if "running summary of a conversation" not in system:
+        return None
+    user = _latest_user_text(messages)
+    said = [line[len("User:"):].strip() for line in user.splitlines() if line.startswith("User:")]
+    return "The user said: " + "; ".join(said) if said else "Nothing of note was said."
+
+
+DEFAULT_RESPONDERS: List[Responder] = [
+    respond_condition,
+    respond_branches,
+    respond_agent_selection,
+    respond_flow_extraction,
+    respond_kb_answer,
+    respond_llm_agent,
+    respond_fallback,
+    respond_summary,
+]
+
+
+class FakeLLMServer:
+    """Holds the configuration, random state and request statistics of the fake server."""
+
+    def __init__(self, config: Optional[Dict[Text, Any]] = None,
+                 responders: Optional[List[Responder]] = None):
+        self.config = config or {}
+        self.rng = random.Random(self.config.get("seed"))
+        self.chat_config = self.config.get("chat") or {}
+        self.embedding_config = self.config.get("embeddings") or {}
+        self.chat_latency = LatencyModel(self.chat_config.get("latency"), self.rng)
+        self.embedding_latency = LatencyModel(self.embedding_config.get("latency"), self.rng)
+        self.script = list(self.chat_config.get("script") or [])
+        self.rules = [self._compile_rule(rule) for rule in self.chat_config.get("rules") or []]
+        self.responders = responders if responders is not None else list(DEFAULT_RESPONDERS)
+        self.stats = {
+            "chat_requests": 0,
+            "embedding_requests": 0,
+            "embedded_texts": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "injected_errors": 0,
+            "injected_rate_limits": 0,
+        }
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _compile_rule(rule: Dict) -> Dict:
+        rule = dict(rule)
+        rule["pattern"] = re.compile(rule.get("match", ".*"), re.S | re.I)
+        return rule
+
+    def _inject_failure(self, endpoint_config: Dict) -> Optional[JSONResponse]:
+        roll = self.rng.random()
+        rate_limit_rate = endpoint_config.get("rate_limit_rate", 0.0)
+        error_rate = endpoint_config.get("error_rate", 0.0)
+        if roll < rate_limit_rate:
+            self.stats["injected_rate_limits"] += 1
+            return JSONResponse(status_code=429,
+                                headers={"Retry-After": str(endpoint_config.get("retry_after", 1))},
+                                content={"error": {"type": "rate_limit_exceeded",
+                                                   "message": "Rate limit reached (injected)."}})
+        if roll < rate_limit_rate + error_rate:
+            self.stats["injected_errors"] += 1
+            return JSONResponse(status_code=500,
+                                content={"error": {"type": "server_error",
+                                                   "message": "Internal error (injected)."}})
+        return None
+
+    def reply(self, messages: List[Dict]) -> Tuple[Optional[Text], Optional[Dict]]:
+        """Return (text, tool_call) for a chat request."""
+        with self._lock:
+            if self.script:
+                item = self.script.pop(0)
+                if isinstance(item, Dict):
+                    return item.get("response"), item.get("tool_call")
+                return item, None
+
+        system = _system_text(messages)
+        for rule in self.rules:
+            target = system if rule.get("target") == "system" else _latest_user_text(messages)
+            if rule["pattern"].search(target or ""):
+                return rule.get("response"), rule.get("tool_call")
+
+        for responder in self.responders:
+            text = responder(messages, system)
+            if text is not None:
+                return text, None
+        return self.chat_config.get("default_response", "OK"), None
+
+    def _limit_output(self, text: Optional[Text], body: Dict) -> Tuple[Optional[Text], Text]:
+        """Apply `ramble`, `stop` and `max_tokens` to a text reply, returning (text, finish_reason)."""
+        if text is None:
+            return text, "stop"
+        ramble = self.chat_config.get("ramble", 0)
+        if ramble:
+            # simulate a verbose model that explains its answer
+            text += "\n" + " ".join(["because"] * ramble)
+        stop = body.get("stop")
+        for sequence in [stop] if isinstance(stop, Text) else stop or []:
+            if sequence and sequence in text:
+                text = text[:text.index(sequence)]
+        max_tokens = body.get("max_tokens")
+        if max_tokens is not None and count_tokens(text) > max_tokens:
+            return text[:max_tokens * CHARS_PER_TOKEN], "length"
+        return text, "stop"
+
+    async def chat_completions(self, body: Dict) -> JSONResponse:
+        self.stats["chat_requests"] += 1
+        await asyncio.sleep(self.chat_latency.sample())
+        failure = self._inject_failure(self.chat_config)
+        if failure is not None:
+            return failure
+
+        messages = body.get("messages") or []
+        text, tool_call = self.reply(messages)
+        text, finish_reason = self._limit_output(text, body)
+        forced = body.get("tool_choice")
+        if tool_call is None and isinstance(forced, Dict):
+            # structured output through a forced function call: reply with the JSON as its arguments
+            arguments = extract_json_object(text or "")
+            tool_call = {"name": forced["function"]["name"],
+                         "arguments": arguments if arguments is not None else {"bot": text}}
+            text = None
+        message: Dict[Text, Any] = {"role": "assistant", "content": text}
+        if tool_call is not None:
+            arguments = tool_call.get("arguments") or {}
+            message["tool_calls"] = [{
+                "id": f"call_{self.rng.getrandbits(48):012x}",
+                "type": "function",
+                "function": {"name": tool_call.get("name"),
+                             "arguments": arguments if isinstance(arguments, Text) else json.dumps(arguments)}
+            }]
+            finish_reason = "tool_calls"
+
+        prompt_tokens = count_message_tokens(messages)
+        completion_tokens = count_tokens(text)
+        # decoding time grows with the number of generated tokens
+        await asyncio.sleep(completion_tokens * self.chat_config.get("per_output_token", 0.0))
+        self.stats["prompt_tokens"] += prompt_tokens
+        self.stats["completion_tokens"] += completion_tokens
+        return JSONResponse(content={
+            "id": f"chatcmpl-{self.rng.getrandbits(64):016x}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+            "usage": {"prompt_tokens": prompt_tokens,
+                      "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        })
+
+    async def embeddings(self, body: Dict) -> JSONResponse:
+        self.stats["embedding_requests"] += 1
+        await asyncio.sleep(self.embedding_latency.sample())
+        failure = self._inject_failure(self.embedding_config)
+        if failure is not None:
+            return failure
+
+        inputs = body.get("input")
+        if isinstance(inputs, Text):
+            inputs = [inputs]
+        dimensions = body.get("dimensions") or self.embedding_config.get("dimensions", DEFAULT_DIMENSIONS)
+        self.stats["embedded_texts"] += len(inputs)
+        tokens = sum(count_tokens(text) for text in inputs)
+        return JSONResponse(content={
+            "object": "list",
+            "model": body.get("model", "fake"),
+            "data": [{"object": "embedding", "index": idx, "embedding": fake_embedding(text, dimensions)}
+                     for idx, text in enumerate(inputs)],
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        })
+
+
+def create_app(config: Optional[Dict[Text, Any]] = None,
+               responders: Optional[List[Responder]] = None) -> FastAPI:
+    """Create the FastAPI application of the fake server."""
+    fake = FakeLLMServer(config, responders)
+    app = FastAPI(title="MICA fake LLM server")
+    app.state.fake = fake
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        try:
+            body = await request.json()
+        except ClientDisconnect:
+            # the client cancelled the request, e.g. the losing side of a hedged call
+            return Response(status_code=499)
+        return await fake.chat_completions(body)
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        try:
+            body = await request.json()
+        except ClientDisconnect:
+            return Response(status_code=499)
+        return await fake.embeddings(body)
+
+    @app.get("/stats")
+    async def stats():
+        return fake.stats
+
+    return app
+
+
+def start_in_thread(config: Optional[Dict[Text, Any]] = None,
+                    host: Text = "127.0.0.1",
+                    port: int = 0):
+    """
+    Start the fake server in a daemon thread, e.g. inside a benchmark.
+
+    Returns:
+        (server, base_url). Call `server.should_exit = True` to stop it.
+    """
+    import uvicorn
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    server = uvicorn.Server(uvicorn.Config(create_app(config), log_level="warning"))
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    return server, f"http://{host}:{sock.getsockname()[1]}"
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Offline OpenAI-compatible fake LLM server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--config", default=None, help="YAML file with scripts, rules, latency and faults")
+    args = parser.parse_args()
+
+    config = read_yaml_file(args.config) if args.config else {}
+    logger.info(f"Starting fake LLM server on {args.host}:{args.port}")
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+import asyncio
+import time
+from collections import deque
+from typing import Optional, Text, Any, List
+
+from mica.llm.base import BaseModel
+from mica.tracker import Tracker
+from mica.utils import logger
+
+# Primary latency samples needed before the percentile replaces the initial delay
+MIN_SAMPLES = 20
+# keys of a `hedge` config section that configure the hedging rather than the secondary model
+HEDGE_OPTIONS = ("percentile", "initial_delay", "min_delay", "max_hedge_rate", "window")
+
+
+class HedgedModel(BaseModel):
+    """
+    Send a request to a secondary model when the primary is slow.
+
+    The request goes to the primary first. If it has not answered after the
+    `percentile` of its recent latencies (or it fails), the same request is sent to
+    the secondary; the first non-empty answer is returned and the other request is
+    cancelled. At most `max_hedge_rate` of the recent calls are hedged, which bounds
+    the extra cost.
+    """
+
+    def __init__(self,
+                 primary: BaseModel,
+                 secondary: BaseModel,
+                 percentile: float = 0.95,
+                 initial_delay: float = 2.0,
+                 min_delay: float = 0.05,
+                 max_hedge_rate: float = 0.1,
+                 window: int = 200):
+        """
+        Args:
+            primary: Model asked first
+            secondary: Model asked when the primary is slow or fails
+            percentile: Percentile of recent primary latencies after which to hedge
+            initial_delay: Hedge delay in seconds until enough latencies are known
+            min_delay: Lower bound of the hedge delay in seconds
+            max_hedge_rate: Largest share of recent calls that may be hedged
+            window: Number of recent calls used for latencies and the hedge rate
+        """
+        self.primary = primary
+        self.secondary = secondary
+        self.percentile = percentile
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.max_hedge_rate = max_hedge_rate
+        self.latencies = deque(maxlen=window)
+        self.recent_hedges = deque(maxlen=window)
+        self.model = getattr(primary, "model", None)
+        self.stats = {"calls": 0, "hedged": 0, "secondary_wins": 0}
+
+    def hedge_delay(self) -> float:
+        if len(self.latencies) < MIN_SAMPLES:
+            return self.initial_delay
+        ordered = sorted(self.latencies)
+        delay = ordered[min(len(ordered) - 1, int(self.percentile * len(ordered)))]
+        return max(self.min_delay, delay)
+
+    def _may_hedge(self) -> bool:
+        """Whether the window, with this call counted as hedged, stays within `max_hedge_rate`."""
+        hedges = sum(self.recent_hedges) + 1
+        calls = len(self.recent_hedges) + 1
+        if len(self.recent_hedges) == self.recent_hedges.maxlen:
+            # this call pushes the oldest one out of the window
+            hedges -= self.recent_hedges[0]
+            calls -= 1
+        return hedges <= self.max_hedge_rate * calls + 1e-9
+
+    async def _timed_primary(self, prompts: Any, tracker: Optional[Tracker], **kwargs) -> List:
+        start = time.perf_counter()
+        try:
+            result = await self.primary.generate_message(prompts, tracker=tracker, **kwargs)
+        except asyncio.CancelledError:
+            # a cancelled primary was at least this slow; dropping it would bias the delay downwards
+            self.latencies.append(time.perf_counter() - start)
+            raise
+        if result:
+            self.latencies.append(time.perf_counter() - start)
+        return result
+
+    async def generate_message(self,
+                               prompts: Any,
+                               tracker: Optional[Tracker] = None,
+                               **kwargs: Any) -> List:
+        self.stats["calls"] += 1
+        primary = asyncio.ensure_future(self._timed_primary(prompts, tracker, **kwargs))
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=self.hedge_delay())
+            primary_failed = bool(done) and (primary.exception() is not None or not primary.result())
+            if done and not primary_failed:
+                self.recent_hedges.append(False)
+                return primary.result()
+            if not self._may_hedge():
+                self.recent_hedges.append(False)
+                return await primary
+
+            self.recent_hedges.append(True)
+            self.stats["hedged"] += 1
+            logger.debug(f"Hedging LLM request to the secondary model "
+                         f"({'primary failed' if primary_failed else 'primary is slow'})")
+            secondary = asyncio.ensure_future(self.secondary.generate_message(prompts, tracker=tracker, **kwargs))
+            tasks.add(secondary)
+            pending = {secondary} if primary_failed else {primary, secondary}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        logger.error(f"Hedged LLM request failed: {task.exception()}")
+                    elif task.result():
+                        if task is secondary:
+                            self.stats["secondary_wins"] += 1
+                        return task.result()
+            return []
+        finally:
+            # cancel the loser, also when the caller itself is cancelled
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
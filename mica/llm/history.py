@@ -0,0 +1,112 @@
+import weakref
+from functools import lru_cache
+from typing import Optional, Text, Any, List, Tuple, Dict, Set
+
+from mica.event import Event, UserInput, BotUtter, AgentFail
+from mica.llm.tokens import count_tokens
+
+# rendered history line and its token count, per event
+_line_cache: "weakref.WeakKeyDictionary[Event, Tuple[Any, Any, Optional[Text], int]]" = weakref.WeakKeyDictionary()
+
+
+def render_event(event: Event) -> Tuple[Optional[Text], int]:
+    """
+    Render an event as a conversation history line, e.g. "User: hi".
+
+    Returns:
+        (line, tokens); line is None for events that do not appear in the history.
+    """
+    cached = _line_cache.get(event)
+    text = getattr(event, "text", None)
+    if cached is not None and cached[0] == text and cached[1] == event.metadata:
+        return cached[2], cached[3]
+
+    line = None
+    if isinstance(event, UserInput):
+        if text != "/init":
+            line = f"User: {text}\n"
+    elif isinstance(event, BotUtter):
+        line = f"{event.metadata or 'Bot'}: {text}\n"
+    elif isinstance(event, AgentFail):
+        line = f"<agent \'{event.provider}\' failed to respond.>\n"
+    tokens = count_tokens(line)
+    _line_cache[event] = (text, event.metadata, line, tokens)
+    return line, tokens
+
+
+def window_history(events: List[Event],
+                   max_tokens: Optional[int] = None,
+                   summary: Optional[Text] = None,
+                   summarized_events: int = 0,
+                   exclude: Optional[Set[int]] = None) -> Text:
+    """
+    Render the conversation history, keeping as many of the most recent lines
+    verbatim as fit in `max_tokens`.
+
+    When the history does not fit and a `summary` of the first `summarized_events`
+    events is given, it replaces those events. Lines that still do not fit are
+    replaced by a note saying how many were omitted. Events whose id is in
+    `exclude` are left out.
+    """
+    lines = [render_event(event) if not exclude or id(event) not in exclude else (None, 0)
+             for event in events]
+    if max_tokens is None or sum(tokens for _, tokens in lines) <= max_tokens:
+        return "".join(line for line, _ in lines if line is not None)
+
+    header = ""
+    if summary:
+        header = f"(Summary of the earlier conversation: {summary})\n"
+        lines = lines[summarized_events:]
+        max_tokens = max(0, max_tokens - count_tokens(header))
+    lines = [(line, tokens) for line, tokens in lines if line is not None]
+
+    kept = []
+    used = 0
+    for line, tokens in reversed(lines):
+        if used + tokens > max_tokens and kept:
+            break
+        kept.append(line)
+        used += tokens
+    omitted = len(lines) - len(kept)
+    if omitted:
+        header += f"({omitted} earlier messages omitted)\n"
+    return header + "".join(reversed(kept))
+
+
+@lru_cache(maxsize=4096)
+def _content_tokens(content: Text) -> int:
+    return count_tokens(content)
+
+
+def message_tokens(messages: List[Dict]) -> int:
+    """Token count of chat messages, e.g. an agent's conversation history."""
+    total = 0
+    for message in messages:
+        # every message carries a few tokens of role/format overhead
+        total += 4
+        content = message.get("content")
+        if isinstance(content, Text):
+            total += _content_tokens(content)
+    return total
+
+
+def shared_history_budget(budget: Optional[int], own_history: List[Dict]) -> Optional[int]:
+    """
+    Budget left for the shared conversation history once an agent's own exchanges,
+    which are always kept verbatim, are counted. At least a quarter of the budget
+    stays available so the shared context is never dropped entirely.
+    """
+    if budget is None:
+        return None
+    return max(budget // 4, budget - message_tokens(own_history))
+
+
+def history_budget(llm_model: Any, call_class: Text) -> Optional[int]:
+    """
+    The history token budget of a call class, as configured on the bot's
+    ModelRouter (`llm.history_budget`). None means unlimited.
+    """
+    budgets = getattr(llm_model, "history_budgets", None)
+    if budgets is None:
+        return None
+    return budgets.get(call_class)
@@ -0,0 +1,84 @@
+import threading
+from collections import deque
+from typing import Dict, Text, Any, Optional, Tuple
+
+# Number of recent samples kept per key to compute percentiles
+WINDOW_SIZE = 1000
+
+
+class LatencyStats:
+    """Count, error count and latency percentiles of one (call class, model) pair."""
+
+    def __init__(self, window_size: int = WINDOW_SIZE):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = deque(maxlen=window_size)
+
+    def observe(self, seconds: float, error: bool = False):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.samples.append(seconds)
+        if error:
+            self.errors += 1
+
+    def percentile(self, q: float) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def as_dict(self) -> Dict[Text, Any]:
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(0.5),
+            "p95": self.percentile(0.95),
+            "max": self.max,
+        }
+
+
+class MetricsRegistry:
+    """
+    Process-wide latency registry of LLM calls, keyed by call class and model,
+    e.g. ("condition", "gpt-4o-mini").
+    """
+
+    def __init__(self):
+        self._stats: Dict[Tuple[Text, Text], LatencyStats] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, call_class: Text, model: Optional[Text], seconds: float, error: bool = False):
+        key = (call_class, model or "unknown")
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = LatencyStats()
+            stats.observe(seconds, error)
+
+    def snapshot(self) -> Dict[Text, Dict[Text, Any]]:
+        """Return {call_class: {model: stats}}."""
+        with self._lock:
+            result = {}
+            for (call_class, model), stats in self._stats.items():
+                result.setdefault(call_class, {})[model] = stats.as_dict()
+            return result
+
+    def report(self) -> Text:
+        lines = []
+        for call_class, models in sorted(self.snapshot().items()):
+            for model, stats in models.items():
+                lines.append(f"{call_class:<12} {model:<24} n={stats['count']:<6} "
+                             f"mean={stats['mean']:.3f}s p50={stats['p50']:.3f}s "
+                             f"p95={stats['p95']:.3f}s errors={stats['errors']}")
+        return "\n".join(lines)
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+llm_metrics = MetricsRegistry()
@@ -5,7 +5,10 @@ from langchain_community.embeddings import OpenAIEmbeddings
 from mica.llm.base import BaseModel
 from mica.llm.openai_model import OpenAIModel
 from mica.llm.custom_model import CustomLLMModel
+from mica.llm.batch_model import BatchModel
 from mica.llm.custom_embedding import CustomEmbedding
+from mica.llm.hedging import HedgedModel, HEDGE_OPTIONS
+from mica.llm.router import ModelRouter
 from mica.utils import logger
 
 
@@ -22,7 +25,8 @@ class ModelFactory:
         
         Args:
             config: Configuration dictionary that can contain:
-                - provider: 'openai' or 'custom' (default: 'openai')
+                - provider: 'openai', 'custom' or 'batch' (default: 'openai'); 'batch'
+                  collects calls into batch-API jobs for offline evaluation (see BatchModel)
                 - For OpenAI:
                     - api_key: OpenAI API key
                     - model: Model name
@@ -56,6 +60,9 @@ class ModelFactory:
         if config is None:
             logger.info("No LLM config provided, using default OpenAI model")
             return OpenAIModel.create(None)
+
+        if config.get('hedge'):
+            return ModelFactory.create_hedged(config)
         
         provider = config.get('provider', 'openai').lower()
         
@@ -65,10 +72,85 @@ class ModelFactory:
         elif provider == 'openai':
             logger.info(f"Creating OpenAI model with config")
             return OpenAIModel.create(config)
+        elif provider == 'batch':
+            logger.info(f"Creating batch model for offline evaluation with config: {config}")
+            return BatchModel.create(config)
         else:
             logger.warning(f"Unknown provider '{provider}', falling back to OpenAI")
             return OpenAIModel.create(config)
     
+    @staticmethod
+    def create_hedged(config: Dict[Text, Any]) -> HedgedModel:
+        """
+        Create a primary model with a secondary one for hedged requests, e.g.
+
+            llm:
+              chat:
+                provider: openai
+                model: gpt-4o
+                hedge:
+                  provider: custom
+                  server: http://backup-llm:8000
+                  model: gpt-4o
+                  percentile: 0.95
+                  max_hedge_rate: 0.1
+
+        The secondary does not inherit the primary's settings (in particular its API key).
+        """
+        primary_config = {k: v for k, v in config.items() if k != 'hedge'}
+        hedge_config = dict(config['hedge'])
+        options = {key: hedge_config.pop(key) for key in HEDGE_OPTIONS if key in hedge_config}
+        logger.info(f"Creating hedged LLM model with secondary provider "
+                    f"'{hedge_config.get('provider', 'openai')}'")
+        return HedgedModel(ModelFactory.create_llm(primary_config),
+                           ModelFactory.create_llm(hedge_config),
+                           **options)
+
+    @staticmethod
+    def create_router(llm_config: Optional[Dict[Text, Any]] = None) -> ModelRouter:
+        """
+        Create a ModelRouter from the `llm` section of config.yml.
+
+        `chat` is the default model. `profiles` defines named models, each of which
+        inherits the `chat` settings it does not override, and `routing` maps call
+        classes to profile names:
+
+            llm:
+              chat:
+                provider: openai
+                model: gpt-4o
+              profiles:
+                fast:
+                  model: gpt-4o-mini
+                  max_tokens: 64
+              routing:
+                condition: fast
+                routing: fast
+                extraction: fast
+              history_budget:
+                generation: 6000
+
+        `history_budget` limits the tokens of conversation history in the prompts of
+        each call class. Without the section the history is unlimited; with it, the
+        classes it leaves out get DEFAULT_HISTORY_BUDGETS (null for unlimited).
+
+        For backward compatibility a flat chat config (without `chat`) is accepted too,
+        when it has a top-level `provider` or `model`. Otherwise the section only holds
+        other settings (e.g. `embedding`), and the default model is used.
+        """
+        llm_config = llm_config or {}
+        if 'chat' not in llm_config and any(key in llm_config for key in ('provider', 'model')):
+            chat_config = llm_config
+        else:
+            chat_config = llm_config.get('chat')
+        default = ModelFactory.create_llm(chat_config)
+
+        profiles = {}
+        for name, profile_config in (llm_config.get('profiles') or {}).items():
+            profiles[name] = ModelFactory.create_llm({**(chat_config or {}), **(profile_config or {})})
+        history_budgets = (llm_config.get('history_budget') or {}) if 'history_budget' in llm_config else None
+        return ModelRouter(default, profiles, llm_config.get('routing'), history_budgets=history_budgets)
+
     @staticmethod
     def create_embedding(config: Optional[Dict[Text, Any]] = None):
         """
@@ -0,0 +1,203 @@
+"""
+Request and response helpers shared by the OpenAI-compatible chat models.
+"""
+import json
+from typing import Any, Optional, Dict, Text, List
+
+import httpx
+
+from mica.event import BotUtter, FunctionCall
+from mica.llm.tokens import count_message_tokens
+from mica.utils import logger
+
+# structured output modes
+STRUCTURED_NONE = "none"
+STRUCTURED_JSON_SCHEMA = "json_schema"
+STRUCTURED_TOOL = "tool"
+STRUCTURED_OUTPUT_MODES = (STRUCTURED_NONE, STRUCTURED_JSON_SCHEMA, STRUCTURED_TOOL)
+
+ENVELOPE_STATUSES = ["running", "complete", "quit"]
+
+# request fields a single call may override, e.g. generate_message(prompt, max_tokens=5)
+GENERATION_OVERRIDES = ("max_tokens", "temperature", "top_p", "presence_penalty", "frequency_penalty",
+                        "stop", "logit_bias", "response_format", "seed")
+
+
+def generation_overrides(kwargs: Dict[Text, Any]) -> Dict[Text, Any]:
+    """Pick the per-call generation overrides out of generate_message kwargs."""
+    return {key: kwargs[key] for key in GENERATION_OVERRIDES if kwargs.get(key) is not None}
+
+
+def envelope_schema(name: Text,
+                    args: Optional[List[Text]] = None,
+                    with_bot: bool = True,
+                    conditions: Optional[List[Text]] = None) -> Dict[Text, Any]:
+    """
+    JSON schema of the bot/data/status envelope the agents ask the LLM for.
+
+    Args:
+        name: Schema name, also used as the function name in tool mode
+        args: Argument names that may be extracted into `data`
+        with_bot: Whether the envelope carries a `bot` reply
+        conditions: Condition keys whose truth values are returned in `conditions`
+
+    Returns:
+        {"name": ..., "schema": ...}
+    """
+    properties: Dict[Text, Any] = {"status": {"type": "string", "enum": ENVELOPE_STATUSES}}
+    if with_bot:
+        properties["bot"] = {"type": "string"}
+    if args:
+        properties["data"] = {"type": "object",
+                              "properties": {str(arg): {} for arg in args},
+                              "additionalProperties": False}
+    if conditions:
+        properties["conditions"] = {"type": "object",
+                                    "properties": {key: {"type": "boolean"} for key in conditions},
+                                    "additionalProperties": False}
+    return {"name": name,
+            "schema": {"type": "object", "properties": properties, "additionalProperties": False}}
+
+
+def build_chat_payload(model: Any,
+                       prompts: Any,
+                       functions: Optional[List] = None,
+                       response_schema: Optional[Dict] = None,
+                       overrides: Optional[Dict[Text, Any]] = None) -> Dict[Text, Any]:
+    """
+    Build a /v1/chat/completions request body from the sampling settings of `model`,
+    with per-call `overrides` (see GENERATION_OVERRIDES) taking precedence.
+
+    When `response_schema` is given and the model has a structured output mode, the
+    reply is constrained to the schema: `json_schema` uses `response_format`, `tool`
+    forces a call to a function whose parameters are the schema (if the agent has
+    functions of its own, any tool call is required instead).
+    """
+    data = {
+        "model": model.model,
+        "messages": prompts,
+        "temperature": model.temperature,
+        "top_p": model.top_p,
+        "presence_penalty": model.presence_penalty,
+        "frequency_penalty": model.frequency_penalty,
+        "max_tokens": model.max_tokens,
+    }
+    tools = []
+    if functions is not None and len(functions) > 0:
+        for function in functions:
+            tools.append({
+                "type": "function",
+                "function": function
+            })
+        data["tool_choice"] = "auto"
+
+    mode = getattr(model, "structured_output", STRUCTURED_NONE)
+    if response_schema is not None and mode == STRUCTURED_JSON_SCHEMA:
+        data["response_format"] = {"type": "json_schema",
+                                   "json_schema": {"name": response_schema["name"],
+                                                   "schema": response_schema["schema"],
+                                                   "strict": False}}
+    elif response_schema is not None and mode == STRUCTURED_TOOL:
+        tools.append({"type": "function",
+                      "function": {"name": response_schema["name"],
+                                   "description": "Reply to the user with this structure.",
+                                   "parameters": response_schema["schema"]}})
+        data["tool_choice"] = "required" if len(tools) > 1 else \
+            {"type": "function", "function": {"name": response_schema["name"]}}
+    if tools:
+        data["tools"] = tools
+    if overrides:
+        data.update(overrides)
+    return data
+
+
+def parse_chat_response(response_json: Optional[Dict],
+                        provider: Optional[Text] = None,
+                        response_schema: Optional[Dict] = None) -> List:
+    """
+    Convert a chat completion into events. A call to the forced envelope function
+    of tool mode is returned as a BotUtter carrying the JSON arguments, exactly as
+    if the model had replied with that JSON.
+    """
+    llm_result = []
+    if response_json is None or not response_json.get("choices"):
+        return llm_result
+    message: Dict = response_json.get("choices")[0].get("message")
+    logger.debug("LLM message: \n%s", json.dumps(message, indent=2, ensure_ascii=False))
+    if message.get("content") is not None:
+        llm_result.append(BotUtter(text=message.get("content"), metadata=provider, additional=message))
+
+    envelope_name = response_schema.get("name") if response_schema is not None else None
+    for func in message.get("tool_calls") or []:
+        func_details = func["function"]
+        name = func_details.get("name")
+        arguments = func_details.get("arguments")
+        if envelope_name is not None and name == envelope_name:
+            text = arguments if isinstance(arguments, Text) else json.dumps(arguments, ensure_ascii=False)
+            llm_result.append(BotUtter(text=text, metadata=provider, additional=message))
+            continue
+        args = json.loads(arguments) if isinstance(arguments, Text) else arguments
+        llm_result.append(FunctionCall(function_name=name,
+                                       args=args,
+                                       call_id=func.get("id"),
+                                       metadata=message))
+    return llm_result
+
+
+async def post_chat_completion(model: Any, payload: Dict[Text, Any], deadline: Optional[float] = None):
+    """
+    Send a chat completion request through the model's rate limiter and
+    concurrency limiter, if it has them.
+
+    The estimated prompt tokens plus `max_tokens` are reserved before sending and
+    reconciled with `usage.total_tokens` afterwards. A 429 answer pauses the rate
+    limiter for the `Retry-After` period. The concurrency limiter adapts its limit
+    to the latency and to 429/5xx answers and timeouts.
+
+    Raises:
+        RateLimitTimeout: when no capacity or request slot frees up before `deadline`
+    """
+    limiter = getattr(model, "rate_limiter", None)
+    reservation = None
+    if limiter is not None:
+        estimate = count_message_tokens(payload.get("messages"), payload.get("model")) \
+                   + (payload.get("max_tokens") or 0)
+        reservation = await limiter.acquire(estimate, deadline)
+    concurrency = getattr(model, "concurrency_limiter", None)
+    try:
+        permit = await concurrency.acquire(deadline) if concurrency is not None else None
+    except BaseException:
+        # also when cancelled while waiting for a slot
+        if reservation is not None:
+            # never sent
+            limiter.reconcile(reservation, 0)
+        raise
+    try:
+        response = await model.client.post(model.url, headers=model.headers, json=payload)
+    except BaseException as e:
+        # also when cancelled, e.g. the losing side of a hedged request
+        if permit is not None:
+            permit.release(overloaded=isinstance(e, httpx.TimeoutException))
+        if reservation is not None:
+            # the request may still have been counted by the provider, keep the estimate
+            limiter.reconcile(reservation, None)
+        raise
+    if permit is not None:
+        permit.release(overloaded=response.status_code == 429 or response.status_code >= 500)
+    if reservation is None:
+        return response
+    usage = None
+    if response.status_code == 200:
+        try:
+            usage = (response.json().get("usage") or {}).get("total_tokens")
+        except ValueError:
+            pass
+    elif response.status_code == 429:
+        try:
+            retry_after = float(response.headers.get("Retry-After", 1))
+        except ValueError:
+            retry_after = 1.0
+        limiter.pause(retry_after)
+        usage = 0
+    limiter.reconcile(reservation, usage)
+    return response
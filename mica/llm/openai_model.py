@@ -9,7 +9,11 @@ import httpx
 from mica.constants import OPENAI_API_KEY
 from mica.event import BotUtter, SetSlot, AgentComplete, AgentFail, FunctionCall
 from mica.llm.base import BaseModel
+from mica.llm.concurrency import ConcurrencyLimiter
 from mica.llm.constants import OPENAI_CHAT_URL
+from mica.llm.openai_compat import build_chat_payload, parse_chat_response, post_chat_completion, \
+    generation_overrides, STRUCTURED_NONE
+from mica.llm.rate_limiter import RateLimiter, RateLimitTimeout
 from mica.tracker import Tracker
 from mica.utils import logger
 
@@ -30,6 +34,9 @@ class OpenAIModel(BaseModel):
                  server: Optional[Text] = None,
                  api_key: Optional[Text] = None,
                  max_concurrent_requests: int = 5,
+                 structured_output: Optional[Text] = STRUCTURED_NONE,
+                 rate_limit: Optional[Dict] = None,
+                 concurrency: Optional[Dict] = None,
                  **kwargs):
         self.model = model
         self.temperature = temperature
@@ -37,9 +44,14 @@ class OpenAIModel(BaseModel):
         self.presence_penalty = presence_penalty
         self.frequency_penalty = frequency_penalty
         self.max_tokens = max_tokens
+        # how the bot/data/status envelope is enforced: none, json_schema or tool
+        self.structured_output = structured_output or STRUCTURED_NONE
         self.url = server + "/v1/chat/completions" if server else OPENAI_CHAT_URL
         self.headers = headers or {}
         self.client = httpx.AsyncClient(timeout=10)
+        # shared by every bot using the same endpoint and model
+        self.rate_limiter = RateLimiter.for_model(self.url, self.model, rate_limit)
+        self.concurrency_limiter = ConcurrencyLimiter.for_model(self.url, self.model, concurrency)
 
         if headers is None:
             if api_key is None:
@@ -60,58 +72,30 @@ class OpenAIModel(BaseModel):
                          tracker: Optional[Tracker] = None,
                          functions: Optional[Any] = None,
                          provider: Optional[Text] = None,
+                         response_schema: Optional[Dict] = None,
+                         deadline: Optional[float] = None,
                          **kwargs: Any
                          ) -> List:
-        formatted_prompts = self._generate_prompts(prompts, functions)
+        formatted_prompts = self._generate_prompts(prompts, functions, response_schema,
+                                                  generation_overrides(kwargs))
         llm_result = []
 
         logger.debug(f"url: {self.url}, headers: {self.headers}")
-        response = await self.client.post(self.url, headers=self.headers, json=formatted_prompts)
+        try:
+            response = await post_chat_completion(self, formatted_prompts, deadline)
+        except RateLimitTimeout as e:
+            logger.error(f"GPT request not sent: {e}")
+            return llm_result
         logger.debug("GPT response status: %s", response.status_code)
         if response.status_code == 200:
-            response_json = response.json()
-            if response_json is not None \
-                    and response_json.get("choices") is not None \
-                    and len(response_json.get("choices")) > 0:
-                message: Dict = response_json.get("choices")[0].get("message")
-                logger.debug("GPT message: \n%s", json.dumps(message, indent=2, ensure_ascii=False))
-                if message.get("content") is not None:
-                    next_response_text = message.get("content")
-                    llm_result.append(BotUtter(text=next_response_text, metadata=provider, additional=message))
-
-                if message.get("tool_calls") is not None:
-                    for func in message["tool_calls"]:
-                        func_details = func["function"]
-                        name = func_details.get("name")
-                        args = json.loads(func_details.get("arguments"))
-                        call_id = func.get("id")
-
-                        llm_result.append(FunctionCall(function_name=name,
-                                                       args=args,
-                                                       call_id=call_id,
-                                                       metadata=message))
+            llm_result = parse_chat_response(response.json(), provider, response_schema)
         else:
             logger.error("GPT request fail, respond: %s", response.text)
         return llm_result
 
-    def _generate_prompts(self, prompts: Any, functions: Optional[List] = None):
-        data = {
-            "model": self.model,
-            "messages": prompts,
-            "temperature": self.temperature,
-            "top_p": self.top_p,
-            "presence_penalty": self.presence_penalty,
-            "frequency_penalty": self.frequency_penalty,
-            "max_tokens": self.max_tokens,
-        }
-        if functions is not None and len(functions) > 0:
-            tools = []
-            for function in functions:
-                tools.append({
-                    "type": "function",
-                    "function": function
-                })
-            data["tools"] = tools
-            data["tool_choice"] = "auto"
-
-        return data
+    def _generate_prompts(self,
+                          prompts: Any,
+                          functions: Optional[List] = None,
+                          response_schema: Optional[Dict] = None,
+                          overrides: Optional[Dict] = None):
+        return build_chat_payload(self, prompts, functions, response_schema, overrides)
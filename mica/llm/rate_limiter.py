@@ -0,0 +1,250 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Optional, Dict, Text, Any, Tuple
+
+from mica.utils import logger
+
+class RateLimitTimeout(Exception):
+    """Exception that can be raised when no capacity frees up before the caller's deadline."""
+
+
+class TokenBucket:
+    """
+    A token bucket holding at most `capacity` units and refilled continuously at
+    `capacity` units per minute. The level may go negative when a reservation is
+    reconciled with a larger actual usage; the debt is paid back by the refill.
+    """
+
+    def __init__(self, capacity: float):
+        self.capacity = float(capacity)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` units are available, assuming the bucket was just refilled."""
+        # a single request larger than the bucket only needs a full bucket
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+
+class Reservation:
+    def __init__(self, limiter: "RateLimiter", tokens: int):
+        self.limiter = limiter
+        self.tokens = tokens
+        self.settled = False
+
+
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute limits of one provider endpoint and
+    model, shared by every bot in the process.
+
+    A call reserves one request and its estimated tokens before it is sent and
+    reconciles the estimate with the `usage` reported in the response. Callers that
+    find no capacity wait in FIFO order, up to an optional deadline.
+    """
+
+    def __init__(self,
+                 rpm: Optional[float] = None,
+                 tpm: Optional[float] = None,
+                 max_wait: Optional[float] = None,
+                 name: Optional[Text] = None):
+        """
+        Args:
+            rpm: Requests per minute, None for unlimited
+            tpm: Tokens per minute (prompt + completion), None for unlimited
+            max_wait: Default longest wait in seconds, None to wait as long as needed
+            name: Label used in logs
+        """
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.max_wait = max_wait
+        self.name = name
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+        # (future, tokens) of the callers waiting for capacity, in arrival order
+        self._waiters = deque()
+        # monotonic time of the pending wakeup of the first waiter
+        self._wakeup: Optional[float] = None
+
+    def _wait_time(self, tokens: int, now: float) -> float:
+        """Seconds until one request of `tokens` tokens fits. Called with the lock held."""
+        wait = max(0.0, self.paused_until - now)
+        for bucket, amount in ((self.requests, 1), (self.tokens, tokens)):
+            if bucket is not None:
+                bucket.refill(now)
+                wait = max(wait, bucket.wait_time(amount))
+        return wait
+
+    def _take(self, tokens: int, sign: int = 1):
+        if self.requests is not None:
+            self.requests.level -= sign
+        if self.tokens is not None:
+            self.tokens.level -= sign * tokens
+
+    async def acquire(self, tokens: int, deadline: Optional[float] = None) -> Reservation:
+        """
+        Wait for capacity for one request of `tokens` estimated tokens.
+
+        Args:
+            tokens: Estimated prompt + completion tokens
+            deadline: Absolute `time.monotonic()` deadline; defaults to now + max_wait
+
+        Raises:
+            RateLimitTimeout: when the capacity cannot be obtained before the deadline
+        """
+        if self.requests is None and self.tokens is None:
+            return Reservation(self, 0)
+        if deadline is None and self.max_wait is not None:
+            deadline = time.monotonic() + self.max_wait
+        with self._lock:
+            now = time.monotonic()
+            if not self._waiters:
+                wait = self._wait_time(tokens, now)
+                if wait == 0:
+                    self._take(tokens)
+                    return Reservation(self, tokens)
+                if deadline is not None and now + wait > deadline:
+                    raise RateLimitTimeout(f"Rate limit of {self.name} not available "
+                                           f"within the deadline (need {wait:.2f}s more)")
+            future = asyncio.get_running_loop().create_future()
+            self._waiters.append((future, tokens))
+            self._grant()
+        start = time.monotonic()
+        timeout = None if deadline is None else max(0.0, deadline - start)
+        try:
+            # shielded, so a timeout cannot cancel capacity that was granted meanwhile
+            await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            if self._withdraw(future):
+                raise RateLimitTimeout(f"Rate limit of {self.name} not available within the deadline "
+                                       f"({len(self._waiters)} requests queued)")
+        except BaseException:
+            if not self._withdraw(future):
+                with self._lock:
+                    self._take(tokens, -1)
+                    self._grant()
+            raise
+        waited = time.monotonic() - start
+        if waited > 0.1:
+            logger.debug(f"Rate limiter [{self.name}] queued a request for {waited:.2f}s")
+        return Reservation(self, tokens)
+
+    def _withdraw(self, future: asyncio.Future) -> bool:
+        """Remove a waiter; False when it was already granted its capacity."""
+        with self._lock:
+            for index, (waiter, _) in enumerate(self._waiters):
+                if waiter is future:
+                    del self._waiters[index]
+                    # the next waiter may be first in line now
+                    self._grant()
+                    return True
+            return False
+
+    def _grant(self):
+        """
+        Hand capacity to the waiters in line, and arm a wakeup for when the first
+        remaining one fits. Called with the lock held.
+        """
+        now = time.monotonic()
+        while self._waiters:
+            future, tokens = self._waiters[0]
+            wait = self._wait_time(tokens, now)
+            if wait > 0:
+                self._wake_at(future.get_loop(), now + wait)
+                return
+            self._waiters.popleft()
+            self._take(tokens)
+            future.get_loop().call_soon_threadsafe(_set_granted, future)
+
+    def _wake_at(self, loop: asyncio.AbstractEventLoop, when: float):
+        # one pending wakeup at a time; an earlier one re-arms itself when it is too early
+        if self._wakeup is not None and self._wakeup <= when:
+            return
+        self._wakeup = when
+        loop.call_soon_threadsafe(self._arm_wakeup, loop, when)
+
+    def _arm_wakeup(self, loop: asyncio.AbstractEventLoop, when: float):
+        loop.call_later(max(0.0, when - time.monotonic()), self._on_wakeup, when)
+
+    def _on_wakeup(self, when: float):
+        with self._lock:
+            if self._wakeup == when:
+                self._wakeup = None
+            self._grant()
+
+    def reconcile(self, reservation: Reservation, actual_tokens: Optional[int]):
+        """Replace the estimated tokens of a reservation with the reported usage."""
+        if reservation.settled or self.tokens is None or actual_tokens is None:
+            reservation.settled = True
+            return
+        with self._lock:
+            self.tokens.level += reservation.tokens - actual_tokens
+            self.tokens.level = min(self.tokens.level, self.tokens.capacity)
+            # tokens given back may let the first waiter go earlier
+            self._grant()
+        reservation.settled = True
+
+    def pause(self, seconds: float):
+        """Hold all requests for `seconds`, e.g. after the provider answered 429 with Retry-After."""
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        logger.warning(f"Rate limiter [{self.name}] paused for {seconds:.1f}s after a 429 response")
+
+    @classmethod
+    def for_model(cls, endpoint: Text, model: Optional[Text],
+                  rate_limit: Optional[Dict[Text, Any]] = None) -> Optional["RateLimiter"]:
+        """
+        Return the process-wide limiter of an endpoint and model, configured by the
+        `rate_limit` section of a chat model or profile in config.yml:
+
+            llm:
+              chat:
+                model: gpt-4o
+                rate_limit:
+                  rpm: 500
+                  tpm: 30000
+                  max_wait: 30
+
+        Returns None when no limit is configured.
+        """
+        if not rate_limit:
+            return None
+        return registry.get((endpoint, model), rate_limit)
+
+
+class RateLimiterRegistry:
+    def __init__(self):
+        self._limiters: Dict[Tuple[Text, Optional[Text]], RateLimiter] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple[Text, Optional[Text]], rate_limit: Dict[Text, Any]) -> RateLimiter:
+        with self._lock:
+            limiter = self._limiters.get(key)
+            if limiter is None:
+                limiter = self._limiters[key] = RateLimiter(rpm=rate_limit.get("rpm"),
+                                                            tpm=rate_limit.get("tpm"),
+                                                            max_wait=rate_limit.get("max_wait"),
+                                                            name=f"{key[0]} {key[1]}")
+            elif (rate_limit.get("rpm"), rate_limit.get("tpm")) != \
+                    (limiter.requests and limiter.requests.capacity, limiter.tokens and limiter.tokens.capacity):
+                logger.warning(f"Rate limits for {key[0]} {key[1]} are configured differently by several bots, "
+                               f"keeping the first ones.")
+            return limiter
+
+
+def _set_granted(future: asyncio.Future):
+    if not future.done():
+        future.set_result(True)
+
+
+registry = RateLimiterRegistry()
@@ -0,0 +1,79 @@
+import asyncio
+import time
+from typing import Optional, Dict, Text, Any, List
+
+from mica.llm.base import BaseModel
+from mica.llm.constants import CALL_CLASSES, UNCLASSIFIED_CALL, DEFAULT_HISTORY_BUDGETS
+from mica.llm.metrics import llm_metrics, MetricsRegistry
+from mica.tracker import Tracker
+from mica.turn_budget import TurnBudgetExceeded, spend_turn_budget, TURN_LLM_CALLS
+from mica.utils import logger
+
+
+class ModelRouter(BaseModel):
+    """
+    Route each LLM call to a model profile by its call class.
+
+    Agents and steps tag their calls with `call_class` (condition, routing,
+    extraction, generation, kb_answer, fallback), so short classification calls
+    can go to a small, fast model while responses are still generated by the
+    flagship one. Calls without a route use the default model. The latency of
+    every call is recorded per call class and model.
+
+    The router also holds the per call class token budgets of the conversation
+    history that callers put into their prompts (see mica.llm.history), and
+    spends the LLM calls of the tracker's turn budget, whose deadline becomes
+    the timeout of the call (see mica.turn_budget).
+    """
+
+    def __init__(self,
+                 default: BaseModel,
+                 profiles: Optional[Dict[Text, BaseModel]] = None,
+                 routing: Optional[Dict[Text, Text]] = None,
+                 metrics: Optional[MetricsRegistry] = None,
+                 history_budgets: Optional[Dict[Text, Optional[int]]] = None):
+        self.default = default
+        self.profiles = profiles or {}
+        self.metrics = metrics or llm_metrics
+        self.routes: Dict[Text, BaseModel] = {}
+        for call_class, profile in (routing or {}).items():
+            if call_class not in CALL_CLASSES:
+                logger.warning(f"Unknown call class '{call_class}' in llm routing, "
+                               f"expected one of {', '.join(CALL_CLASSES)}")
+            if profile not in self.profiles:
+                logger.error(f"Model profile '{profile}' routed from '{call_class}' is not defined, "
+                             f"using the default model instead.")
+                continue
+            self.routes[call_class] = self.profiles[profile]
+        # opt-in: without budgets the history is unlimited, given ones fill in the defaults
+        self.history_budgets = {} if history_budgets is None else {**DEFAULT_HISTORY_BUDGETS, **history_budgets}
+
+    def model_for(self, call_class: Optional[Text] = None) -> BaseModel:
+        return self.routes.get(call_class, self.default)
+
+    async def generate_message(self,
+                               prompts: Any,
+                               tracker: Optional[Tracker] = None,
+                               call_class: Optional[Text] = None,
+                               **kwargs: Any) -> List:
+        model = self.model_for(call_class)
+        model_name = getattr(model, "model", None)
+        budget = spend_turn_budget(tracker, TURN_LLM_CALLS)
+        timeout = budget.remaining() if budget is not None else None
+        if timeout is not None:
+            # also bounds the waits on the rate and concurrency limiters
+            kwargs.setdefault("deadline", budget.deadline)
+        start = time.perf_counter()
+        error = True
+        try:
+            call = model.generate_message(prompts, tracker=tracker, **kwargs)
+            try:
+                result = await (asyncio.wait_for(call, timeout) if timeout is not None else call)
+            except asyncio.TimeoutError:
+                raise TurnBudgetExceeded(f"timeout of {budget.timeout}s during a {call_class} call")
+            error = not result
+            return result
+        finally:
+            elapsed = time.perf_counter() - start
+            self.metrics.observe(call_class or UNCLASSIFIED_CALL, model_name, elapsed, error)
+            logger.debug(f"LLM call [{call_class or UNCLASSIFIED_CALL}] on {model_name} took {elapsed:.3f}s")
@@ -0,0 +1,133 @@
+import asyncio
+from typing import Optional, Dict, Text, Any, Set
+
+from mica.llm.constants import CALL_SUMMARY, SUMMARY_MAX_TOKENS
+from mica.llm.history import render_event, window_history
+from mica.tracker import Tracker
+from mica.utils import logger
+
+SUMMARY_SYSTEM_PROMPT = "You maintain a running summary of a conversation between a user and a chatbot. " \
+                        "Update the summary with the new messages. Keep every fact the user provided, " \
+                        "their requests, decisions and open questions; drop greetings and small talk. " \
+                        "Output only the summary, in at most {words} words."
+
+
+class HistorySummarizer:
+    """
+    Rolling summarization of long conversations.
+
+    Once the unsummarized part of a conversation exceeds `trigger_tokens`, the
+    older turns are folded into a compact summary stored on the tracker, keeping
+    the last `keep_recent_tokens` verbatim. Prompts then show the summary plus the
+    recent turns (see Tracker.get_history_str). Summaries are generated by calls of
+    the `summary` class, which can be routed to a cheap model, in a background task
+    started after the turn's response is ready, so they never delay a reply.
+    """
+
+    def __init__(self,
+                 llm_model: Any,
+                 trigger_tokens: int = 1000,
+                 keep_recent_tokens: int = 500,
+                 max_tokens: int = SUMMARY_MAX_TOKENS):
+        """
+        Args:
+            llm_model: Model (usually the bot's ModelRouter) used for summary calls
+            trigger_tokens: Unsummarized history tokens above which a summary is made
+            keep_recent_tokens: History tokens kept verbatim after the summary
+            max_tokens: Generation limit of a summary
+        """
+        self.llm_model = llm_model
+        self.trigger_tokens = trigger_tokens
+        self.keep_recent_tokens = keep_recent_tokens
+        self.max_tokens = max_tokens
+        self._running: Dict[Text, asyncio.Task] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    @classmethod
+    def create(cls, config: Optional[Dict[Text, Any]] = None,
+               llm_model: Optional[Any] = None) -> Optional["HistorySummarizer"]:
+        """
+        Create a summarizer when it is enabled in config.yml:
+
+            llm:
+              profiles:
+                cheap:
+                  model: gpt-4o-mini
+              routing:
+                summary: cheap
+              summarization:
+                trigger_tokens: 1000
+                keep_recent_tokens: 500
+
+        By default summarization starts once the history exceeds the smallest
+        history budget of the call classes. Returns None when it is not enabled.
+        """
+        llm_config = (config or {}).get("llm") or {}
+        summarization = llm_config.get("summarization")
+        if summarization in (None, False) or llm_model is None:
+            return None
+        summarization = summarization if isinstance(summarization, Dict) else {}
+        budgets = [b for b in (getattr(llm_model, "history_budgets", None) or {}).values() if b]
+        trigger_tokens = summarization.get("trigger_tokens") or (min(budgets) if budgets else 1000)
+        return cls(llm_model,
+                   trigger_tokens=trigger_tokens,
+                   keep_recent_tokens=summarization.get("keep_recent_tokens") or trigger_tokens // 2,
+                   max_tokens=summarization.get("max_tokens") or SUMMARY_MAX_TOKENS)
+
+    def _unsummarized_tokens(self, tracker: Tracker) -> int:
+        return sum(render_event(event)[1] for event in tracker.events[tracker.summarized_events:])
+
+    def schedule(self, tracker: Tracker):
+        """
+        Start summarizing the conversation in the background if it is long enough.
+        At most one summary per conversation runs at a time.
+        """
+        if tracker.user_id in self._running:
+            return
+        if self._unsummarized_tokens(tracker) <= self.trigger_tokens:
+            return
+        task = asyncio.ensure_future(self.summarize(tracker))
+        self._running[tracker.user_id] = task
+        self._tasks.add(task)
+        task.add_done_callback(lambda t: self._finished(tracker.user_id, t))
+
+    def _finished(self, user_id: Text, task: asyncio.Task):
+        self._tasks.discard(task)
+        if self._running.get(user_id) is task:
+            del self._running[user_id]
+
+    async def summarize(self, tracker: Tracker):
+        """Fold the turns before the most recent `keep_recent_tokens` into the tracker's summary."""
+        start = tracker.summarized_events
+        end = len(tracker.events)
+        used = 0
+        while end > start:
+            tokens = render_event(tracker.events[end - 1])[1]
+            if used + tokens > self.keep_recent_tokens:
+                break
+            used += tokens
+            end -= 1
+        if end <= start:
+            return
+        new_messages = window_history(tracker.events[start:end])
+        user = f"## Current summary:\n{tracker.history_summary or '(empty)'}\n\n## New messages:\n{new_messages}"
+        prompt = [{"role": "system", "content": SUMMARY_SYSTEM_PROMPT.format(words=self.max_tokens * 3 // 4)},
+                  {"role": "user", "content": user}]
+        try:
+            llm_result = await self.llm_model.generate_message(prompt, call_class=CALL_SUMMARY,
+                                                               max_tokens=self.max_tokens)
+        except Exception as e:
+            logger.error(f"Conversation summarization failed: {e}")
+            return
+        if not llm_result or not getattr(llm_result[0], "text", None):
+            return
+        if tracker.summarized_events != start:
+            # the history was reset or summarized by someone else meanwhile
+            return
+        tracker.set_history_summary(llm_result[0].text.strip(), end)
+        logger.debug(f"Summarized {end - start} events of conversation {tracker.user_id}")
+
+    async def wait_idle(self):
+        """Wait for running summaries, e.g. before shutting down or in tests."""
+        if self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
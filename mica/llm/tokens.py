@@ -0,0 +1,56 @@
+from functools import lru_cache
+from typing import Optional, Text, Any, List, Dict
+
+from mica.utils import logger
+
+DEFAULT_ENCODING = "cl100k_base"
+# Rough characters-per-token ratio used when no tokenizer is available
+CHARS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=32)
+def _get_encoding(model: Optional[Text] = None):
+    """
+    Load a tiktoken encoding for the model. tiktoken downloads its encoding files on
+    first use, so offline deployments fall back to a character based estimate.
+    """
+    try:
+        import tiktoken
+        if model is not None:
+            try:
+                return tiktoken.encoding_for_model(model)
+            except KeyError:
+                pass
+        return tiktoken.get_encoding(DEFAULT_ENCODING)
+    except Exception as e:
+        logger.warning(f"Tokenizer unavailable, estimating token counts instead: {e}")
+        return None
+
+
+def count_tokens(text: Optional[Text], model: Optional[Text] = None) -> int:
+    """Count the tokens of a text for the given model."""
+    if not text:
+        return 0
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return len(text) // CHARS_PER_TOKEN + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(messages: Any, model: Optional[Text] = None) -> int:
+    """Estimate the prompt tokens of a list of chat messages."""
+    if isinstance(messages, Text):
+        return count_tokens(messages, model)
+    total = 0
+    for message in messages or []:
+        # every message carries a few tokens of role/format overhead
+        total += 4
+        if isinstance(message, Dict):
+            content = message.get("content")
+            if isinstance(content, Text):
+                total += count_tokens(content, model)
+            elif isinstance(content, List):
+                for part in content:
+                    if isinstance(part, Dict) and isinstance(part.get("text"), Text):
+                        total += count_tokens(part.get("text"), model)
+    return total + 2
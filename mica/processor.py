@@ -7,6 +7,7 @@ from mica.agents.flow_agent import FlowAgent
 from mica.bot import Bot
 from mica.event import Event, CurrentAgent, BotUtter, FollowUpAgent, AgentFail, AgentComplete
 from mica.tracker import Tracker
+from mica.turn_budget import TurnBudgetExceeded, TURN_ITERATIONS, DEFAULT_BUDGET_FALLBACK
 from mica.utils import replace_args_in_string, user_info_logger, logger
 
 
@@ -53,7 +54,8 @@ class DispatcherProcessor(Processor):
                     tracker.update(response_event)
                     text = response_event.text
                     agent_name = current.name
-                    text = replace_args_in_string(text, agent_name, tracker)
+                    if not response_event.rendered:
+                        text = replace_args_in_string(text, agent_name, tracker)
                     response.append(text)
                 if isinstance(response_event, FollowUpAgent):
                     next_agent_name = response_event.next_agent
@@ -95,52 +97,76 @@ class PriorityProcessor(Processor):
             return []
         response = []
         is_end = False
+        budget = tracker.turn_budget
 
-        if tracker.is_agent_stack_empty():
-            # run the entrypoint
-            _, response = await bot.entrypoint.run(tracker, agents=bot.agents, tools=bot.tools)
+        try:
+            if tracker.is_agent_stack_empty():
+                # run the entrypoint
+                _, response = await bot.entrypoint.run(tracker, agents=bot.agents, tools=bot.tools)
 
-        while not is_end:
-            current_event = tracker.peek_agent()
-            logger.debug("[before] Agent stack: %s", list(tracker.agent_stack.keys()))
-            # no other agents in Agent stack. Stop and ouptut response
-            if current_event is None:
-                is_end = True
-                break
-            current: Agent = current_event.agent
-            curr_flow_node = None
-            if isinstance(current, FlowAgent):
-                curr_flow_node = current_event.metadata
+            while not is_end:
+                if budget is not None:
+                    budget.spend(TURN_ITERATIONS)
+                current_event = tracker.peek_agent()
+                logger.debug("[before] Agent stack: %s", list(tracker.agent_stack.keys()))
+                # no other agents in Agent stack. Stop and ouptut response
+                if current_event is None:
+                    is_end = True
+                    break
+                current: Agent = current_event.agent
+                curr_flow_node = None
+                if isinstance(current, FlowAgent):
+                    curr_flow_node = current_event.metadata
 
-            logger.debug("[run] Find agent: %s, now prepare to run this agent.", current)
-            is_end, response_event_list = await current.run(tracker=tracker,
-                                                            agents=bot.agents,
-                                                            tools=bot.tools,
-                                                            current_nodes=curr_flow_node)
+                logger.debug("[run] Find agent: %s, now prepare to run this agent.", current)
+                is_end, response_event_list = await current.run(tracker=tracker,
+                                                                agents=bot.agents,
+                                                                tools=bot.tools,
+                                                                current_nodes=curr_flow_node)
 
-            for response_event in response_event_list:
-                if isinstance(response_event, BotUtter):
-                    tracker.update(response_event)
-                    text = response_event.text
-                    agent_name = current.name
-                    text = replace_args_in_string(text, agent_name, tracker)
-                    response.append(text)
-                if isinstance(response_event, FollowUpAgent):
-                    next_agent_name = response_event.next_agent
-                    next_agent = bot.agents.get(next_agent_name)
-                    tracker.push_agent(CurrentAgent(agent=next_agent, status="initiate", metadata=0))
-                if isinstance(response_event, (AgentFail, AgentComplete)):
-                    tracker.update(response_event)
-                    tracker.pop_agent()
-                    # call by other agent
-                    if current_event.metadata is not None and isinstance(current_event.metadata, Dict):
-                        flow_name = current_event.metadata["flow"]
-                        step_id = current_event.metadata["step"]
-                        info = tracker.get_or_create_flow_agent(flow_name)
-                        info.set_call_result(step_id, response_event)
-                        is_end = False
-                if isinstance(response_event, CurrentAgent):
-                    tracker.pop_agent()
-                    tracker.push_agent(response_event)
-            logger.debug("[after] Agent stack: %s", list(tracker.agent_stack.keys()))
-        return response
\ No newline at end of file
+                for response_event in response_event_list:
+                    if isinstance(response_event, BotUtter):
+                        tracker.update(response_event)
+                        text = response_event.text
+                        agent_name = current.name
+                        if not response_event.rendered:
+                            text = replace_args_in_string(text, agent_name, tracker)
+                        response.append(text)
+                    if isinstance(response_event, FollowUpAgent):
+                        next_agent_name = response_event.next_agent
+                        next_agent = bot.agents.get(next_agent_name)
+                        tracker.push_agent(CurrentAgent(agent=next_agent, status="initiate", metadata=0))
+                    if isinstance(response_event, (AgentFail, AgentComplete)):
+                        tracker.update(response_event)
+                        tracker.pop_agent()
+                        # call by other agent
+                        if current_event.metadata is not None and isinstance(current_event.metadata, Dict):
+                            flow_name = current_event.metadata["flow"]
+                            step_id = current_event.metadata["step"]
+                            info = tracker.get_or_create_flow_agent(flow_name)
+                            info.set_call_result(step_id, response_event)
+                            is_end = False
+                    if isinstance(response_event, CurrentAgent):
+                        tracker.pop_agent()
+                        tracker.push_agent(response_event)
+                logger.debug("[after] Agent stack: %s", list(tracker.agent_stack.keys()))
+        except TurnBudgetExceeded as e:
+            response.append(self._stop_turn(tracker, e))
+        return response
+
+    @staticmethod
+    def _stop_turn(tracker: Tracker, error: TurnBudgetExceeded) -> Text:
+        """
+        End a turn that used up its budget: the agents of the turn are dropped,
+        so the next message starts again from the entrypoint, and the fallback
+        reply is sent.
+        """
+        logger.warning(f"Stopped the turn of {tracker.user_id}: {error}")
+        while not tracker.is_agent_stack_empty():
+            agent = tracker.peek_agent().agent
+            tracker.pop_agent()
+            if isinstance(agent, FlowAgent):
+                tracker.remove_flow_agent(agent.name)
+        fallback = tracker.turn_budget.fallback or DEFAULT_BUDGET_FALLBACK
+        tracker.update(BotUtter(text=fallback, rendered=True))
+        return fallback
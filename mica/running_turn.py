@@ -0,0 +1,36 @@
+import asyncio
+from typing import Optional, Text
+
+from mica.turn_budget import TurnBudget, TURN_TOOL_CALLS
+
+
+class RunningTurn:
+    """
+    A turn of one user that is being handled, or waits for the previous one.
+
+    With `supersede_turns: true` in the bot config, a newer message of the same
+    user cancels the turn while it is still waiting on LLM calls: the tracker is
+    rolled back to the start of the turn, and the newer turn handles both
+    messages. Once a tool has run, the turn has side effects and is past its
+    safe point; it finishes, and the newer message is handled after it.
+    """
+
+    def __init__(self, message: Text):
+        self.message = message
+        self.task: Optional[asyncio.Task] = None
+        # budget of the turn once it runs, which also counts its LLM and tool calls
+        self.budget: Optional[TurnBudget] = None
+        self.superseded = False
+        # set once the turn has finished or has been rolled back
+        self.done = asyncio.Event()
+
+    def supersede(self) -> bool:
+        """Cancel the turn if it is still safe to; returns whether it was superseded."""
+        if self.done.is_set() or (self.task is not None and self.task.done()):
+            return False
+        if self.budget is not None and self.budget.used[TURN_TOOL_CALLS] > 0:
+            return False
+        self.superseded = True
+        if self.task is not None:
+            self.task.cancel()
+        return True
@@ -14,6 +14,8 @@ from pydantic import BaseModel
 import uvicorn
 
 from mica.channel import WebSocketChannel
+from mica.llm.concurrency import registry as concurrency_limiters
+from mica.llm.metrics import llm_metrics
 from mica.llm.openai_model import NoValidRequestHeader
 from mica.manager import Manager
 from mica.utils import read_yaml_string, logger, read_yaml_file
@@ -173,6 +175,17 @@ async def get_bots():
     return JSONResponse(content=list(manager.bots.keys()), media_type="application/json;charset=utf-8")
 
 
+@app.get("/v1/metrics")
+async def get_metrics():
+    """
+    LLM call latency per call class and model, the adaptive concurrency limits per endpoint,
+    and the superseded turns and their wasted LLM calls per bot.
+    """
+    return JSONResponse(content={"llm": llm_metrics.snapshot(), "concurrency": concurrency_limiters.snapshot(),
+                                 "turns": {name: bot.turn_stats for name, bot in manager.bots.items()}},
+                        media_type="application/json;charset=utf-8")
+
+
 @app.websocket("/v1/ws/chat/{bot}")
 async def chat_ws(websocket: WebSocket, bot):
     # generate unique id for each connection
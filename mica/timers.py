@@ -0,0 +1,209 @@
+import asyncio
+import inspect
+import time
+from typing import Optional, Callable, Any, Set, List
+
+from mica.utils import logger
+
+# slots per wheel level = 2 ** WHEEL_BITS
+WHEEL_BITS = 8
+WHEEL_LEVELS = 4
+DEFAULT_TICK = 0.1
+
+
+class Timer:
+    """A scheduled callback; cancel() takes constant time."""
+
+    __slots__ = ("expires", "callback", "args", "_wheel", "_slot")
+
+    def __init__(self, expires: int, callback: Callable, args: tuple, wheel: "TimerWheel"):
+        # absolute tick of the wheel
+        self.expires = expires
+        self.callback = callback
+        self.args = args
+        self._wheel = wheel
+        self._slot: Optional[Set["Timer"]] = None
+
+    @property
+    def active(self) -> bool:
+        return self._slot is not None
+
+    def cancel(self):
+        if self._slot is not None:
+            self._slot.discard(self)
+            self._slot = None
+            self._wheel._count -= 1
+
+
+class TimerWheel:
+    """
+    Process-wide hierarchical timer wheel for inactivity timeouts, retry
+    prompts and other deferred bot actions.
+
+    Timers are kept in WHEEL_LEVELS wheels of 2 ** WHEEL_BITS slots; level l
+    holds the timers due within 2 ** (WHEEL_BITS * (l + 1)) ticks and cascades
+    them to the lower levels as the wheel turns. Scheduling and cancelling take
+    constant time, and a single task drives all timers of the event loop
+    instead of one polling task per conversation. The task sleeps until the
+    next occupied slot (or the next cascade), and only runs while timers are
+    scheduled.
+
+    A callback may be a plain function or return an awaitable, which is run as
+    a task of its own; the wheel keeps it until it finishes and logs its errors.
+    """
+
+    def __init__(self, tick: float = DEFAULT_TICK, clock: Callable[[], float] = time.monotonic):
+        self.tick = tick
+        self.clock = clock
+        self._mask = (1 << WHEEL_BITS) - 1
+        self._wheels: List[List[Set[Timer]]] = [[set() for _ in range(1 << WHEEL_BITS)]
+                                                for _ in range(WHEEL_LEVELS)]
+        self._origin = clock()
+        # last processed tick
+        self._current = 0
+        self._count = 0
+        self._driver: Optional[asyncio.Task] = None
+        # tick the driver sleeps until, and the future that wakes it up earlier
+        self._driver_due: Optional[int] = None
+        self._wakeup: Optional[asyncio.Future] = None
+        # tasks of awaitable callbacks, referenced until they finish
+        self._tasks: Set[asyncio.Task] = set()
+
+    def __len__(self):
+        return self._count
+
+    def schedule(self, delay: float, callback: Callable, *args: Any) -> Timer:
+        """Call `callback(*args)` in `delay` seconds, rounded up to the tick."""
+        now = (self.clock() - self._origin) / self.tick
+        if not self._count:
+            # the wheels are empty, skip the idle ticks instead of turning through them
+            self._current = max(self._current, int(now))
+        due = now + max(delay, 0.0) / self.tick
+        expires = max(int(-(-due // 1)), self._current + 1)
+        timer = Timer(expires, callback, args, self)
+        self._place(timer)
+        self._count += 1
+        self._ensure_driver(expires)
+        return timer
+
+    def _place(self, timer: Timer):
+        delta = timer.expires - self._current
+        for level in range(WHEEL_LEVELS):
+            if delta < 1 << (WHEEL_BITS * (level + 1)) or level == WHEEL_LEVELS - 1:
+                # beyond the top level: parked in its furthest slot and placed again when it cascades
+                position = min(timer.expires, self._current + (1 << (WHEEL_BITS * WHEEL_LEVELS)) - 1)
+                slot = self._wheels[level][(position >> (WHEEL_BITS * level)) & self._mask]
+                slot.add(timer)
+                timer._slot = slot
+                return
+
+    def advance(self, ticks: int):
+        """Turn the wheel by `ticks`, firing the timers that became due."""
+        for _ in range(ticks):
+            self._current += 1
+            current = self._current
+            if current & self._mask == 0:
+                for level in range(1, WHEEL_LEVELS):
+                    index = (current >> (WHEEL_BITS * level)) & self._mask
+                    self._cascade(self._wheels[level][index])
+                    if index != 0:
+                        break
+            slot = self._wheels[0][current & self._mask]
+            if slot:
+                due, self._wheels[0][current & self._mask] = slot, set()
+                for timer in due:
+                    timer._slot = None
+                    self._count -= 1
+                    self._fire(timer)
+
+    def _cascade(self, slot: Set[Timer]):
+        timers = list(slot)
+        slot.clear()
+        for timer in timers:
+            self._place(timer)
+
+    def _fire(self, timer: Timer):
+        try:
+            result = timer.callback(*timer.args)
+            if inspect.isawaitable(result):
+                task = asyncio.ensure_future(result)
+                self._tasks.add(task)
+                task.add_done_callback(self._task_done)
+        except Exception as e:
+            logger.error(f"Timer callback {timer.callback} failed: {e}")
+
+    def _task_done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Timer callback task failed: {task.exception()!r}")
+
+    def _next_due(self) -> int:
+        """The first tick with timers in the lowest wheel, at the latest the next cascade."""
+        boundary = (self._current | self._mask) + 1
+        for tick in range(self._current + 1, boundary):
+            if self._wheels[0][tick & self._mask]:
+                return tick
+        return boundary
+
+    def _ensure_driver(self, expires: int):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # no loop yet, timers are driven once one schedules a timer
+            return
+        if self._driver is None or self._driver.done() or self._driver.get_loop() is not loop:
+            self._driver = loop.create_task(self._drive())
+        elif self._driver_due is not None and expires < self._driver_due and not self._wakeup.done():
+            # due before the driver wakes up
+            self._wakeup.set_result(None)
+
+    async def _drive(self):
+        loop = asyncio.get_running_loop()
+        try:
+            while self._count:
+                elapsed = int((self.clock() - self._origin) / self.tick)
+                if elapsed > self._current:
+                    self.advance(elapsed - self._current)
+                if not self._count:
+                    break
+                self._driver_due = self._next_due()
+                self._wakeup = loop.create_future()
+                handle = loop.call_later(max(0.0, self._driver_due * self.tick - (self.clock() - self._origin)),
+                                         _wake, self._wakeup)
+                try:
+                    await self._wakeup
+                finally:
+                    handle.cancel()
+        finally:
+            self._driver_due = None
+
+
+def _wake(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+# shared by every bot in the process
+timer_wheel = TimerWheel()
+
+
+class InactivityTimer:
+    """
+    Calls `callback()` once `delay` seconds pass without rearm(). The tracker
+    re-arms its inactivity timers on every event (see Tracker.update).
+    """
+
+    def __init__(self, delay: float, callback: Callable, wheel: Optional[TimerWheel] = None):
+        self.delay = delay
+        self.callback = callback
+        self.wheel = wheel or timer_wheel
+        self._timer: Optional[Timer] = None
+
+    def rearm(self):
+        self.cancel()
+        self._timer = self.wheel.schedule(self.delay, self.callback)
+
+    def cancel(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
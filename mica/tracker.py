@@ -1,9 +1,11 @@
+import copy
 import json
 from collections import OrderedDict
 from dataclasses import dataclass, field
-from typing import Optional, List, Dict, Text, Any, Union, Tuple
+from typing import Optional, List, Dict, Text, Any, Union, Tuple, Callable
 
-from mica.event import Event, UserInput, BotUtter, AgentFail
+from mica.event import Event, UserInput, BotUtter
+from mica.timers import InactivityTimer
 from mica.utils import logger
 
 
@@ -66,6 +68,20 @@ class FlowInfo:
     def set_call_result(self, call_agent_name, result):
         self.internal_states[call_agent_name] = result
 
+    def set_condition_decisions(self, message: Event, decisions: Dict[int, bool]):
+        """Store condition results decided ahead of time for `message`, keyed by step id."""
+        stored = self.internal_states.get("_condition_decisions")
+        if stored is not None and stored[0] == id(message):
+            stored[1].update(decisions)
+            return
+        self.internal_states["_condition_decisions"] = (id(message), dict(decisions))
+
+    def get_condition_decision(self, step_id: int, message: Event) -> Optional[bool]:
+        stored = self.internal_states.get("_condition_decisions")
+        if stored is None or stored[0] != id(message):
+            return None
+        return stored[1].get(step_id)
+
 
 class Tracker(object):
     def __init__(self,
@@ -82,7 +98,18 @@ class Tracker(object):
         self.latest_message = None
         self.flow_info = {}
         self.agent_conv_history = {}
+        # ids of the events each agent already holds as chat messages in its conv history
+        self.agent_conv_events: Dict[Text, set] = {}
         self.predicted_responses = []
+        # rolling summary of events[:summarized_events], see mica.llm.summarizer
+        self.history_summary = None
+        self.summarized_events = 0
+        # embeddings of the latest user message, see mica.llm.embedding_memo
+        self.turn_embeddings = None
+        # limits of the running turn, see mica.turn_budget
+        self.turn_budget = None
+        # timers re-armed by every event, see mica.timers
+        self.inactivity_timers: Dict[Text, InactivityTimer] = {}
 
     @classmethod
     def create(cls,
@@ -97,24 +124,62 @@ class Tracker(object):
         self.events.append(event)
         if isinstance(event, UserInput):
             self.update_latest_message(event)
-
-    def get_history_str(self):
-        conversation_history = ""
-        for event in self.events:
-            if isinstance(event, UserInput):
-                if event.text == "/init":
-                    continue
-                conversation_history += f"User: {event.text}\n"
-            if isinstance(event, BotUtter):
-                conversation_history += f"{event.metadata or 'Bot'}: {event.text}\n"
-            if isinstance(event, AgentFail):
-                conversation_history += f"<agent \'{event.provider}\' failed to respond.>\n"
-
-        return conversation_history
+        for timer in self.inactivity_timers.values():
+            timer.rearm()
+
+    def set_inactivity_timer(self, name: Text, delay: float, callback: Callable):
+        """Call `callback()` after `delay` seconds without events; replaces the timer of the same name."""
+        self.cancel_inactivity_timer(name)
+        timer = self.inactivity_timers[name] = InactivityTimer(delay, callback)
+        timer.rearm()
+
+    def cancel_inactivity_timer(self, name: Text):
+        timer = self.inactivity_timers.pop(name, None)
+        if timer is not None:
+            timer.cancel()
+
+    def get_history_str(self, max_tokens: Optional[int] = None, exclude_agent: Optional[Text] = None):
+        """
+        Render the conversation history for a prompt. With `max_tokens`, only the
+        most recent lines that fit the token budget are kept, preceded by the
+        summary of the earlier conversation when there is one. With `exclude_agent`,
+        the turns that agent already has in its conv history are left out.
+        """
+        from mica.llm.history import window_history
+        return window_history(self.events, max_tokens,
+                              summary=self.history_summary,
+                              summarized_events=self.summarized_events,
+                              exclude=self.agent_conv_events.get(exclude_agent) if exclude_agent else None)
+
+    def set_history_summary(self, summary: Text, summarized_events: int):
+        self.history_summary = summary
+        self.summarized_events = summarized_events
 
     def update_latest_message(self, event: UserInput):
         self.latest_message = event
 
+    def snapshot(self) -> Dict[Text, Any]:
+        """The conversation state to roll an unfinished turn back to with restore()."""
+        return {
+            "events": list(self.events),
+            "args": copy.deepcopy(self.args),
+            "func_args": copy.deepcopy(self.func_args),
+            # agents are shared, only the stack entries (status, step index) change during a turn
+            "agent_stack": OrderedDict((copy.copy(entry), None) for entry in self.agent_stack),
+            "latest_message": self.latest_message,
+            "flow_info": copy.deepcopy(self.flow_info),
+            "agent_conv_history": copy.deepcopy(self.agent_conv_history),
+            "agent_conv_events": copy.deepcopy(self.agent_conv_events),
+            "predicted_responses": list(self.predicted_responses),
+            "history_summary": self.history_summary,
+            "summarized_events": self.summarized_events,
+            "turn_embeddings": self.turn_embeddings,
+        }
+
+    def restore(self, snapshot: Dict[Text, Any]):
+        for name, value in snapshot.items():
+            setattr(self, name, value)
+
     def is_agent_stack_empty(self):
         return not self.agent_stack
 
@@ -231,5 +296,10 @@ class Tracker(object):
     def set_conv_history(self, agent_name: Text, message: Dict) -> None:
         self.agent_conv_history[agent_name].append(message)
 
+    def mark_conv_event(self, agent_name: Text, event: Event) -> None:
+        """Record that `event` is part of the agent's conv history."""
+        self.agent_conv_events.setdefault(agent_name, set()).add(id(event))
+
     def clear_conv_history(self, agent_name):
         self.agent_conv_history[agent_name] = []
+        self.agent_conv_events.pop(agent_name, None)
@@ -0,0 +1,106 @@
+import copy
+import time
+from typing import Optional, Dict, Text, Any
+
+from mica.utils import logger
+
+# resources a turn spends, with the config key of their limit
+TURN_ITERATIONS = "max_iterations"
+TURN_LLM_CALLS = "max_llm_calls"
+TURN_TOOL_CALLS = "max_tool_calls"
+TURN_RESOURCES = (TURN_ITERATIONS, TURN_LLM_CALLS, TURN_TOOL_CALLS)
+
+DEFAULT_TURN_LIMITS = {
+    TURN_ITERATIONS: 200,
+    TURN_LLM_CALLS: 50,
+    TURN_TOOL_CALLS: 50,
+}
+DEFAULT_BUDGET_FALLBACK = "Sorry, I couldn't finish handling that. Please try again."
+
+
+class TurnBudgetExceeded(Exception):
+    """Raised when a turn has used up its budget or passed its deadline."""
+
+    def __init__(self, reason: Text):
+        self.reason = reason
+        super().__init__(f"turn budget exceeded: {reason}")
+
+
+class TurnBudget:
+    """
+    Limits of one conversation turn, so that a looping flow, an LLM agent that
+    keeps calling tools or a hanging request cannot pin a worker:
+
+        turn_budget:
+          max_iterations: 200    # agent runs of the processor loop
+          max_llm_calls: 50
+          max_tool_calls: 50
+          timeout: 60            # wall-clock seconds, none by default
+          fallback: "Sorry, I couldn't finish handling that. Please try again."
+
+    The limits are opt-in: without a turn_budget section a bot's turns are
+    counted but not limited. With one, omitted limits take the defaults above.
+    Bot.handle_message starts a fresh copy for every turn on tracker.turn_budget.
+    The processor, the model router and the tool calls spend it; the deadline
+    is passed to the LLM calls as their timeout. A limit of null disables it.
+    """
+
+    def __init__(self,
+                 max_iterations: Optional[int] = DEFAULT_TURN_LIMITS[TURN_ITERATIONS],
+                 max_llm_calls: Optional[int] = DEFAULT_TURN_LIMITS[TURN_LLM_CALLS],
+                 max_tool_calls: Optional[int] = DEFAULT_TURN_LIMITS[TURN_TOOL_CALLS],
+                 timeout: Optional[float] = None,
+                 fallback: Optional[Text] = DEFAULT_BUDGET_FALLBACK):
+        self.limits = {TURN_ITERATIONS: max_iterations,
+                       TURN_LLM_CALLS: max_llm_calls,
+                       TURN_TOOL_CALLS: max_tool_calls}
+        self.timeout = timeout
+        self.fallback = fallback
+        self.used = {resource: 0 for resource in TURN_RESOURCES}
+        # time.monotonic() deadline of the running turn
+        self.deadline: Optional[float] = None
+
+    @classmethod
+    def create(cls, config: Optional[Dict[Text, Any]] = None):
+        config = config or {}
+        if "turn_budget" not in config:
+            # only counts, e.g. the LLM and tool calls of a superseded turn
+            return cls(**{resource: None for resource in TURN_RESOURCES})
+        budget_config = config.get("turn_budget") or {}
+        unknown = set(budget_config) - set(TURN_RESOURCES) - {"timeout", "fallback"}
+        if unknown:
+            logger.warning(f"Unknown turn_budget settings: {', '.join(sorted(unknown))}")
+        return cls(**{key: value for key, value in budget_config.items() if key not in unknown})
+
+    def start(self) -> "TurnBudget":
+        """A fresh budget for a new turn."""
+        budget = copy.copy(self)
+        budget.used = {resource: 0 for resource in TURN_RESOURCES}
+        budget.deadline = time.monotonic() + self.timeout if self.timeout is not None else None
+        return budget
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left until the deadline, None without a timeout."""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def check(self):
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            raise TurnBudgetExceeded(f"timeout of {self.timeout}s")
+
+    def spend(self, resource: Text):
+        """Count one use of `resource`, raising TurnBudgetExceeded past its limit or the deadline."""
+        self.check()
+        self.used[resource] += 1
+        limit = self.limits[resource]
+        if limit is not None and self.used[resource] > limit:
+            raise TurnBudgetExceeded(f"{resource} of {limit}")
+
+
+def spend_turn_budget(tracker: Optional[Any], resource: Text) -> Optional[TurnBudget]:
+    """Spend `resource` from the budget of the tracker's running turn, if it has one."""
+    budget = getattr(tracker, "turn_budget", None) if tracker is not None else None
+    if budget is not None:
+        budget.spend(resource)
+    return budget
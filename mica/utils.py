@@ -1,5 +1,7 @@
+import functools
 import io
 import json
+import operator
 import os
 import re
 from typing import Text
@@ -358,35 +360,68 @@ def arg_format(statement, flow_name):
             "arg_name": statement}
 
 
+# ${arg} or ${agent.arg}
+ARG_PATTERN = re.compile(r'\$\{([^}]+)\}')
+
+
+class ArgTemplate:
+    """
+    A text with `${arg}`/`${agent.arg}` references, parsed once. The references
+    are resolved to (agent name, arg name) pairs up front; render() only looks
+    the values up and joins the parts in a single pass.
+    """
+
+    def __init__(self, text: Text, flow_name):
+        self.text = text
+        # literal strings and (agent name, arg name) references, in order
+        self.parts = []
+        pos = 0
+        for match in ARG_PATTERN.finditer(text):
+            if match.start() > pos:
+                self.parts.append(text[pos:match.start()])
+            arg_info = arg_format(match.group(1), flow_name)
+            self.parts.append((arg_info["flow_name"], arg_info["arg_name"]))
+            pos = match.end()
+        if pos < len(text):
+            self.parts.append(text[pos:])
+        self.has_args = any(isinstance(part, tuple) for part in self.parts)
+
+    def render(self, tracker) -> Text:
+        if not self.has_args:
+            return self.text
+        rendered = []
+        for part in self.parts:
+            if isinstance(part, tuple):
+                value, exist = tracker.get_arg(*part)
+                rendered.append(str(value) if exist and value is not None else "")
+            else:
+                rendered.append(part)
+        return "".join(rendered)
+
+
+@functools.lru_cache(maxsize=1024)
+def compile_template(text: Text, flow_name) -> ArgTemplate:
+    """Cached ArgTemplate for texts produced at run time (tool outputs, LLM replies)."""
+    return ArgTemplate(text, flow_name)
+
+
 def replace_args_in_string(input_str, flow_name, tracker):
     """
-    Replaces variables enclosed in {} with corresponding values from vars_dict.
+    Replaces variables enclosed in ${} with corresponding values from the tracker.
 
     Parameters:
-    s (str): The input string containing variables in {}.
-    vars_dict (dict): A dictionary mapping variable names to their values.
+    input_str (str): The input string containing variables in ${}.
+    flow_name (str): The default agent name of the variables.
+    tracker (Tracker): Provides the variable values.
 
     Returns:
     str: The string with variables replaced by their corresponding values.
     """
     if not isinstance(input_str, Text):
         return ""
-    # Pattern to match {variable_name}
-    pattern = re.compile(r'\$\{([^}]+)\}')
-
-    # Function to replace each match with the corresponding value
-    def replace_match(match):
-        arg = match.group(1)
-        arg_info = arg_format(arg, flow_name)
-        value, exist = tracker.get_arg(arg_info["flow_name"], arg_info["arg_name"])
-        if not exist or value is None:
-            return ""
-        return str(value)
-
-    # Replace all occurrences of the pattern
-    result = pattern.sub(replace_match, input_str)
-
-    return result
+    if "${" not in input_str:
+        return input_str
+    return compile_template(input_str, flow_name).render(tracker)
 
 
 def safe_json_loads(json_str):
@@ -402,7 +437,69 @@ def safe_json_loads(json_str):
     try:
         return json.loads(json_str)
     except (json.JSONDecodeError, TypeError):
+        pass
+    if not isinstance(json_str, str):
         return {}
+    result = extract_json_object(json_str)
+    return result if result is not None else {}
+
+
+def extract_json_object(text):
+    """
+    Find the first JSON object embedded in a text, e.g. an LLM reply wrapped in
+    prose or Markdown fences.
+
+    The text is scanned once, tracking string literals and brace depth, and only
+    complete top-level candidates are parsed, so the cost stays linear in the text
+    length. Unbalanced closing braces are ignored. When an opening brace is never
+    closed, the complete objects directly inside it are tried instead, as if the
+    scan restarted after it.
+
+    Args:
+        text (str): The text to search.
+
+    Returns:
+        dict: The first object that parses, otherwise None.
+    """
+    def parse(begin, end):
+        try:
+            candidate = json.loads(text[begin:end + 1], strict=False)
+        except json.JSONDecodeError:
+            return None
+        return candidate if isinstance(candidate, dict) else None
+
+    # (start, spans of the complete objects directly inside) of every open brace
+    stack = []
+    in_string = False
+    escaped = False
+    for i, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char == '"':
+            # strings only matter inside a candidate object
+            in_string = bool(stack)
+        elif char == '{':
+            stack.append((i, []))
+        elif char == '}' and stack:
+            begin, _ = stack.pop()
+            if stack:
+                stack[-1][1].append((begin, i))
+                continue
+            candidate = parse(begin, i)
+            if candidate is not None:
+                return candidate
+    # the spans are disjoint, so each character is parsed at most once more
+    for begin, end in sorted(span for _, children in stack for span in children):
+        candidate = parse(begin, end)
+        if candidate is not None:
+            return candidate
+    return None
 
 
 def short_uuid(length=8):
@@ -688,6 +785,97 @@ def parse_and_evaluate(expr_str, tracker, revoke_agent_name):
     return evaluate_expression(expr_tree, tracker, revoke_agent_name)
 
 
+COMPARATORS = {
+    'eq': operator.eq,
+    'neq': operator.ne,
+    'gt': operator.gt,
+    'lt': operator.lt,
+    'ge': operator.ge,
+    'le': operator.le,
+}
+
+
+class _NoArgs:
+    """Tracker stand-in without args, to resolve the literal value of an operand."""
+
+    @staticmethod
+    def get_arg(agent_name, arg_name):
+        return None, False
+
+
+def _compile_value(val_str, revoke_agent_name):
+    """
+    Compile an operand into a function of the tracker, with the same semantics
+    as _get_value: the arg references and the literal fallback are resolved
+    once, only the tracker lookups are left to call time.
+    """
+    val_str = val_str.strip()
+    literal = _get_value(val_str, _NoArgs, revoke_agent_name)
+    quoted = val_str.startswith('"') or val_str.startswith("'")
+    # None/True/False, quoted strings and numbers cannot name an arg
+    if quoted or not isinstance(literal, str):
+        return lambda tracker: literal
+
+    # (agent name, arg name) pairs looked up in order
+    references = []
+    if '.' in val_str:
+        parts = val_str.split('.')
+        if len(parts) == 2:
+            references.append((parts[0], parts[1]))
+    references.append((revoke_agent_name, val_str))
+
+    def value(tracker):
+        for agent_name, arg_name in references:
+            result, is_exist = tracker.get_arg(agent_name, arg_name)
+            if is_exist:
+                return result
+        return literal
+
+    return value
+
+
+def _compile_tree(expr_tree, revoke_agent_name):
+    expr_type = expr_tree['type']
+    if expr_type in ('and', 'or'):
+        left = _compile_tree(expr_tree['left'], revoke_agent_name)
+        right = _compile_tree(expr_tree['right'], revoke_agent_name)
+        if expr_type == 'and':
+            return lambda tracker: left(tracker) and right(tracker)
+        return lambda tracker: left(tracker) or right(tracker)
+    if expr_type in COMPARATORS:
+        compare = COMPARATORS[expr_type]
+        left = _compile_value(expr_tree['left'], revoke_agent_name)
+        right = _compile_value(expr_tree['right'], revoke_agent_name)
+        return lambda tracker: compare(left(tracker), right(tracker))
+    if expr_type == 'regex':
+        pattern = re.compile(expr_tree['pattern'].strip("'\""))
+        arg_value = _compile_value(expr_tree['arg_name'], revoke_agent_name)
+
+        def match(tracker):
+            arg_val = arg_value(tracker)
+            if arg_val is None:
+                return False
+            return bool(pattern.match(str(arg_val)))
+
+        return match
+    raise ValueError(f"Unknown expression type: {expr_type}")
+
+
+def compile_expression(expr_str, revoke_agent_name):
+    """
+    Compile an expression once into a function of the tracker; calling it gives
+    the same result as parse_and_evaluate(expr_str, tracker, revoke_agent_name).
+
+    Args:
+        expr_str: expression string
+        revoke_agent_name: string, the default agent name in an arg_path
+
+    Returns:
+        Callable taking the tracker and returning the result of the expression
+    """
+    return _compile_tree(ExpressionParser(expr_str).parse(), revoke_agent_name)
+
+
 def get_expression_from_condition(condition: Text, tracker, revoke_agent_name=None):
     expr_tree = parser.parse(condition)
     return evaluate_expression(expr_tree, tracker, revoke_agent_name)
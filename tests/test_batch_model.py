@@ -0,0 +1,36 @@
+import asyncio
+import json
+
+from mica.llm.batch_model import BatchModel, BatchBackend
+
+
+class EchoBackend(BatchBackend):
+    def __init__(self):
+        self.jobs = []
+
+    async def run(self, input_path, output_path):
+        with open(input_path) as f:
+            requests = [json.loads(line) for line in f]
+        self.jobs.append(len(requests))
+        with open(output_path, "w") as f:
+            for request in requests:
+                content = request["body"]["messages"][-1]["content"].upper()
+                body = {"choices": [{"message": {"role": "assistant", "content": content}}]}
+                f.write(json.dumps({"custom_id": request["custom_id"],
+                                    "response": {"status_code": 200, "body": body}}) + "\n")
+
+
+def test_concurrent_calls_share_a_batch(tmp_path):
+    """
+    Tests that calls of concurrent conversations are submitted as one job and each caller gets its own result.
+    """
+    backend = EchoBackend()
+    model = BatchModel(batch={"max_delay": 0.01, "work_dir": str(tmp_path)}, backend=backend)
+
+    async def scenario():
+        return await asyncio.gather(*[model.generate_message([{"role": "user", "content": f"turn {i}"}])
+                                      for i in range(5)])
+
+    results = asyncio.run(scenario())
+    assert backend.jobs == [5]
+    assert [events[0].text for events in results] == [f"TURN {i}" for i in range(5)]
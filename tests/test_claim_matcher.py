@@ -0,0 +1,94 @@
+import asyncio
+import math
+
+from mica import parser
+from mica.bot import Bot
+from mica.llm.claim_matcher import ClaimMatcher
+from mica.llm.fake_server import start_in_thread
+
+EXAMPLES = ["I want a refund", "Give me my money back"]
+
+
+class FixedEmbeddings:
+    """Deterministic embeddings: every known text has a fixed vector."""
+    url = "http://embeddings"
+    model = "fixed"
+    VECTORS = {
+        "I want a refund": [1.0, 0.0, 0.0],
+        "Give me my money back": [0.0, 1.0, 0.0],
+        "refund please": [0.95, 0.0, math.sqrt(1 - 0.95 ** 2)],
+        "maybe a refund later": [0.8, 0.0, 0.6],
+        "what is the weather": [0.0, 0.0, 1.0],
+    }
+
+    def __init__(self):
+        self.queries = []
+
+    async def aembed_documents(self, texts):
+        return [self.VECTORS[text] for text in texts]
+
+    async def aembed_query(self, text):
+        self.queries.append(text)
+        return self.VECTORS[text]
+
+
+def create_matcher():
+    embeddings = FixedEmbeddings()
+    matcher = ClaimMatcher.create({"llm": {"claim_fast_path": True}}, embeddings)
+    matcher.register(EXAMPLES)
+    matcher.prepare()
+    return matcher, embeddings
+
+
+def test_similarity_thresholds_decide_or_defer():
+    """
+    Tests that a similarity at or above 0.92 decides True, below 0.70 False,
+    and that the band in between is left to the LLM.
+    """
+    matcher, embeddings = create_matcher()
+    assert matcher.embeddings is embeddings and matcher.ready
+
+    def decide(text):
+        return asyncio.run(matcher.decide(EXAMPLES, text))
+
+    assert decide("refund please") is True
+    assert decide("what is the weather") is False
+    assert decide("maybe a refund later") is None
+    assert embeddings.queries == ["refund please", "what is the weather", "maybe a refund later"]
+
+
+def test_exact_match_skips_the_embedding():
+    """
+    Tests that a message equal to an example up to case and punctuation is accepted without embedding it.
+    """
+    matcher, embeddings = create_matcher()
+    assert asyncio.run(matcher.decide(EXAMPLES, "i want a REFUND!")) is True
+    assert embeddings.queries == []
+
+    unprepared = ClaimMatcher(FixedEmbeddings())
+    unprepared.register(EXAMPLES)
+    assert asyncio.run(unprepared.decide(EXAMPLES, "refund please")) is None
+
+
+def test_bot_shares_its_embedding_model():
+    """
+    Tests that the KB agents and the claim fast path of a bot use the same embedding model.
+    """
+    server, url = start_in_thread()
+    try:
+        data = parser.parse_agents({
+            "faq": {"type": "kb agent", "faq": [{"q": "What is the refund policy?", "a": "30 days."}]},
+            "orders": {"type": "flow agent", "steps": [
+                {"if": 'the user claims "I want a refund"', "then": [{"bot": "Refund started"}]}]},
+            "main": {"type": "flow agent", "steps": [{"call": "orders"}]},
+        })
+        bot = Bot.from_json(name="shared", data=data, config={"llm": {
+            "chat": {"provider": "custom", "server": url},
+            "embedding": {"provider": "custom", "server": url},
+            "claim_fast_path": True}})
+    finally:
+        server.should_exit = True
+
+    if_step = bot.agents["orders"].subflows[bot.agents["orders"].main_flow_name].steps[0]
+    assert if_step.claim_matcher.ready
+    assert if_step.claim_matcher.embeddings is bot.agents["faq"].embeddings
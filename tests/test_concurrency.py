@@ -0,0 +1,35 @@
+import asyncio
+import time
+
+import pytest
+
+from mica.llm.concurrency import ConcurrencyLimiter, ConcurrencyTimeout
+
+
+def test_limit_queues_and_adapts():
+    """
+    Tests that calls above the limit wait for a slot, time out at their deadline,
+    and that overload halves the limit while successful use grows it again.
+    """
+    async def scenario():
+        limiter = ConcurrencyLimiter(initial=2, min_limit=1, max_limit=4)
+        first, second = await limiter.acquire(), await limiter.acquire()
+        assert limiter.as_dict() == {"limit": 2, "inflight": 2, "queued": 0}
+
+        with pytest.raises(ConcurrencyTimeout):
+            await limiter.acquire(deadline=time.monotonic() + 0.01)
+        waiter = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        assert limiter.queued == 1
+        first.release(overloaded=True)
+        assert limiter.limit == 1 and limiter.queued == 1
+        second.release()
+        third = await waiter
+        assert limiter.inflight == 1
+
+        third.release()
+        for _ in range(4):
+            (await limiter.acquire()).release()
+        assert limiter.limit > 1
+
+    asyncio.run(scenario())
@@ -0,0 +1,40 @@
+import asyncio
+
+from mica.event import UserInput
+from mica.llm.embedding_memo import embed_user_message, prefetch
+from mica.tracker import Tracker
+
+
+class CountingEmbeddings:
+    url = "http://embeddings"
+    model = "test"
+
+    def __init__(self):
+        self.calls = []
+
+    async def aembed_query(self, text):
+        self.calls.append(text)
+        await asyncio.sleep(0.01)
+        return [float(len(text))]
+
+
+def test_user_message_is_embedded_once_per_turn():
+    """
+    Tests that a prefetched embedding is shared by all consumers of the turn and recomputed for the next message.
+    """
+    embeddings = CountingEmbeddings()
+    tracker = Tracker.create("user")
+
+    async def scenario():
+        tracker.update(UserInput(text="hello"))
+        prefetch(tracker, [embeddings])
+        first = await asyncio.gather(embed_user_message(tracker, embeddings),
+                                     embed_user_message(tracker, CountingEmbeddings(), "hello"))
+        tracker.update(UserInput(text="bye"))
+        second = await embed_user_message(tracker, embeddings)
+        other = await embed_user_message(tracker, embeddings, "something else")
+        return first, second, other
+
+    first, second, other = asyncio.run(scenario())
+    assert first == [[5.0], [5.0]] and second == [3.0] and other == [14.0]
+    assert embeddings.calls == ["hello", "bye", "something else"]
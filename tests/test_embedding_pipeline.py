@@ -0,0 +1,93 @@
+import json
+
+import httpx
+import pytest
+
+from mica.llm.embedding_pipeline import EmbeddingPipeline, EmbeddingPipelineError
+from mica.llm.fake_server import start_in_thread, fake_embedding
+from mica.llm.model_factory import ModelFactory
+
+TEXTS = [f"chunk number {idx}" for idx in range(5)]
+
+
+class FlakyEmbeddings:
+    """Fails the first `failures` calls, then embeds through the fake server."""
+
+    def __init__(self, embeddings, failures):
+        self.embeddings = embeddings
+        self.failures = failures
+        self.model = getattr(embeddings, "model", None)
+
+    async def aembed_documents(self, texts):
+        if self.failures > 0:
+            self.failures -= 1
+            raise httpx.ConnectError("connection refused")
+        return await self.embeddings.aembed_documents(texts)
+
+
+@pytest.fixture(scope="module")
+def server_url():
+    server, url = start_in_thread({"embeddings": {"dimensions": 16}})
+    yield url
+    server.should_exit = True
+
+
+def embeddings_of(url):
+    return ModelFactory.create_embedding({"provider": "custom", "server": url})
+
+
+def embedded_texts(url):
+    return httpx.get(f"{url}/stats").json()["embedded_texts"]
+
+
+def test_batches_are_split_and_vectors_keep_input_order(server_url):
+    """
+    Tests that texts are sent in batches of at most `batch_size` and the vectors come back in input order.
+    """
+    before = httpx.get(f"{server_url}/stats").json()["embedding_requests"]
+    pipeline = EmbeddingPipeline(embeddings_of(server_url), batch_size=2, max_concurrency=2)
+    assert pipeline.make_batches(TEXTS) == [[0, 1], [2, 3], [4]]
+    vectors = pipeline.embed(TEXTS)
+    assert vectors == [fake_embedding(text, 16) for text in TEXTS]
+    assert httpx.get(f"{server_url}/stats").json()["embedding_requests"] - before == 3
+
+
+def test_failed_batch_is_retried(server_url):
+    """
+    Tests that a batch that fails is retried after the backoff and then succeeds.
+    """
+    pipeline = EmbeddingPipeline(FlakyEmbeddings(embeddings_of(server_url), failures=2),
+                                 max_retries=2, retry_backoff=0.01)
+    assert pipeline.embed(TEXTS[:2]) == [fake_embedding(text, 16) for text in TEXTS[:2]]
+
+
+def test_failures_after_retries_raise():
+    """
+    Tests that a batch that keeps failing raises EmbeddingPipelineError once the retries are used up.
+    """
+    server, url = start_in_thread({"embeddings": {"error_rate": 1.0}})
+    try:
+        pipeline = EmbeddingPipeline(embeddings_of(url), max_retries=1, retry_backoff=0.01)
+        with pytest.raises(EmbeddingPipelineError):
+            pipeline.embed(TEXTS)
+    finally:
+        server.should_exit = True
+
+
+def test_resume_skips_cached_texts_and_compacts_cache(server_url, tmp_path):
+    """
+    Tests that a run with a cache file only embeds the texts it has not seen,
+    and that entries of texts that are gone are dropped from the file.
+    """
+    cache_path = str(tmp_path / "faq.jsonl")
+    pipeline = EmbeddingPipeline(embeddings_of(server_url), batch_size=2, cache_path=cache_path)
+    before = embedded_texts(server_url)
+    pipeline.embed(TEXTS[:4])
+    assert embedded_texts(server_url) - before == 4
+
+    vectors = pipeline.embed(TEXTS[2:])
+    assert vectors == [fake_embedding(text, 16) for text in TEXTS[2:]]
+    assert embedded_texts(server_url) - before == 5
+    with open(cache_path) as f:
+        keys = [json.loads(line)["key"] for line in f]
+    assert keys == [pipeline._cache_key(text) for text in TEXTS[2:]]
@@ -0,0 +1,107 @@
+import json
+
+from fastapi.testclient import TestClient
+
+from mica.llm.fake_server import create_app, fake_embedding
+
+
+def test_rule_and_builtin_responses():
+    """
+    Tests that user rules take precedence and that MICA prompts get valid replies.
+    """
+    client = TestClient(create_app({"chat": {"rules": [{"match": "refund", "response": "Refunds take 5 days."}]}}))
+
+    response = client.post("/v1/chat/completions",
+                           json={"messages": [{"role": "user", "content": "I want a refund"}]})
+    assert response.status_code == 200
+    assert response.json()["choices"][0]["message"]["content"] == "Refunds take 5 days."
+
+    condition = [
+        {"role": "system", "content": "please respond with ‘True’; otherwise, respond with ‘False.’"},
+        {"role": "user", "content": "- Targets:\nI want to transfer money\n- Previous Conversation: \n \n"
+                                    "Does sentence \"I want to transfer money\" have the same meaning "
+                                    "as any sentences in the targets?"}
+    ]
+    response = client.post("/v1/chat/completions", json={"messages": condition})
+    assert response.json()["choices"][0]["message"]["content"] == "True"
+
+
+def test_embeddings_are_deterministic():
+    """
+    Tests that the same text always maps to the same normalised vector.
+    """
+    client = TestClient(create_app({"embeddings": {"dimensions": 32}}))
+    response = client.post("/v1/embeddings", json={"input": ["hello world", "hello world"]})
+    data = response.json()["data"]
+    assert data[0]["embedding"] == data[1]["embedding"] == fake_embedding("hello world", 32)
+    assert abs(sum(v * v for v in data[0]["embedding"]) - 1.0) < 1e-6
+
+
+def test_rate_limit_injection():
+    """
+    Tests that injected 429s carry a Retry-After header.
+    """
+    client = TestClient(create_app({"chat": {"rate_limit_rate": 1.0, "retry_after": 2}}))
+    response = client.post("/v1/chat/completions", json={"messages": []})
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "2"
+
+
+def test_forced_tool_choice_returns_arguments():
+    """
+    Tests that a forced function call (structured output tool mode) carries the reply as JSON arguments.
+    """
+    client = TestClient(create_app({"chat": {"rules": [{"match": ".*", "response": '{"status": "complete"}'}]}}))
+    response = client.post("/v1/chat/completions",
+                           json={"messages": [{"role": "user", "content": "bye"}],
+                                 "tool_choice": {"type": "function", "function": {"name": "reply"}}})
+    call = response.json()["choices"][0]["message"]["tool_calls"][0]["function"]
+    assert call["name"] == "reply"
+    assert call["arguments"] == '{"status": "complete"}'
+
+
+def test_fused_condition_decisions():
+    """
+    Tests that a flow extraction prompt with a CONDITIONS section gets a decision per condition.
+    """
+    client = TestClient(create_app({}))
+    messages = [
+        {"role": "system", "content": "Please reply in JSON format."},
+        {"role": "user", "content": "User: Is there any discount?\n\n## CONDITIONS\n"
+                                    "Also decide for each condition below whether the latest user message "
+                                    "\"Is there any discount?\" has the same meaning as any of its target sentences\n"
+                                    "- c1: [\"Is there any discount?\"]\n"
+                                    "- c2: [\"I'd like to buy something\"]\n"}
+    ]
+    response = client.post("/v1/chat/completions", json={"messages": messages})
+    assert response.json()["choices"][0]["message"]["content"] == '{"conditions": {"c1": true, "c2": false}}'
+
+
+def test_branch_classification():
+    """
+    Tests that a multi-branch condition prompt is answered with the number of the first matching option.
+    """
+    client = TestClient(create_app({}))
+    messages = [
+        {"role": "system", "content": "I will give you numbered options, each with some target sentences."},
+        {"role": "user", "content": "- Options:\n1. \"Is there any discount?\"\n2. \"I'd like to buy something\"\n"
+                                    "- Previous Conversation: \n \n"
+                                    "Which option does sentence \"I'd like to buy something\" match?"}
+    ]
+    response = client.post("/v1/chat/completions", json={"messages": messages})
+    assert response.json()["choices"][0]["message"]["content"] == "2"
+
+
+def test_fused_agent_selection_answers_faq():
+    """
+    Tests that a fused routing prompt selecting [FAQ] gets the answer from the knowledge base items.
+    """
+    client = TestClient(create_app({}))
+    system = "Your task is to select an agent to handle user requests.\n### AGENTS:\n- transfer: Send money\n\n" \
+             "## KNOWLEDGE BASE:\n1. Q: How do I block my card?\nA: Use the app settings.\n\n### OUTPUT:\n" \
+             "Only output JSON: {\"agent\": \"<what you would output>\", \"answer\": \"<answer>\"}."
+    messages = [{"role": "system", "content": system},
+                {"role": "user", "content": "### CONVERSATION:\nUser: How do I block my card?\n"}]
+    response = client.post("/v1/chat/completions", json={"messages": messages})
+    assert json.loads(response.json()["choices"][0]["message"]["content"]) == \
+        {"agent": "[FAQ]", "answer": "Use the app settings."}
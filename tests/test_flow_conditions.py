@@ -0,0 +1,126 @@
+import asyncio
+
+from mica.agents.flow_agent import FlowAgent
+from mica.event import BotUtter, UserInput
+from mica.llm.constants import CALL_CONDITION, CALL_EXTRACTION
+from mica.tracker import Tracker
+
+STEPS = [{"if": 'the user claims "I want a refund"', "then": [{"bot": "Refund started"}]},
+         {"else if": 'the user claims "Cancel my order"', "then": [{"bot": "Order cancelled"}]},
+         {"else": [{"bot": "Sorry"}]}]
+
+
+class StubModel:
+    """Answers each call class with a fixed reply, or with the next one of a list."""
+    model = "stub"
+
+    def __init__(self, replies):
+        self.replies = replies
+        self.calls = []
+
+    async def generate_message(self, prompts, tracker=None, call_class=None, **kwargs):
+        self.calls.append((call_class, prompts))
+        reply = self.replies[call_class]
+        return [BotUtter(reply.pop(0) if isinstance(reply, list) else reply)]
+
+    def call_classes(self):
+        return [call_class for call_class, _ in self.calls]
+
+
+def create_agent(model, config=None):
+    return FlowAgent.create(name="orders", steps=STEPS, llm_model=model, config=config)
+
+
+def run_until_reply(agent, tracker):
+    async def drive():
+        for _ in range(10):
+            _, events = await agent.run(tracker, agents={})
+            texts = [event.text for event in events if isinstance(event, BotUtter)]
+            if texts:
+                return texts
+    return asyncio.run(drive())
+
+
+def test_fused_condition_decisions_skip_condition_calls():
+    """
+    Tests that the extraction call decides the pending `the user claims` branches,
+    and that the if/else if steps use these decisions instead of calling the LLM.
+    """
+    model = StubModel({CALL_EXTRACTION: '{"conditions": {"c1": false, "c2": "true"}}'})
+    agent = create_agent(model, {"llm": {"fuse_conditions": True}})
+    tracker = Tracker.create("user", args={"__mapping__": {}})
+    tracker.update(UserInput("please cancel it"))
+
+    assert run_until_reply(agent, tracker) == ["Order cancelled"]
+    assert model.call_classes() == [CALL_EXTRACTION]
+    assert "c2" in str(model.calls[0][1])
+
+
+def test_fused_decisions_are_ignored_for_a_newer_message():
+    """
+    Tests that decisions stored for one user message are not reused once a newer message arrives.
+    """
+    model = StubModel({CALL_EXTRACTION: '{"conditions": {"c1": true, "c2": false}}', CALL_CONDITION: "2"})
+    agent = create_agent(model, {"llm": {"fuse_conditions": True}})
+    if_step, else_if_step = agent.subflows[agent.main_flow_name].steps[:2]
+    tracker = Tracker.create("user", args={"__mapping__": {}})
+    first = UserInput("I want my money back")
+    tracker.update(first)
+    asyncio.run(agent.get_message_args(tracker, {}))
+    info = tracker.get_or_create_flow_agent(agent.name)
+    assert info.get_condition_decision(id(if_step), first) is True
+    assert info.get_condition_decision(id(else_if_step), first) is False
+
+    tracker.update(UserInput("actually, cancel the order"))
+    state, _ = asyncio.run(if_step.run(tracker, info))
+    assert state == "Skip"
+    assert model.call_classes() == [CALL_EXTRACTION, CALL_CONDITION]
+
+
+def test_claim_branches_classified_in_one_call():
+    """
+    Tests that the `the user claims` branches of a chain are classified in one multi-choice call,
+    and that "0" falls through to the else branch.
+    """
+    for reply, expected in (("2", "Order cancelled"), ("0", "Sorry")):
+        model = StubModel({CALL_EXTRACTION: "{}", CALL_CONDITION: reply})
+        agent = create_agent(model)
+        if_step, else_if_step = agent.subflows[agent.main_flow_name].steps[:2]
+        assert if_step.claim_branches == [if_step, else_if_step]
+        tracker = Tracker.create("user", args={"__mapping__": {}})
+        tracker.update(UserInput("please cancel it"))
+
+        assert run_until_reply(agent, tracker) == [expected]
+        assert model.call_classes() == [CALL_EXTRACTION, CALL_CONDITION]
+        assert "1. \"I want a refund\"\n2. \"Cancel my order\"" in model.calls[1][1][1]["content"]
+
+
+def test_unusable_classification_checks_branches_one_by_one():
+    """
+    Tests that a non-numeric or out-of-range classification reply falls back to one condition call per branch.
+    """
+    for reply in ("maybe", "7"):
+        model = StubModel({CALL_EXTRACTION: "{}", CALL_CONDITION: [reply, "False", "True"]})
+        agent = create_agent(model)
+        tracker = Tracker.create("user", args={"__mapping__": {}})
+        tracker.update(UserInput("please cancel it"))
+
+        assert run_until_reply(agent, tracker) == ["Order cancelled"]
+        assert model.call_classes() == [CALL_EXTRACTION] + [CALL_CONDITION] * 3
+
+
+def test_condition_without_reply_is_false():
+    """
+    Tests that a condition call that returns no events, e.g. after a limiter or budget error, counts as False.
+    """
+    model = StubModel({CALL_EXTRACTION: "{}"})
+
+    async def no_reply(prompts, tracker=None, call_class=None, **kwargs):
+        model.calls.append((call_class, prompts))
+        return [] if call_class == CALL_CONDITION else [BotUtter("{}")]
+
+    model.generate_message = no_reply
+    agent = create_agent(model)
+    tracker = Tracker.create("user", args={"__mapping__": {}})
+    tracker.update(UserInput("please cancel it"))
+    assert run_until_reply(agent, tracker) == ["Sorry"]
@@ -0,0 +1,35 @@
+from mica.agents.flow_agent import FlowAgent
+from mica.llm.custom_model import CustomLLMModel
+from mica.tracker import FlowInfo
+
+STEPS = [
+    {"label": "start"},
+    {"bot": "Hello"},
+    {"if": "choice == 1", "then": [{"bot": "One"}, {"next": "start"}]},
+    {"else if": "choice == 2", "then": [{"bot": "Two"}]},
+    {"else": [{"bot": "Other"}]},
+    {"bot": "Bye"},
+]
+
+
+def test_flow_program_jump_targets():
+    """
+    Tests that a compiled flow resolves steps by position and continues after a branch body past its else branches.
+    """
+    agent = FlowAgent.create(name="flow", steps=STEPS, llm_model=CustomLLMModel(server="http://127.0.0.1:1"))
+    program = agent.program
+    assert len(program) == 10
+
+    main = agent.subflows[agent.main_flow_name].steps
+    if_step, else_if_step, bye = main[2], main[3], main[5]
+    instruction = program.at([agent.main_flow_name, id(if_step)])
+    assert instruction.step is if_step
+    assert program.instructions[instruction.then].step is if_step.then[0]
+    assert program.instructions[instruction.next].step is else_if_step
+    assert program.instructions[instruction.next_after_branch].step is bye
+
+    # the body of the if branch finished: the next step is after the whole chain
+    info = FlowInfo()
+    info.push([agent.main_flow_name, id(if_step)])
+    agent.find_next_step(info, previous_step_state="Finished")
+    assert info.peek() == [agent.main_flow_name, id(bye)]
@@ -0,0 +1,98 @@
+import asyncio
+
+from mica.agents.agent import Agent
+from mica.agents.ensemble_agent import EnsembleAgent
+from mica.agents.kb_agent import KBAgent
+from mica.event import BotUtter, FollowUpAgent, UserInput
+from mica.llm.constants import CALL_KB_ANSWER, CALL_ROUTING
+from mica.tracker import Tracker
+
+
+class StubModel:
+    model = "stub"
+
+    def __init__(self, replies):
+        self.replies = replies
+        self.calls = []
+
+    async def generate_message(self, prompts, tracker=None, call_class=None, **kwargs):
+        self.calls.append((call_class, prompts, kwargs))
+        return [BotUtter(self.replies[call_class])]
+
+
+class StubKBAgent(KBAgent):
+    """A KB agent with fixed matches instead of a vector store."""
+
+    def __init__(self, llm_model):
+        self.llm_model = llm_model
+        self.retrieved = 0
+        Agent.__init__(self, "faq", "Answers questions about the shop.")
+
+    async def retrieve(self, tracker):
+        self.retrieved += 1
+        return {"matches": [{"content": "The shop opens at 9 am."}],
+                "query": tracker.latest_message.text,
+                "total_matches": 1}
+
+
+def run_ensemble(routing_reply, fuse=True):
+    model = StubModel({CALL_ROUTING: routing_reply, CALL_KB_ANSWER: "It opens at 9."})
+    ensemble = EnsembleAgent.create(name="main", contains=["orders"], llm_model=model,
+                                    config={"llm": {"fuse_kb_answer": fuse}})
+    kb_agent = StubKBAgent(model)
+    agents = {"orders": Agent("orders", "Places orders."), "faq": kb_agent}
+    tracker = Tracker.create("user", args={"__mapping__": {}})
+    tracker.update(UserInput("/init"))
+    tracker.update(UserInput("When do you open?"))
+    _, events = asyncio.run(ensemble.run(tracker=tracker, agents=agents))
+    return events, [call_class for call_class, _, _ in model.calls], model, kb_agent
+
+
+def test_fused_routing_answers_from_the_knowledge_base():
+    """
+    Tests that the fused agent selection call writes the FAQ answer, so the separate KB call is skipped,
+    and that it still selects agents.
+    """
+    events, calls, model, kb_agent = run_ensemble('{"agent": "[FAQ]", "answer": "We open at 9 am."}')
+    assert [event.text for event in events] == ["We open at 9 am."]
+    assert calls == [CALL_ROUTING]
+    assert kb_agent.retrieved == 1
+    assert "The shop opens at 9 am." in model.calls[0][1][0]["content"]
+    assert "response_schema" in model.calls[0][2]
+
+    events, calls, _, _ = run_ensemble('{"agent": "orders", "answer": "No answer"}')
+    assert isinstance(events[0], FollowUpAgent) and events[0].next_agent == "orders"
+    assert calls == [CALL_ROUTING]
+
+
+def test_malformed_fused_reply_falls_back_to_kb_call():
+    """
+    Tests that a fused reply that is not JSON is read as a plain agent selection,
+    and a [FAQ] selection then gets its answer from the separate KB call.
+    """
+    events, calls, _, _ = run_ensemble('[FAQ] {"agent": ')
+    assert [event.text for event in events] == ["It opens at 9."]
+    assert calls == [CALL_ROUTING, CALL_KB_ANSWER]
+
+    events, calls, _, _ = run_ensemble("orders")
+    assert events[0].next_agent == "orders"
+    assert calls == [CALL_ROUTING]
+
+
+def test_unfused_routing_uses_the_kb_answer():
+    """
+    Tests that without fusion the KB agent answers first and the selection call only suggests that answer.
+    """
+    events, calls, model, _ = run_ensemble("[FAQ]", fuse=False)
+    assert [event.text for event in events] == ["It opens at 9."]
+    assert calls == [CALL_KB_ANSWER, CALL_ROUTING]
+    assert "SUGGEST ANSWER: It opens at 9." in model.calls[1][1][0]["content"]
+
+
+def test_routing_reply_is_read_from_its_first_line():
+    """
+    Tests that a routing reply starting with a newline, or explaining itself on later lines, still selects the agent.
+    """
+    events, _, model, _ = run_ensemble("\n orders\nNone of the others fit.", fuse=False)
+    assert isinstance(events[0], FollowUpAgent) and events[0].next_agent == "orders"
+    assert "stop" not in model.calls[-1][2]
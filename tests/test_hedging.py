@@ -0,0 +1,114 @@
+import asyncio
+import time
+
+from mica.event import BotUtter
+from mica.llm.hedging import HedgedModel, MIN_SAMPLES
+
+
+class StubModel:
+    """Answers with its name after `delay` seconds, with no events or by raising `error`."""
+
+    def __init__(self, name, delay=0.0, empty=False, error=None):
+        self.model = name
+        self.delay = delay
+        self.empty = empty
+        self.error = error
+        self.calls = 0
+        self.cancelled = 0
+
+    async def generate_message(self, prompts, tracker=None, **kwargs):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.error is not None:
+            raise self.error
+        return [] if self.empty else [BotUtter(self.model)]
+
+
+def answer_of(model):
+    return asyncio.run(model.generate_message([]))[0].text
+
+
+def test_delay_switches_to_percentile_after_enough_samples():
+    """
+    Tests that the initial delay is used until MIN_SAMPLES primary latencies are known,
+    and the percentile of these latencies, bounded by min_delay, afterwards.
+    """
+    model = HedgedModel(StubModel("primary"), StubModel("secondary"),
+                        percentile=0.5, initial_delay=2.0, min_delay=0.05)
+    for _ in range(MIN_SAMPLES - 1):
+        assert answer_of(model) == "primary"
+    assert model.hedge_delay() == 2.0
+    answer_of(model)
+    assert model.hedge_delay() == 0.05
+
+    model.latencies.clear()
+    model.latencies.extend(0.1 * idx for idx in range(MIN_SAMPLES, 0, -1))
+    assert model.hedge_delay() == sorted(model.latencies)[MIN_SAMPLES // 2]
+
+
+def test_failed_or_empty_primary_is_hedged_at_once():
+    """
+    Tests that a primary that raises or returns no events is hedged without waiting for the delay.
+    """
+    for primary in (StubModel("primary", error=ConnectionError("down")), StubModel("primary", empty=True)):
+        model = HedgedModel(primary, StubModel("secondary"), initial_delay=5.0, max_hedge_rate=1.0)
+        start = time.perf_counter()
+        assert answer_of(model) == "secondary"
+        assert time.perf_counter() - start < 1.0
+        assert model.stats == {"calls": 1, "hedged": 1, "secondary_wins": 1}
+
+
+def test_losing_request_is_cancelled():
+    """
+    Tests that a slow primary is hedged after the delay and cancelled once the secondary answers,
+    and that a secondary is cancelled when the primary answers first.
+    """
+    primary, secondary = StubModel("primary", delay=10), StubModel("secondary")
+    model = HedgedModel(primary, secondary, initial_delay=0.01, max_hedge_rate=1.0)
+    assert answer_of(model) == "secondary"
+    assert primary.cancelled == 1 and model.stats["secondary_wins"] == 1
+
+    primary, secondary = StubModel("primary", delay=0.05), StubModel("secondary", delay=10)
+    model = HedgedModel(primary, secondary, initial_delay=0.01, max_hedge_rate=1.0)
+    assert answer_of(model) == "primary"
+    assert secondary.calls == 1 and secondary.cancelled == 1
+
+
+def test_caller_cancellation_cancels_both_requests():
+    """
+    Tests that cancelling the caller while both requests run cancels both of them.
+    """
+    primary, secondary = StubModel("primary", delay=10), StubModel("secondary", delay=10)
+    model = HedgedModel(primary, secondary, initial_delay=0.01, max_hedge_rate=1.0)
+
+    async def scenario():
+        call = asyncio.ensure_future(model.generate_message([]))
+        await asyncio.sleep(0.05)
+        assert secondary.calls == 1
+        call.cancel()
+        await asyncio.gather(call, return_exceptions=True)
+        # let the cancelled tasks run their except blocks
+        await asyncio.sleep(0)
+
+    asyncio.run(scenario())
+    assert primary.cancelled == 1 and secondary.cancelled == 1
+
+
+def test_hedge_rate_is_capped_from_the_first_call():
+    """
+    Tests that max_hedge_rate bounds the hedged share of the window while it fills up and once it is full,
+    counting the call that is about to be hedged.
+    """
+    model = HedgedModel(StubModel("primary", delay=0.02), StubModel("secondary"),
+                        initial_delay=0.001, min_delay=0.001, max_hedge_rate=0.25, window=8)
+    hedged = []
+    for _ in range(24):
+        before = model.stats["hedged"]
+        answer_of(model)
+        hedged.append(model.stats["hedged"] > before)
+    assert hedged == [False, False, False, True] * 6
+    assert all(sum(hedged[idx:idx + 8]) <= 2 for idx in range(len(hedged) - 7))
@@ -0,0 +1,49 @@
+from mica.event import UserInput, BotUtter
+from mica.llm.history import window_history
+from mica.llm.tokens import count_tokens
+
+
+def test_window_keeps_recent_lines():
+    """
+    Tests that an unlimited window renders every line and a budget keeps only the most recent ones.
+    """
+    events = [UserInput(text="/init")]
+    for i in range(50):
+        events.append(UserInput(text=f"question number {i}"))
+        events.append(BotUtter(text=f"answer number {i}"))
+
+    full = window_history(events)
+    assert full.count("\n") == 100
+    assert "/init" not in full
+
+    windowed = window_history(events, max_tokens=40)
+    assert windowed.startswith("(")
+    assert windowed.endswith("Bot: answer number 49\n")
+    assert "question number 0\n" not in windowed
+    kept = windowed.splitlines(keepends=True)[1:]
+    assert sum(count_tokens(line) for line in kept) <= 40
+
+
+def test_window_uses_summary():
+    """
+    Tests that summarized events are replaced by the summary once the history exceeds the budget.
+    """
+    events = []
+    for i in range(50):
+        events.append(UserInput(text=f"question number {i}"))
+        events.append(BotUtter(text=f"answer number {i}"))
+
+    windowed = window_history(events, max_tokens=60, summary="The user asked many questions.", summarized_events=90)
+    assert windowed.startswith("(Summary of the earlier conversation: The user asked many questions.)\n")
+    assert "question number 44\n" not in windowed
+    assert windowed.endswith("Bot: answer number 49\n")
+    assert window_history(events[:4], max_tokens=60, summary="unused", summarized_events=2).startswith("User:")
+
+
+def test_window_excludes_agent_turns():
+    """
+    Tests that events an agent already holds as chat messages are left out of the shared history.
+    """
+    events = [UserInput(text="hello"), BotUtter(text="hi, how can I help?"),
+              UserInput(text="transfer money"), BotUtter(text="to whom?", metadata="transfer")]
+    assert window_history(events, exclude={id(events[2]), id(events[3])}) == "User: hello\nBot: hi, how can I help?\n"
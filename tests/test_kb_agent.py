@@ -0,0 +1,73 @@
+import asyncio
+
+import httpx
+import pytest
+
+from mica.agents.kb_agent import KBAgent
+from mica.event import UserInput
+from mica.llm.custom_embedding import CustomEmbedding
+from mica.llm.fake_server import start_in_thread
+from mica.tracker import Tracker
+
+FAQ = [{"q": "What is the refund policy?", "a": "Refunds are possible within 30 days."},
+       {"q": "How long does shipping take?", "a": "Shipping takes 3 to 5 days."}]
+
+
+@pytest.fixture(scope="module")
+def server_url():
+    server, url = start_in_thread()
+    yield url
+    server.should_exit = True
+
+
+def create_agent(url, **kwargs):
+    return KBAgent(name="faq", llm_model=object(), knowledge_base={"faq": FAQ, "file": None, "web": None},
+                   embeddings=CustomEmbedding(server=url), **kwargs)
+
+
+def tracker_with(text):
+    tracker = Tracker.create("user", args={"__mapping__": {}})
+    tracker.update(UserInput(text))
+    return tracker
+
+
+def embedding_requests(url):
+    return httpx.get(f"{url}/stats").json()["embedding_requests"]
+
+
+def test_retrieve_embeds_the_query_asynchronously_on_each_loop(server_url):
+    """
+    Tests that retrieve embeds the query through the async client of the running loop and searches by vector,
+    also from a second event loop after the first one is closed.
+    """
+    agent = create_agent(server_url, top_k=1)
+    clients = []
+
+    async def retrieve(text):
+        result = await agent.retrieve(tracker_with(text))
+        # one pooled client per loop, reused by every request on it
+        assert agent.embeddings.async_client() is agent.embeddings.async_client()
+        clients.append(agent.embeddings.async_client())
+        return result
+
+    for text, question in (("what is your refund policy", "What is the refund policy?"),
+                           ("how long does shipping take", "How long does shipping take?")):
+        before = embedding_requests(server_url)
+        result = asyncio.run(retrieve(text))
+        assert embedding_requests(server_url) - before == 1
+        assert result["query"] == text and result["total_matches"] == 1
+        assert result["matches"][0]["content"].startswith(f"Question: {question}")
+    assert clients[0] is not clients[1]
+
+
+def test_retrieve_without_matches_or_embedding_is_none(server_url):
+    """
+    Tests that retrieve returns None when no document passes the similarity threshold,
+    or when the query cannot be embedded.
+    """
+    agent = create_agent(server_url, similarity_threshold=10.0)
+    assert asyncio.run(agent.retrieve(tracker_with("what is your refund policy"))) is None
+
+    agent = create_agent(server_url)
+    agent.embeddings = CustomEmbedding(server="http://127.0.0.1:1")
+    assert asyncio.run(agent.retrieve(tracker_with("what is your refund policy"))) is None
@@ -0,0 +1,87 @@
+import asyncio
+import contextlib
+import io
+
+from mica import parser
+from mica.agents.functions import Function
+from mica.bot import Bot
+from mica.event import BotUtter
+from mica.llm.constants import CALL_GENERATION, CALL_ROUTING
+
+TOOL_CODE = '''
+def check_stock(item):
+    """Check whether an item is in stock."""
+    return True
+'''
+
+GENERATION_REPLIES = ['{"data": {"item": "apple"}, "bot": "Which one?", "status": "running"}',
+                      '{"bot": "Apples are in stock.", "status": "running"}']
+
+
+class StubModel:
+    """Routes every message to the shop agent and answers with the next generation reply."""
+    model = "stub"
+
+    def __init__(self):
+        self.calls = []
+
+    async def generate_message(self, prompts, tracker=None, call_class=None, **kwargs):
+        self.calls.append((call_class, prompts, kwargs))
+        if call_class == CALL_ROUTING:
+            return [BotUtter("shop")]
+        return [BotUtter(GENERATION_REPLIES[len(self.calls_of(CALL_GENERATION)) - 1])]
+
+    def calls_of(self, call_class):
+        return [(prompts, kwargs) for cls, prompts, kwargs in self.calls if cls == call_class]
+
+
+def test_static_prompt_prefix_comes_first_and_stays_identical(monkeypatch):
+    """
+    Tests that the system prompts of the LLM and ensemble agents start with their compiled static prefix,
+    byte-identical across turns with different state, that state and history only follow it,
+    and that the tool schemas are built once when the bot is loaded.
+    """
+    schema_builds = []
+    function_prompt = Function.function_prompt
+    monkeypatch.setattr(Function, "function_prompt", lambda self: schema_builds.append(self) or function_prompt(self))
+
+    data = parser.parse_agents({
+        "shop": {"type": "llm agent", "prompt": "Help the user to buy fruit.", "args": ["item"],
+                 "uses": ["check_stock"]},
+        "orders": {"type": "llm agent", "prompt": "Tell the user where their order is."},
+        "triage": {"type": "ensemble agent", "contains": ["shop", "orders"]},
+        "main": {"type": "flow agent", "steps": [{"call": "triage"}]},
+    })
+    bot = Bot.from_json(name="layout", data=data, tool_code=TOOL_CODE,
+                        config={"llm": {"chat": {"provider": "custom", "server": "http://127.0.0.1:1"}}})
+    model = StubModel()
+    # every agent shares the bot's model router
+    monkeypatch.setattr(bot.agents["shop"].llm_model, "generate_message", model.generate_message)
+    assert len(schema_builds) == 1
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert asyncio.run(bot.handle_message("user", "I want fruit")) == ["Which one?"]
+        assert asyncio.run(bot.handle_message("user", "do you have apples?")) == ["Apples are in stock."]
+
+    shop = bot.agents["shop"]
+    (prefix,) = shop._system_prefixes.values()
+    (first, first_kwargs), (second, second_kwargs) = model.calls_of(CALL_GENERATION)
+    systems = [first[0]["content"], second[0]["content"]]
+    for system in systems:
+        assert system.startswith(prefix)
+        assert system.index("## INFORMATION") == len(prefix)
+        assert system.index("## CONVERSATION HISTORY") > len(prefix)
+    assert "I want fruit" not in prefix and "item:" not in prefix
+    assert "item: apple" not in systems[0] and "item: apple" in systems[1][len(prefix):]
+    assert "do you have apples?" in str(second[1:])
+
+    assert len(schema_builds) == 1
+    assert first_kwargs["functions"] is second_kwargs["functions"]
+    assert [function["name"] for function in first_kwargs["functions"]] == ["check_stock"]
+
+    routing_prefix = bot.agents["triage"]._system_prefix + "### AGENTS:\n"
+    routing = [prompts for prompts, _ in model.calls_of(CALL_ROUTING)]
+    assert routing
+    for prompts in routing:
+        assert prompts[0]["content"].startswith(routing_prefix)
+        assert "### CONVERSATION" not in prompts[0]["content"]
@@ -0,0 +1,141 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from mica.llm.concurrency import ConcurrencyLimiter
+from mica.llm.openai_compat import post_chat_completion
+from mica.llm.rate_limiter import RateLimiter, RateLimitTimeout
+
+
+class StubClient:
+    def __init__(self, response: httpx.Response):
+        self.response = response
+        self.calls = 0
+
+    async def post(self, url, headers=None, json=None):
+        self.calls += 1
+        return self.response
+
+
+class StubModel:
+    url = "http://stub"
+    headers = {}
+
+    def __init__(self, response, rate_limiter=None, concurrency_limiter=None):
+        self.client = StubClient(response)
+        self.rate_limiter = rate_limiter
+        self.concurrency_limiter = concurrency_limiter
+
+
+def test_requests_and_tokens_refill():
+    """
+    Tests that an empty request or token bucket makes the caller wait for the refill.
+    """
+    async def scenario():
+        # 10 requests a second
+        limiter = RateLimiter(rpm=600)
+        limiter.requests.level = 0
+        start = time.monotonic()
+        await limiter.acquire(1)
+        assert 0.08 < time.monotonic() - start < 0.3
+
+        # 100 tokens a second
+        limiter = RateLimiter(tpm=6000)
+        limiter.tokens.level = 0
+        start = time.monotonic()
+        await limiter.acquire(20)
+        assert 0.18 < time.monotonic() - start < 0.4
+
+    asyncio.run(scenario())
+
+
+def test_waiters_are_served_in_arrival_order():
+    """
+    Tests that waiters get their capacity in FIFO order, a large head request also holding back smaller later ones.
+    """
+    async def scenario():
+        limiter = RateLimiter(tpm=6000)
+        limiter.tokens.level = 0
+        served = []
+
+        async def call(name, tokens):
+            await limiter.acquire(tokens)
+            served.append(name)
+
+        tasks = [asyncio.ensure_future(call("large", 20)), asyncio.ensure_future(call("small", 1))]
+        await asyncio.sleep(0)
+        assert len(limiter._waiters) == 2
+        await asyncio.gather(*tasks)
+        assert served == ["large", "small"]
+
+    asyncio.run(scenario())
+
+
+def test_deadline_timeout_withdraws_waiter():
+    """
+    Tests that a wait beyond the deadline raises at once, and that a queued waiter leaves the queue when its deadline passes.
+    """
+    async def scenario():
+        limiter = RateLimiter(rpm=60)
+        limiter.requests.level = 0
+        start = time.monotonic()
+        with pytest.raises(RateLimitTimeout):
+            await limiter.acquire(1, deadline=time.monotonic() + 0.05)
+        assert time.monotonic() - start < 0.02
+
+        head = asyncio.ensure_future(limiter.acquire(1))
+        await asyncio.sleep(0)
+        with pytest.raises(RateLimitTimeout):
+            await limiter.acquire(1, deadline=time.monotonic() + 0.05)
+        assert len(limiter._waiters) == 1
+        head.cancel()
+        await asyncio.gather(head, return_exceptions=True)
+        assert len(limiter._waiters) == 0
+
+    asyncio.run(scenario())
+
+
+def test_429_pauses_and_usage_is_reconciled():
+    """
+    Tests that a 429 answer pauses the limiter for Retry-After and gives the reserved tokens back,
+    and that a successful answer replaces the estimate with the reported usage.
+    """
+    async def scenario():
+        payload = {"messages": [{"role": "user", "content": "hi"}], "max_tokens": 100}
+        limiter = RateLimiter(rpm=6000, tpm=60000)
+        model = StubModel(httpx.Response(429, headers={"Retry-After": "0.2"}), rate_limiter=limiter)
+        await post_chat_completion(model, payload)
+        assert limiter.tokens.level == pytest.approx(60000, abs=1)
+        start = time.monotonic()
+        await limiter.acquire(1)
+        assert time.monotonic() - start > 0.15
+
+        model = StubModel(httpx.Response(200, json={"usage": {"total_tokens": 30}}), rate_limiter=limiter)
+        level = limiter.tokens.level
+        await post_chat_completion(model, payload)
+        assert limiter.tokens.level == pytest.approx(level - 30, abs=1)
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_while_waiting_for_slot_returns_tokens():
+    """
+    Tests that a call cancelled while it waits for a request slot gives its reserved tokens back and is never sent.
+    """
+    async def scenario():
+        limiter = RateLimiter(tpm=60000)
+        concurrency = ConcurrencyLimiter(initial=1, max_limit=1)
+        held = await concurrency.acquire()
+        model = StubModel(httpx.Response(200, json={}), rate_limiter=limiter, concurrency_limiter=concurrency)
+        call = asyncio.ensure_future(post_chat_completion(model, {"messages": [], "max_tokens": 500}))
+        await asyncio.sleep(0.01)
+        assert limiter.tokens.level < 60000 - 400
+        call.cancel()
+        await asyncio.gather(call, return_exceptions=True)
+        assert limiter.tokens.level == pytest.approx(60000, abs=1)
+        assert model.client.calls == 0
+        held.release()
+
+    asyncio.run(scenario())
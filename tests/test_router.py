@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+
+from mica.event import BotUtter
+from mica.llm.constants import CALL_CONDITION, CALL_GENERATION, CALL_ROUTING, DEFAULT_HISTORY_BUDGETS
+from mica.llm.history import history_budget
+from mica.llm.metrics import MetricsRegistry
+from mica.llm.model_factory import ModelFactory
+from mica.llm.router import ModelRouter
+
+
+class NamedModel:
+    def __init__(self, model, fail=False):
+        self.model = model
+        self.fail = fail
+
+    async def generate_message(self, prompts, tracker=None, **kwargs):
+        if self.fail:
+            raise ConnectionError("provider down")
+        return [BotUtter(self.model)]
+
+
+def test_calls_are_routed_by_call_class():
+    """
+    Tests that routed call classes use their profile, other calls the default model,
+    and that a route to an unknown profile falls back to the default.
+    """
+    router = ModelRouter(NamedModel("flagship"), {"fast": NamedModel("mini")},
+                         {CALL_CONDITION: "fast", CALL_ROUTING: "missing"}, metrics=MetricsRegistry())
+
+    async def model_of(call_class):
+        return (await router.generate_message([], call_class=call_class))[0].text
+
+    assert asyncio.run(model_of(CALL_CONDITION)) == "mini"
+    assert asyncio.run(model_of(CALL_ROUTING)) == "flagship"
+    assert asyncio.run(model_of(CALL_GENERATION)) == "flagship"
+    assert asyncio.run(model_of(None)) == "flagship"
+
+
+def test_failed_calls_are_observed():
+    """
+    Tests that a call that raises is still recorded, as an error, under its call class and model.
+    """
+    metrics = MetricsRegistry()
+    router = ModelRouter(NamedModel("flagship", fail=True), metrics=metrics)
+    with pytest.raises(ConnectionError):
+        asyncio.run(router.generate_message([], call_class=CALL_GENERATION))
+    asyncio.run(ModelRouter(NamedModel("flagship"), metrics=metrics).generate_message([]))
+
+    snapshot = metrics.snapshot()
+    assert snapshot[CALL_GENERATION]["flagship"]["count"] == 1
+    assert snapshot[CALL_GENERATION]["flagship"]["errors"] == 1
+    assert snapshot["unclassified"]["flagship"]["errors"] == 0
+
+
+def test_flat_chat_config_needs_provider_or_model(monkeypatch):
+    """
+    Tests that an llm section without `chat` is only read as the chat config when it names a provider or model.
+    """
+    chat_configs = []
+    monkeypatch.setattr(ModelFactory, "create_llm",
+                        staticmethod(lambda config=None: chat_configs.append(config) or NamedModel("default")))
+
+    flat = {"provider": "custom", "server": "http://127.0.0.1:1", "model": "mini"}
+    ModelFactory.create_router(flat)
+    ModelFactory.create_router({"embedding": {"provider": "custom", "server": "http://127.0.0.1:1"},
+                                "summarization": {"after_turns": 5}})
+    ModelFactory.create_router({"chat": flat, "embedding": {"provider": "custom"}})
+    assert chat_configs == [flat, None, flat]
+
+
+def test_history_budgets_apply_only_with_a_history_budget_section(monkeypatch):
+    """
+    Tests that without `history_budget` every call class gets the full history,
+    and that a section, even an empty one, fills in the default budgets of the classes it leaves out.
+    """
+    monkeypatch.setattr(ModelFactory, "create_llm", staticmethod(lambda config=None: NamedModel("default")))
+
+    unlimited = ModelFactory.create_router({"provider": "custom", "model": "mini"})
+    assert history_budget(unlimited, CALL_CONDITION) is None
+    assert history_budget(unlimited, CALL_GENERATION) is None
+
+    assert ModelFactory.create_router({"history_budget": None}).history_budgets == DEFAULT_HISTORY_BUDGETS
+    router = ModelFactory.create_router({"history_budget": {CALL_GENERATION: 6000, CALL_ROUTING: None}})
+    assert history_budget(router, CALL_GENERATION) == 6000
+    assert history_budget(router, CALL_ROUTING) is None
+    assert history_budget(router, CALL_CONDITION) == DEFAULT_HISTORY_BUDGETS[CALL_CONDITION]
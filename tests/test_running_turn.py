@@ -0,0 +1,45 @@
+import asyncio
+import contextlib
+import io
+import os
+
+from mica import parser
+from mica.bot import Bot
+from mica.event import UserInput
+from mica.llm.fake_server import start_in_thread
+from mica.utils import read_yaml_file
+
+EXAMPLE_DIR = os.path.join(os.path.dirname(__file__), "..", "examples", "transfer_money")
+
+
+def test_newer_message_supersedes_unfinished_turn():
+    """
+    Tests that a correction sent during a slow turn cancels it, rolls the tracker back and answers both messages.
+    """
+    server, url = start_in_thread({"chat": {"latency": {"distribution": "fixed", "value": 0.3}, "rules": [
+        {"match": "Your task is to select an agent", "target": "system", "response": "transfer_money"}]}})
+    try:
+        data = parser.parse_agents(read_yaml_file(os.path.join(EXAMPLE_DIR, "agents.yml")))
+        bot = Bot.from_json(name="transfer_money", data=data,
+                            tool_code=open(os.path.join(EXAMPLE_DIR, "tools.py")).read(),
+                            config={"llm": {"chat": {"provider": "custom", "server": url}}, "supersede_turns": True})
+
+        async def scenario():
+            await bot.handle_message("user", "/init")
+            first = asyncio.ensure_future(bot.handle_message("user", "I want to transfer money"))
+            await asyncio.sleep(0.1)
+            second = await bot.handle_message("user", "Send 50 dollars to Alice")
+            return await first, second
+
+        # Bot.handle_message prints response times
+        with contextlib.redirect_stdout(io.StringIO()):
+            first, second = asyncio.run(scenario())
+    finally:
+        server.should_exit = True
+
+    assert first == []
+    assert len(second) == 1
+    user_messages = [event.text for event in bot.tracker_store.get_or_create_tracker("user").events
+                     if isinstance(event, UserInput)]
+    assert user_messages == ["/init", "I want to transfer money\nSend 50 dollars to Alice"]
+    assert bot.turn_stats == {"superseded": 1, "wasted_llm_calls": 1}
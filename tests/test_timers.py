@@ -0,0 +1,107 @@
+import asyncio
+import time
+
+from mica import timers
+from mica.event import BotUtter
+from mica.timers import TimerWheel
+from mica.tracker import Tracker
+
+
+class ManualClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_timers_fire_on_their_tick_across_levels():
+    """
+    Tests that timers fire exactly when due, including delays that cascade from the upper wheels, and that cancelled ones never fire.
+    """
+    wheel = TimerWheel(tick=1, clock=ManualClock())
+    fired = []
+    delays = [1, 5, 255, 256, 257, 1000, 65536, 70000, 3 * 2 ** 16 + 5]
+    for delay in delays:
+        wheel.schedule(delay, lambda d=delay: fired.append((d, wheel._current)))
+    wheel.schedule(300, fired.append, "cancelled").cancel()
+    assert len(wheel) == len(delays)
+
+    wheel.advance(3 * 2 ** 16 + 5)
+    assert fired == [(delay, delay) for delay in delays]
+    assert len(wheel) == 0
+
+
+def test_tracker_events_rearm_inactivity_timer():
+    """
+    Tests that every tracker event pushes back its inactivity timer, and that the timer fires once the conversation is idle.
+    """
+    async def scenario():
+        tracker = Tracker.create("user")
+        fired = []
+        tracker.set_inactivity_timer("exit", 0.3, lambda: fired.append(len(tracker.events)))
+        for _ in range(3):
+            await asyncio.sleep(0.15)
+            tracker.update(BotUtter("still here"))
+        assert fired == []
+        await asyncio.sleep(0.5)
+        assert fired == [3]
+
+        tracker.update(BotUtter("again"))
+        tracker.cancel_inactivity_timer("exit")
+        await asyncio.sleep(0.5)
+        assert fired == [3]
+
+    asyncio.run(scenario())
+
+
+def test_driver_sleeps_until_the_next_timer():
+    """
+    Tests that the driver wakes up for due timers only, also for a timer scheduled before the one it sleeps for.
+    """
+    class CountingWheel(TimerWheel):
+        wakeups = 0
+
+        def _next_due(self):
+            self.wakeups += 1
+            return super()._next_due()
+
+    async def scenario():
+        wheel = CountingWheel(tick=0.01)
+        fired = []
+        start = time.monotonic()
+        wheel.schedule(0.5, lambda: fired.append(("late", time.monotonic() - start)))
+        await asyncio.sleep(0.01)
+        wheel.schedule(0.1, lambda: fired.append(("early", time.monotonic() - start)))
+        await asyncio.sleep(0.6)
+        return wheel, fired
+
+    wheel, fired = asyncio.run(scenario())
+    assert [name for name, _ in fired] == ["early", "late"]
+    assert 0.1 <= fired[0][1] < 0.25 and 0.5 <= fired[1][1] < 0.65
+    # 60 ticks passed; one wakeup per timer, plus the rescheduling and a possible early clock read
+    assert wheel.wakeups <= 6
+
+
+def test_callback_tasks_are_kept_and_their_errors_logged(monkeypatch):
+    """
+    Tests that the task of an awaitable callback is referenced until it finishes, and that its exception is logged.
+    """
+    errors = []
+    monkeypatch.setattr(timers.logger, "error", errors.append)
+
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("send failed")
+
+    async def scenario():
+        wheel = TimerWheel(tick=1, clock=ManualClock())
+        wheel.schedule(1, failing)
+        wheel.advance(1)
+        assert len(wheel._tasks) == 1
+        await asyncio.sleep(0.05)
+        return wheel
+
+    wheel = asyncio.run(scenario())
+    assert wheel._tasks == set()
+    assert len(errors) == 1 and "send failed" in errors[0]
@@ -0,0 +1,71 @@
+import asyncio
+import contextlib
+import io
+import time
+
+import pytest
+
+from mica import parser
+from mica.bot import Bot
+from mica.llm.router import ModelRouter
+from mica.tracker import Tracker
+from mica.turn_budget import (TurnBudget, TurnBudgetExceeded, DEFAULT_BUDGET_FALLBACK, DEFAULT_TURN_LIMITS,
+                              TURN_ITERATIONS, TURN_LLM_CALLS)
+
+
+class SlowModel:
+    model = "slow"
+
+    async def generate_message(self, prompts, tracker=None, **kwargs):
+        await asyncio.sleep(1)
+        return []
+
+
+def test_runaway_flow_loop_gets_fallback_reply():
+    """
+    Tests that a `next` loop without a user step is stopped by the iteration budget and answered with the fallback.
+    """
+    data = parser.parse_agents({
+        "looper": {"type": "flow agent", "steps": [{"label": "loop"}, {"bot": "Still here"}, {"next": "loop"}]},
+        "main": {"type": "flow agent", "steps": [{"call": "looper"}]},
+    })
+    bot = Bot.from_json(name="loop", data=data,
+                        config={"llm": {"chat": {"provider": "custom", "server": "http://127.0.0.1:1"}},
+                                "turn_budget": {"max_iterations": 20}})
+    # Bot.handle_message prints response times
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(2):
+            response = asyncio.run(bot.handle_message("user", "/init"))
+            assert response[0] == "Still here"
+            assert response[-1] == DEFAULT_BUDGET_FALLBACK
+
+
+def test_turn_deadline_and_llm_call_limit():
+    """
+    Tests that the turn deadline times out a slow LLM call, and that calls past the limit are refused.
+    """
+    router = ModelRouter(SlowModel())
+    tracker = Tracker.create("user")
+    tracker.turn_budget = TurnBudget(timeout=0.05).start()
+    start = time.perf_counter()
+    with pytest.raises(TurnBudgetExceeded):
+        asyncio.run(router.generate_message([], tracker))
+    assert time.perf_counter() - start < 0.5
+
+    tracker.turn_budget = TurnBudget(max_llm_calls=0).start()
+    with pytest.raises(TurnBudgetExceeded):
+        asyncio.run(router.generate_message([], tracker))
+
+
+def test_limits_apply_only_with_a_turn_budget_section():
+    """
+    Tests that a bot without `turn_budget:` counts its turns without limiting them,
+    and that a section, even an empty one, turns on the default limits.
+    """
+    unlimited = TurnBudget.create({"llm": {}}).start()
+    for _ in range(500):
+        unlimited.spend(TURN_ITERATIONS)
+    assert unlimited.used[TURN_ITERATIONS] == 500
+
+    assert TurnBudget.create({"turn_budget": None}).limits == DEFAULT_TURN_LIMITS
+    assert TurnBudget.create({"turn_budget": {"max_llm_calls": 5}}).limits[TURN_LLM_CALLS] == 5
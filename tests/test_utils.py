@@ -0,0 +1,64 @@
+import time
+
+from mica.tracker import Tracker
+from mica.utils import extract_json_object, safe_json_loads, compile_expression, parse_and_evaluate, \
+    ArgTemplate, replace_args_in_string
+
+
+def test_extract_json_object_from_prose():
+    """
+    Tests that the envelope is found in wrapped replies, ignoring stray braces and braces in strings.
+    """
+    text = 'Sure } here you go:\n```json\n{"bot": "use {curly} braces", "status": "running"}\n```'
+    assert extract_json_object(text) == {"bot": "use {curly} braces", "status": "running"}
+    assert extract_json_object('{not json} {"status": "quit"}') == {"status": "quit"}
+    assert extract_json_object('{"bot": "unterminated"') is None
+    # an opening brace that is never closed does not hide the objects inside it
+    assert extract_json_object('{ note: {"bot": "hi"}') == {"bot": "hi"}
+    assert extract_json_object('{ {not json} {"status": "quit"} { {"a": 1}') == {"status": "quit"}
+    assert safe_json_loads('reply: {"data": {"a": 1}}') == {"data": {"a": 1}}
+    assert safe_json_loads("no json here") == {}
+
+
+def test_extract_json_object_is_linear():
+    """
+    Tests that a long reply full of unmatched opening braces is scanned quickly, and the object after them is found.
+    """
+    text = "{" * 20000 + '{"status": "running"}'
+    start = time.perf_counter()
+    assert extract_json_object(text) == {"status": "running"}
+    assert time.perf_counter() - start < 1.0
+
+
+def test_compiled_expression_matches_parsed_evaluation():
+    """
+    Tests that a compiled condition gives the same results as parsing it, and reads arg values at call time.
+    """
+    tracker = Tracker.create("user", args={"flow": {"amount": 120, "code": "AB12"}, "account": {"balance": 10.5},
+                                           "__mapping__": {}})
+    expressions = [
+        "amount > 100 and (code == 'AB12' or account.balance < 5)",
+        "re.match('^[A-Z]+[0-9]+$', code) and not_an_arg == not_an_arg",
+        "(amount <= 100 or account.balance >= 10.5) and amount != 120",
+    ]
+    for expression in expressions:
+        evaluator = compile_expression(expression, "flow")
+        assert evaluator(tracker) == parse_and_evaluate(expression, tracker, "flow")
+
+    evaluator = compile_expression("amount > 100", "flow")
+    assert evaluator(tracker) is True
+    tracker.set_arg("flow", "amount", 50)
+    assert evaluator(tracker) is False
+
+
+def test_arg_template_renders_references():
+    """
+    Tests that a parsed template fills in local and qualified args, and empties missing or unset ones.
+    """
+    tracker = Tracker.create("user", args={"order": {"books": "Dune", "status": None}, "profile": {"name": "Alex"},
+                                           "__mapping__": {}})
+    text = "Hi ${profile.name}, you ordered ${books} (${status}${missing}). {not an arg} ${"
+    template = ArgTemplate(text, "order")
+    assert template.render(tracker) == "Hi Alex, you ordered Dune (). {not an arg} ${"
+    assert replace_args_in_string(text, "order", tracker) == template.render(tracker)
+    assert ArgTemplate("plain text", "order").render(tracker) == "plain text"